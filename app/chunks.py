@@ -2,11 +2,182 @@ from langchain_community.document_loaders import TextLoader
 from langchain_community.vectorstores import FAISS
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_nomic.embeddings import NomicEmbeddings
+from langchain_core.embeddings import Embeddings
 import os
+import shutil
 import glob
 import time
 from typing import List
 from langchain_community.chat_models import ChatOllama
+from llm_scheduler import llm_scheduler, PRIORITY_INGESTION, keep_alive, ollama_base_url
+from ingest_checkpoint import BuildCheckpoint, checkpoint_batch_size, text_sha256, publish_index, load_index
+from telemetry import log, metrics, log_sample_rate
+from tracing import span
+import json
+import hashlib
+import re
+import numpy as np
+import faiss
+
+# Model used for chunk summaries
+summary_model = "llama3.2:latest"
+
+# Prefix each chunk with an LLM summary before embedding; "0" embeds the raw chunk text
+chunk_summaries = os.environ.get("CHUNK_SUMMARIES", "1") != "0"
+# Index for new builds: "flat" is exact search, "hnsw" and "ivf" trade some recall for speed on large corpora
+faiss_index_type = os.environ.get("FAISS_INDEX_TYPE", "flat")
+faiss_hnsw_m = int(os.environ.get("FAISS_HNSW_M", "32"))
+faiss_hnsw_ef_search = int(os.environ.get("FAISS_HNSW_EF_SEARCH", "64"))
+# 0 picks about 4 * sqrt(chunks) lists
+faiss_ivf_nlist = int(os.environ.get("FAISS_IVF_NLIST", "0"))
+faiss_ivf_nprobe = int(os.environ.get("FAISS_IVF_NPROBE", "8"))
+
+_embedding_model = None
+# "nomic" runs the local Nomic model, "hash" is a deterministic stand-in for benchmarks
+embedding_backend = os.environ.get("EMBEDDING_BACKEND", "nomic")
+hash_embedding_dim = int(os.environ.get("HASH_EMBEDDING_DIM", "768"))
+embedding_model_name = "nomic-embed-text-v1.5" if embedding_backend != "hash" else f"hash-{hash_embedding_dim}"
+
+# Feature-hashed bag of words: no model load, identical vectors on every run, and texts
+# sharing words still land near each other so retrieval stays meaningful
+class HashEmbeddings(Embeddings):
+    def __init__(self, dim: int = hash_embedding_dim):
+        self.dim = dim
+
+    def _embed(self, text: str) -> List[float]:
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for token in re.findall(r"\w+", text.lower()):
+            digest = hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest()
+            bucket = int.from_bytes(digest[:4], "little") % self.dim
+            vector[bucket] += 1.0 if digest[4] & 1 else -1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed(text)
+
+# Opens a span per embedding call so query embedding shows up in request traces
+class TracedEmbeddings(Embeddings):
+    def __init__(self, inner: Embeddings):
+        self.inner = inner
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        with span("embed_documents", texts=len(texts)):
+            return self.inner.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        with span("embed_query", metric="embed_query_seconds"):
+            return self.inner.embed_query(text)
+
+# Shared embedding model, loaded once per process
+def get_embedding_model():
+    global _embedding_model
+    if _embedding_model is None:
+        if embedding_backend == "hash":
+            inner = HashEmbeddings()
+        else:
+            inner = NomicEmbeddings(model=embedding_model_name, inference_mode="local")
+        _embedding_model = TracedEmbeddings(inner)
+    return _embedding_model
+
+# Load markdown files as documents tagged with their file name; unreadable files are skipped
+def load_markdown_documents(md_files: List[str]) -> list:
+    all_documents = []
+    for i, md_file in enumerate(md_files):
+        try:
+            loader = TextLoader(md_file, encoding='utf-8')
+            documents = loader.load()
+
+            for doc in documents:
+                file_name = os.path.basename(md_file)
+
+                doc.metadata.update({
+                    'file_name': file_name,
+                    'source_file': md_file
+                })
+
+            all_documents.extend(documents)
+            log.debug("markdown_loaded", file=os.path.basename(md_file), documents=len(documents),
+                      chars=sum(len(doc.page_content) for doc in documents))
+
+        except Exception as e:
+            log.warning("markdown_load_failed", file=md_file, error=str(e))
+            continue
+    return all_documents
+
+# Split documents into overlapping chunks
+def split_documents(documents: list, chunk_size: int = 1200, chunk_overlap: int = 200) -> list:
+    text_splitter = RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+        add_start_index=True
+    )
+    return text_splitter.split_documents(documents)
+
+# Prefix chunk i with an LLM summary written in the context of its neighbours; without
+# summarize only the metadata is rewritten
+def enrich_chunk(texts: list, i: int, summarize: bool = True):
+    chunk = texts[i]
+    if not summarize:
+        chunk.metadata = {
+            'file_name': chunk.metadata.get('source_file', 'Unknown'),
+            'word_count': len(chunk.page_content.split())
+        }
+        return
+
+    surrounding_chunks = texts[max(0, i-1):i] + texts[i+1:i+2]
+    surrounding_text = "\n\n".join([c.page_content for c in surrounding_chunks])
+
+    chunk_start = time.time()
+    summary = generate_summary_with_ollama(chunk.page_content, surrounding_text, chunk.metadata['source_file'])
+    chunk_time = time.time() - chunk_start
+    metrics.observe("ingest_summary_seconds", chunk_time)
+
+    original_size = len(chunk.page_content)
+    chunk.metadata = {
+        'file_name': chunk.metadata.get('source_file', 'Unknown'),
+        'word_count': len(chunk.page_content.split())
+    }
+
+    chunk.page_content = f"{summary}\n{chunk.page_content}"
+    log.debug("chunk_summarized", sample=log_sample_rate, index=i + 1, total=len(texts),
+              seconds=round(chunk_time, 3), chars=original_size, enhanced_chars=len(chunk.page_content))
+
+# FAISS index of the given type holding vectors in order; L2 distance like LangChain's default
+def make_faiss_index(vectors: list, index_type: str = faiss_index_type):
+    matrix = np.asarray(vectors, dtype=np.float32)
+    dim = matrix.shape[1]
+    if index_type == "flat":
+        index = faiss.IndexFlatL2(dim)
+    elif index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(dim, faiss_hnsw_m)
+        index.hnsw.efSearch = faiss_hnsw_ef_search
+    elif index_type == "ivf":
+        # IVF training needs at least one vector per list
+        nlist = faiss_ivf_nlist or int(4 * np.sqrt(len(matrix)))
+        nlist = max(1, min(nlist, len(matrix)))
+        index = faiss.IndexIVFFlat(faiss.IndexFlatL2(dim), dim, nlist)
+        index.train(matrix)
+        index.nprobe = min(faiss_ivf_nprobe, nlist)
+    else:
+        raise ValueError(f"Unknown FAISS index type: {index_type}")
+    index.add(matrix)
+    return index
+
+# In-memory FAISS index over precomputed vectors
+def build_vectorstore(texts: list, vectors: list, embedding_model: Embeddings, index_type: str = faiss_index_type):
+    vectorstore = FAISS.from_embeddings(
+        list(zip([t.page_content for t in texts], vectors)),
+        embedding_model,
+        metadatas=[t.metadata for t in texts]
+    )
+    if index_type != "flat":
+        # Docstore ids follow insertion order, so the replacement index keeps positions
+        vectorstore.index = make_faiss_index(vectors, index_type)
+    return vectorstore
 
 # Main retriever creation function that processes markdown files into searchable chunks
 def create_retriever(
@@ -14,121 +185,106 @@ def create_retriever(
     faiss_db_path: str = "faiss_db",
     chunk_size: int = 1200,
     chunk_overlap: int = 200,
-    top_k: int = 3
+    top_k: int = 3,
+    progress=None,
+    summarize: bool = chunk_summaries,
+    index_type: str = faiss_index_type
 ):
-    print(f"\n--- CREATE_RETRIEVER START ---")
-    print(f"MD folder path: {md_folder_path}")
-    print(f"FAISS DB path: {faiss_db_path}")
-    print(f"Chunk size: {chunk_size}, overlap: {chunk_overlap}, top_k: {top_k}")
-
-    embedding_start = time.time()
-    embedding_model = NomicEmbeddings(model="nomic-embed-text-v1.5", inference_mode="local")
-    embedding_init_time = time.time() - embedding_start
-    print(f"Embedding model initialized in {embedding_init_time:.3f}s")
+    embedding_model = get_embedding_model()
 
     # Load existing FAISS database if it exists, otherwise create a new one
-    if os.path.exists(faiss_db_path):
-        print(f"Loading existing FAISS database from {faiss_db_path}")
-        load_start = time.time()
-        vectorstore = FAISS.load_local(faiss_db_path, embedding_model, allow_dangerous_deserialization=True)
-        load_time = time.time() - load_start
-        print(f"FAISS database loaded in {load_time:.3f}s")
-    else:
-        print(f"Creating new FAISS database...")
+    with span("faiss_load", metric="faiss_load_seconds"):
+        vectorstore = load_index(faiss_db_path, lambda path: FAISS.load_local(
+            path, embedding_model, allow_dangerous_deserialization=True))
+    if vectorstore is None:
         create_start = time.time()
 
-        md_files = glob.glob(os.path.join(md_folder_path, "*.md"))
-        print(f"Found {len(md_files)} markdown files: {[os.path.basename(f) for f in md_files]}")
+        # Sorted so a resumed build splits the corpus into the same batches
+        md_files = sorted(glob.glob(os.path.join(md_folder_path, "*.md")))
+        log.info("index_build_started", files=len(md_files))
 
         if not md_files:
             raise ValueError(f"No .md files found in {md_folder_path}")
 
-        all_documents = []
-
         # Load and process all markdown files
         file_load_start = time.time()
-        for i, md_file in enumerate(md_files):
-            print(f"Processing file {i+1}/{len(md_files)}: {os.path.basename(md_file)}")
-            try:
-                loader = TextLoader(md_file, encoding='utf-8')
-                documents = loader.load()
-
-                for doc in documents:
-                    file_name = os.path.basename(md_file)
-                    doc_size = len(doc.page_content)
-
-                    doc.metadata.update({
-                        'file_name': file_name,
-                        'source_file': md_file
-                    })
-                    print(f"  - Document loaded: {doc_size} characters")
-
-                all_documents.extend(documents)
-                print(f"  - Completed: {file_name} ({len(documents)} document(s))")
-
-            except Exception as e:
-                print(f"  ERROR loading {md_file}: {e}")
-                continue
-
+        all_documents = load_markdown_documents(md_files)
         file_load_time = time.time() - file_load_start
-        print(f"All files loaded in {file_load_time:.3f}s (total docs: {len(all_documents)})")
+        metrics.observe("ingest_load_seconds", file_load_time)
         
         if not all_documents:
             raise ValueError("No documents were successfully loaded")
 
         # Split documents into searchable chunks
-        print("Splitting documents into chunks...")
         split_start = time.time()
-        text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=chunk_size,
-            chunk_overlap=chunk_overlap,
-            add_start_index=True
-        )
-        texts = text_splitter.split_documents(all_documents)
+        texts = split_documents(all_documents, chunk_size, chunk_overlap)
         split_time = time.time() - split_start
-        print(f"Document splitting completed in {split_time:.3f}s ({len(texts)} chunks created)")
+        metrics.observe("ingest_split_seconds", split_time)
+
+        # Summaries and vectors are checkpointed per batch, a restarted build resumes after the last one
+        fingerprint = text_sha256(json.dumps({
+            "chunks": [text_sha256(t.page_content) for t in texts],
+            "sources": [t.metadata.get('source_file') for t in texts],
+            "summary_model": summary_model if summarize else None,
+            "embedding_model": embedding_model_name,
+        }))
+        checkpoint = BuildCheckpoint(faiss_db_path, fingerprint)
+        batch_starts = list(range(0, len(texts), checkpoint_batch_size))
 
         # Enhance chunks with AI-generated summaries
-        print("Enhancing chunks with AI-generated summaries...")
         summary_start = time.time()
-        for i, chunk in enumerate(texts):
-            surrounding_chunks = texts[max(0, i-1):i] + texts[i+1:i+2]
-            surrounding_text = "\n\n".join([c.page_content for c in surrounding_chunks])
-
-            amount = len(texts)
-            chunk_start = time.time()
-            print(f"Processing chunk {i+1}/{amount} from {os.path.basename(chunk.metadata['source_file'])}")
-
-            summary = generate_summary_with_ollama(chunk.page_content, surrounding_text, chunk.metadata['source_file'])
-            chunk_time = time.time() - chunk_start
-
-            original_size = len(chunk.page_content)
-            chunk.metadata = {
-                'file_name': chunk.metadata.get('source_file', 'Unknown'),
-                'word_count': len(chunk.page_content.split())
-            }
-
-            chunk.page_content = f"{summary}\n{chunk.page_content}"
-            enhanced_size = len(chunk.page_content)
-            print(f"  - Summary generated in {chunk_time:.3f}s (size: {original_size} → {enhanced_size} chars)")
+        if progress is not None:
+            progress("summarize", 0, len(texts))
+        for batch, batch_start in enumerate(batch_starts):
+            batch_end = min(batch_start + checkpoint_batch_size, len(texts))
+            saved = checkpoint.load_summaries(batch)
+            if saved is not None:
+                for chunk, (content, metadata) in zip(texts[batch_start:batch_end], saved):
+                    chunk.page_content = content
+                    chunk.metadata = metadata
+                log.debug("chunk_summaries_restored", first=batch_start + 1, last=batch_end)
+            else:
+                for i in range(batch_start, batch_end):
+                    enrich_chunk(texts, i, summarize)
+                    if progress is not None:
+                        progress("summarize", i + 1, len(texts))
+                checkpoint.save_summaries(batch, [[c.page_content, c.metadata] for c in texts[batch_start:batch_end]])
+            if progress is not None:
+                progress("summarize", batch_end, len(texts))
 
         summary_time = time.time() - summary_start
-        print(f"All chunk summaries completed in {summary_time:.3f}s")
+        metrics.observe("ingest_summarize_seconds", summary_time)
 
-        # Create and save vector database
-        print("Creating FAISS vector database...")
+        # Embed per batch, so progress is reported and a cancelled or crashed build keeps finished batches
         vector_start = time.time()
-        vectorstore = FAISS.from_documents(texts, embedding_model)
-        vectorstore.save_local(faiss_db_path)
-        vector_time = time.time() - vector_start
-        print(f"FAISS database created and saved in {vector_time:.3f}s")
+        vectors = []
+        for batch, batch_start in enumerate(batch_starts):
+            batch_end = min(batch_start + checkpoint_batch_size, len(texts))
+            batch_vectors = checkpoint.load_vectors(batch)
+            if batch_vectors is None:
+                with metrics.timer("ingest_embed_batch_seconds"):
+                    batch_vectors = embedding_model.embed_documents([t.page_content for t in texts[batch_start:batch_end]])
+                checkpoint.save_vectors(batch, batch_vectors)
+            vectors.extend([list(map(float, v)) for v in batch_vectors])
+            if progress is not None:
+                progress("embed", batch_end, len(texts))
 
-        total_create_time = time.time() - create_start
-        print(f"Total database creation time: {total_create_time:.3f}s")
+        # Write the complete index next to the live one, then swap it in
+        vectorstore = build_vectorstore(texts, vectors, embedding_model, index_type)
+        staged_path = f"{faiss_db_path}.staging"
+        if os.path.exists(staged_path):
+            shutil.rmtree(staged_path)
+        vectorstore.save_local(staged_path)
+        publish_index(staged_path, faiss_db_path)
+        checkpoint.clear()
+        vector_time = time.time() - vector_start
+        metrics.observe("ingest_index_build_seconds", vector_time)
+        log.info("index_built", files=len(md_files), documents=len(all_documents), chunks=len(texts),
+                 summarized=summarize, load_seconds=round(file_load_time, 3), split_seconds=round(split_time, 3),
+                 summary_seconds=round(summary_time, 3), index_seconds=round(vector_time, 3),
+                 seconds=round(time.time() - create_start, 3))
 
     retriever = vectorstore.as_retriever(search_kwargs={"k": top_k})
-    print(f"Retriever created with top_k={top_k}")
-    print(f"--- CREATE_RETRIEVER END ---\n")
     return retriever
 
 # Generate summaries for chunks using Ollama LLM
@@ -155,12 +311,16 @@ def generate_summary_with_ollama(chunk_text, surrounding_text, file_name):
 # Helper function to call Ollama model
 def ollama_model_call(prompt):
     llm = ChatOllama(
-        model="llama3.2:latest",
+        model=summary_model,
+        base_url=ollama_base_url,
+        keep_alive=keep_alive,
         temperature=0.1,
         num_predict=1000,
         streaming=False
     )
     
-    response = llm.invoke(prompt)
+    with llm_scheduler.slot(PRIORITY_INGESTION, summary_model) as ticket:
+        response = llm.invoke(prompt)
+        ticket.record_load((response.response_metadata.get("load_duration") or 0) / 1e9)
     
     return response
\ No newline at end of file
@@ -4,8 +4,6 @@ matplotlib.use('Agg')
 import matplotlib.pyplot as plt
 import seaborn as sns
 import numpy as np
-import sys
-import io
 import traceback
 import requests
 import json
@@ -13,8 +11,18 @@ import os
 import re
 from typing import TypedDict, List, Dict
 from langgraph.graph import StateGraph, END, START
-from llm_nodes import create_da_code_prompt, create_da_analysis_prompt, create_planning_prompt
+from llm_nodes import create_da_code_prompt, create_da_analysis_prompt, create_planning_prompt, create_da_plan_and_code_prompt, create_da_sql_prompt
+from llm_scheduler import llm_scheduler, PRIORITY_INTERACTIVE, keep_alive, ollama_base_url
+from dataset_store import resolve_data_file
+from dataset_profile import load_profile, profile_columns
+from schema_selector import select_schema
+from sandbox import get_sandbox_pool
+from plan_cache import plan_cache
+from telemetry import log, metrics
+from tracing import span, traced, record_ollama_usage
+from sql_engine import sql_engine, clean_sql
 import time
+import threading
 
 # State definition for data analysis workflow
 class DataAnalysisState(TypedDict):
@@ -22,153 +30,285 @@ class DataAnalysisState(TypedDict):
     generation: str
     plan: str
     code: str
+    language: str
+    schema: Dict
     execution_result: Dict
-    last_step_time: float
+    mode: str
+    timings: Dict[str, float]
+    llm_calls: int
+    cache_status: str
 
 agent = None
-data_file_path = "files/clean_data.csv"
+data_file_path = resolve_data_file("files/clean_data.csv")
+
+# "fused" asks one model for plan and code in a single call, "staged" runs plan and generate_code
+da_mode = os.environ.get("DA_MODE", "staged")
+# Same model as the analysis step so a fused question keeps a single model resident
+fused_model = os.environ.get("DA_FUSED_MODEL", "llama3.2:latest")
+# "pandas" runs generated Python in the sandbox, "sql" has the model write DuckDB SQL over the Parquet copy
+da_backend = os.environ.get("DA_EXECUTION_BACKEND", "pandas")
 
 # Data analysis state creation
 class CustomDataAnalysisAgent:
-    def __init__(self, file_path, llm_endpoint="http://localhost:11434/api/generate"):
+    def __init__(self, file_path, llm_endpoint=f"{ollama_base_url}/api/generate"):
         self.data_file_path = file_path
-        self.df = pd.read_csv(file_path)
+        # Workers start now and load the dataset while the first prompts are being built. The SQL
+        # backend reads Parquet through DuckDB, so its workers start only if Python code ever runs.
+        self.sandbox = get_sandbox_pool(file_path) if da_backend != "sql" else None
         self.llm_endpoint = llm_endpoint
-        self.execution_context = {'df': self.df, 'pd': pd, 'plt': plt, 'sns': sns, 'np': np}
 
     
-    def call_ollama(self, prompt, max_tokens=1000, model="llama3.2:latest"):
-        payload = {"model": model, "prompt": prompt, "stream": False, "options": {"temperature": 0.0, "max_tokens": max_tokens}}
-        response = requests.post(self.llm_endpoint, json=payload, timeout=60)
-        return response.json()['response']
+    def call_ollama(self, prompt, max_tokens=1000, model="llama3.2:latest", format=None):
+        payload = {"model": model, "prompt": prompt, "stream": False, "keep_alive": keep_alive, "options": {"temperature": 0.0, "max_tokens": max_tokens}}
+        if format:
+            payload["format"] = format
+        with span("llm", model=model) as llm_span:
+            with llm_scheduler.slot(PRIORITY_INTERACTIVE, model) as ticket:
+                llm_span.set(queue_wait=round(ticket.admitted_at - ticket.enqueued_at, 6))
+                response = requests.post(self.llm_endpoint, json=payload, timeout=60)
+                body = response.json()
+                record_ollama_usage(llm_span, body)
+                ticket.record_load(llm_span.attrs.get("load_duration"))
+        return body['response']
+
+    # SQL execution: DuckDB scans the Parquet copy directly, vectorized and out-of-core
+    def execute_sql(self, sql):
+        with span("duckdb"):
+            run = sql_engine.run(self.data_file_path, sql)
+        if run["error"]:
+            metrics.incr("da_execution_errors_total")
+            log.warning("da_sql_failed", error=run["error"])
+
+        result = {'output_type': 'text', 'output': run["output"], 'dataframe': run["dataframe"], 'value': run["value"], 'error': run["error"]}
+        if run["dataframe"] is not None:
+            result['output_type'] = 'dataframe'
+        elif run["value"] is not None:
+            result['output_type'] = 'value'
+        return result
 
     # Code execution function
-    def execute_code(self, code):
+    def execute_code(self, code, language="python"):
         if not os.path.exists("files"):
             os.makedirs("files")
         
-        old_stdout, sys.stdout = sys.stdout, io.StringIO()
-        result = {'output_type': 'text', 'dataframe': None}
-        
-        try:
-            exec(code, self.execution_context)
-        except Exception as e:
-            print(f"Error executing code: {e}")
-        
-        output = sys.stdout.getvalue().strip()
-        sys.stdout = old_stdout
-        
-        print(f"Code Execution Output:\n{output}")
-        
-        result['output'] = output
-        
-        try:
-            df = self.text_to_dataframe(output)
-            if df is not None:
-                result['output_type'] = 'dataframe'
-                result['dataframe'] = df.to_json(orient='split')
-        except Exception as e:
-            print(f"Failed to parse DataFrame from output: {e}")
+        if language == "sql":
+            return self.execute_sql(code)
+
+        # Runs in a pre-warmed worker process with its own namespace, limits and stdout;
+        # the pool lookup swaps in fresh workers if the dataset changed since startup
+        self.sandbox = get_sandbox_pool(self.data_file_path)
+        with span("sandbox"):
+            run = self.sandbox.run(code)
+        output = run["output"]
+        if run["error"]:
+            metrics.incr("da_execution_errors_total")
+            log.warning("da_code_failed", error=run["error"])
+
+        # The `result` variable comes back as a DataFrame, no printing and re-parsing
+        result = {'output_type': 'text', 'output': output, 'dataframe': run["dataframe"], 'value': run["value"], 'error': run["error"]}
+        if run["dataframe"] is not None:
+            result['output_type'] = 'dataframe'
+        elif run["value"] is not None:
+            result['output_type'] = 'value'
         
         return result
 
-    def text_to_dataframe(self, text):
-        from io import StringIO
-        
-        df = pd.read_csv(StringIO(text), sep=r'\s+', engine='python')
-        return df
+# Strip markdown fences from model code and prepend the pandas import
+def clean_code(code_from_llm: str) -> str:
+    code = code_from_llm.strip()
+    code = re.sub(r'python', '', code)
+    code = re.sub(r'```', '', code)
+
+    log.debug("da_code_generated", code=code)
+    # 'data' is injected by execute_code from the cached dataset
+    return "import pandas as pd\n" + code
+
+
+# Per-node durations and LLM round-trips accumulated across the run, for comparing modes
+def record_step(state: DataAnalysisState, node: str, seconds: float, llm_calls: int = 0) -> dict:
+    metrics.observe(f"da_{node}_seconds", seconds)
+    log.debug("da_node", node=node, seconds=round(seconds, 3), llm_calls=llm_calls)
+    timings = dict(state.get("timings") or {})
+    timings[node] = timings.get(node, 0.0) + seconds
+    return {"timings": timings, "llm_calls": state.get("llm_calls", 0) + llm_calls}
 
 # Graph node functions, each representing a step in the workflow
 
+def lookup_cache(state: DataAnalysisState):
+    step_start = time.time()
+
+    entry = plan_cache.get(agent.data_file_path, state["question"], load_profile(agent.data_file_path))
+    total_time = time.time() - step_start
+    if entry is None:
+        metrics.incr("da_plan_cache_misses_total")
+        return {**state, "cache_status": "miss", **record_step(state, "lookup_cache", total_time)}
+
+    metrics.incr("da_plan_cache_hits_total")
+    return {**state, "plan": entry["plan"], "code": entry["code"], "language": entry.get("language", "python"),
+            "schema": entry["schema"], "cache_status": "hit",
+            **record_step(state, "lookup_cache", total_time)}
+
+def plan_and_code(state: DataAnalysisState):
+    step_start = time.time()
+
+    profile = load_profile(agent.data_file_path)
+    schema = select_schema(profile, agent.data_file_path, state["question"])
+    prompt = create_da_plan_and_code_prompt(agent.data_file_path, profile, state["question"], schema)
+    response = agent.call_ollama(prompt, max_tokens=2000, model=fused_model, format="json")
+
+    plan_text, code = "", ""
+    try:
+        parsed = json.loads(response)
+        steps = parsed.get("plan") or []
+        if isinstance(steps, list):
+            plan_text = "\n".join(f"{i + 1}. {step}" for i, step in enumerate(steps))
+        else:
+            plan_text = str(steps)
+        if parsed.get("code"):
+            code = clean_code(str(parsed["code"]))
+    except (ValueError, AttributeError) as e:
+        log.warning("da_fused_invalid_json", error=str(e))
+
+    total_time = time.time() - step_start
+    return {**state, "plan": plan_text, "code": code, "language": "python", "schema": schema, "mode": "fused", "cache_status": "miss",
+            **record_step(state, "plan_and_code", total_time, llm_calls=1)}
+
+
 def plan(state: DataAnalysisState):
     step_start = time.time()
-    print("\n--- Executing PLAN Node ---")
-    if "last_step_time" in state:
-        duration = step_start - state["last_step_time"]
-        print(f"Time since last step: {duration:.3f}s")
 
-    planning_prompt_string = create_planning_prompt(state["question"], agent.df.columns.tolist(), agent.df.dtypes.to_dict())
+    # Only the columns relevant to the question go into the prompts
+    profile = load_profile(agent.data_file_path)
+    schema = select_schema(profile, agent.data_file_path, state["question"])
+    planning_prompt_string = create_planning_prompt(state["question"], schema["columns_text"], schema["dtypes_text"])
     plan_response = agent.call_ollama(planning_prompt_string, model="llama3.2:latest")
 
     total_time = time.time() - step_start
-    print(f"PLAN completed in {total_time:.3f}s total\n")
-    return {**state, "plan": plan_response, "last_step_time": time.time()}
+    # Reaching plan after a fused attempt is the fallback, so the run continues staged
+    return {**state, "plan": plan_response, "schema": schema, "mode": "staged", "cache_status": "miss",
+            **record_step(state, "plan", total_time, llm_calls=1)}
 
 
 def generate_code(state: DataAnalysisState):
     step_start = time.time()
-    print("\n--- Executing GENERATE_CODE Node ---")
-    if "last_step_time" in state:
-        duration = step_start - state["last_step_time"]
-        print(f"Time since last step: {duration:.3f}s")
-
-    code_prompt = create_da_code_prompt(
-        data_file_path=agent.data_file_path,
-        df_shape=agent.df.shape,
-        df_columns=agent.df.columns.tolist(),
-        user_question=state["question"],
-        plan_steps=state["plan"],
-        df_info=agent.df.dtypes.to_dict()
-    )
-    code_from_llm = agent.call_ollama(code_prompt, model="gpt-oss")
-    code = code_from_llm.strip()
-    code = re.sub(r'python', '', code)
-    code = re.sub(r'```', '', code)
 
-    print(f"Generated Code: \n{code}\n")
-    code = "import pandas as pd\ndata = pd.read_csv('files/clean_data.csv')\n" + code
+    if da_backend == "sql":
+        sql_prompt = create_da_sql_prompt(
+            profile=load_profile(agent.data_file_path),
+            user_question=state["question"],
+            plan_steps=state["plan"],
+            schema=state.get("schema")
+        )
+        code = clean_sql(agent.call_ollama(sql_prompt, model="gpt-oss"))
+        language = "sql"
+        log.debug("da_sql_generated", sql=code)
+    else:
+        code_prompt = create_da_code_prompt(
+            data_file_path=agent.data_file_path,
+            profile=load_profile(agent.data_file_path),
+            user_question=state["question"],
+            plan_steps=state["plan"],
+            schema=state.get("schema")
+        )
+        code_from_llm = agent.call_ollama(code_prompt, model="gpt-oss")
+        code = clean_code(code_from_llm)
+        language = "python"
 
     total_time = time.time() - step_start
-    print(f"GENERATE_CODE completed in {total_time:.3f}s total\n")
-    return {**state, "code": code, "last_step_time": time.time()}
+    return {**state, "code": code, "language": language, **record_step(state, "generate_code", total_time, llm_calls=1)}
 
 
 def execute_code(state: DataAnalysisState):
     step_start = time.time()
-    print("\n--- Executing EXECUTE_CODE Node ---")
-    if "last_step_time" in state:
-        duration = step_start - state["last_step_time"]
-        print(f"Time since last step: {duration:.3f}s")
 
-    result = agent.execute_code(state["code"])
+    result = agent.execute_code(state["code"], state.get("language", "python"))
 
-    print(f"Code Execution Output:\n\n{result['output']}\n```")
+    # Fresh code that ran is cached; cached code that no longer runs is evicted and regenerated
+    cache_status = state.get("cache_status")
+    profile = load_profile(agent.data_file_path)
+    if cache_status == "hit" and result["error"]:
+        plan_cache.evict(agent.data_file_path, state["question"], profile)
+        cache_status = "evicted"
+    elif cache_status == "miss" and not result["error"]:
+        plan_cache.put(agent.data_file_path, state["question"], profile, state["plan"], state["code"], state.get("schema"), state.get("language", "python"))
 
     total_time = time.time() - step_start
-    print(f"EXECUTE_CODE completed in {total_time:.3f}s total\n")
-    return {**state, "execution_result": result, "last_step_time": time.time()}
+    return {**state, "execution_result": result, "cache_status": cache_status,
+            **record_step(state, "execute_code", total_time)}
 
 
 def analyze_results(state: DataAnalysisState):
     step_start = time.time()
-    print("\n--- Executing ANALYZE_RESULTS Node ---")
-    if "last_step_time" in state:
-        duration = step_start - state["last_step_time"]
-        print(f"Time since last step: {duration:.3f}s")
 
-    analysis_prompt = create_da_analysis_prompt(state["question"], state["execution_result"], state["plan"], agent.df)
+    columns = state["schema"]["columns"] if state.get("schema") else profile_columns(load_profile(agent.data_file_path))
+    analysis_prompt = create_da_analysis_prompt(state["question"], state["execution_result"], state["plan"], columns)
     comprehensive_analysis = agent.call_ollama(analysis_prompt, max_tokens=1500)
 
     total_time = time.time() - step_start
-    print(f"ANALYZE_RESULTS completed in {total_time:.3f}s total\n")
-    return {**state, "generation": comprehensive_analysis, "last_step_time": time.time()}
+    steps = record_step(state, "analyze_results", total_time, llm_calls=1)
+    log.info("da_run", mode=state.get("mode", "staged"), llm_calls=steps["llm_calls"], timings=steps["timings"])
+    return {**state, "generation": comprehensive_analysis, **steps}
+
+
+# Routing: cache hits go straight to execution, fused runs skip plan/generate_code and
+# fall back to them when the code fails
+def route_generation(state: DataAnalysisState):
+    return "plan_and_code" if state.get("mode", da_mode) == "fused" else "plan"
+
+
+def route_after_lookup(state: DataAnalysisState):
+    return "execute_code" if state.get("cache_status") == "hit" else route_generation(state)
+
+
+def route_after_plan_and_code(state: DataAnalysisState):
+    return "execute_code" if state.get("code") else "plan"
+
+
+def route_after_execute(state: DataAnalysisState):
+    if state.get("cache_status") == "evicted":
+        metrics.incr("da_cache_evictions_total")
+        log.info("da_cached_code_failed")
+        return route_generation(state)
+    if state.get("mode") == "fused" and state["execution_result"].get("error"):
+        metrics.incr("da_fused_fallbacks_total")
+        log.info("da_fused_code_failed")
+        return "plan"
+    return "analyze_results"
 
 
 def build_da_graph(file_path: str):
     global agent
-    agent = CustomDataAnalysisAgent(file_path=file_path)
+    agent = CustomDataAnalysisAgent(file_path=resolve_data_file(file_path))
 
     workflow = StateGraph(DataAnalysisState)
 
-    workflow.add_node("plan", plan)
-    workflow.add_node("generate_code", generate_code)
-    workflow.add_node("execute_code", execute_code)
-    workflow.add_node("analyze_results", analyze_results)
+    workflow.add_node("lookup_cache", traced("lookup_cache", lookup_cache))
+    workflow.add_node("plan_and_code", traced("plan_and_code", plan_and_code))
+    workflow.add_node("plan", traced("plan", plan))
+    workflow.add_node("generate_code", traced("generate_code", generate_code))
+    workflow.add_node("execute_code", traced("execute_code", execute_code))
+    workflow.add_node("analyze_results", traced("analyze_results", analyze_results))
 
-    workflow.add_edge(START, "plan")
+    workflow.add_edge(START, "lookup_cache")
+    workflow.add_conditional_edges("lookup_cache", route_after_lookup, {"execute_code": "execute_code", "plan_and_code": "plan_and_code", "plan": "plan"})
+    workflow.add_conditional_edges("plan_and_code", route_after_plan_and_code, {"execute_code": "execute_code", "plan": "plan"})
     workflow.add_edge("plan", "generate_code")
     workflow.add_edge("generate_code", "execute_code")
-    workflow.add_edge("execute_code", "analyze_results")
+    workflow.add_conditional_edges("execute_code", route_after_execute, {"plan_and_code": "plan_and_code", "plan": "plan", "analyze_results": "analyze_results"})
     workflow.add_edge("analyze_results", END)
 
-    return workflow.compile()
\ No newline at end of file
+    return workflow.compile()
+
+
+_graph_lock = threading.Lock()
+_compiled_graph = None
+
+
+# Compiled graph and agent are built once per data file and reused across questions
+def get_da_graph(file_path: str):
+    global _compiled_graph
+    path = resolve_data_file(file_path)
+    with _graph_lock:
+        if _compiled_graph is None or _compiled_graph[0] != path:
+            _compiled_graph = (path, build_da_graph(path))
+        return _compiled_graph[1]
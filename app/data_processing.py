@@ -1,18 +1,148 @@
 import pandas as pd
+import numpy as np
+import json
+import os
 
-def process_data():
-    df = pd.read_csv("../testing_tools/data_analysis/data.csv")
-    df.drop(columns=['Address'], inplace=True)
-    object_cols = df.select_dtypes(include='object').columns
-    df_encoded = pd.get_dummies(df, columns=object_cols)
-    df_encoded = df_encoded.fillna(0)
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
 
-    for col in df_encoded.columns:
-        if df_encoded[col].dtype == 'bool':
-            df_encoded[col] = df_encoded[col].astype(int)
+from telemetry import log
 
-    output_file_path = 'files/clean_data.csv'
-    df_encoded.to_csv(output_file_path, index=False)
+# Rows per chunk; peak memory is one encoded chunk plus the category vocabularies
+chunk_rows = int(os.environ.get("CLEAN_CHUNK_ROWS", "100000"))
+# "onehot" keeps the 0/1 columns the DA prompts expect (as uint8), "codes" writes one int32
+# code per category column, "categorical" writes dictionary-encoded string columns
+categorical_encoding = os.environ.get("CLEAN_CATEGORICAL_ENCODING", "onehot")
+# Past this many categories a column is not expanded to one-hot and falls back to codes
+max_onehot_categories = int(os.environ.get("CLEAN_MAX_ONEHOT_CATEGORIES", "200"))
+
+dropped_columns = ['Address']
+# Widening order when chunks disagree about a column's kind
+kind_order = ["bool", "int", "float", "object"]
+
+
+# First pass: per-column kind (object, float, int, bool) and the vocabulary of every object column
+def scan_columns(input_path: str, chunksize: int) -> dict:
+    kinds = {}
+    vocab = {}
+    late_object = set()
+    for chunk in pd.read_csv(input_path, chunksize=chunksize):
+        chunk = chunk.drop(columns=[c for c in dropped_columns if c in chunk.columns])
+        for col in chunk.columns:
+            series = chunk[col]
+            if pd.api.types.is_bool_dtype(series):
+                kind = "bool"
+            elif pd.api.types.is_object_dtype(series) or pd.api.types.is_string_dtype(series):
+                kind = "object"
+            elif pd.api.types.is_float_dtype(series):
+                kind = "float"
+            else:
+                kind = "int"
+            # A column is object if any chunk saw text, float if any chunk saw fractions or NaN
+            previous = kinds.get(col, kind)
+            if kind == "object" and previous != "object":
+                late_object.add(col)
+            kinds[col] = max(previous, kind, key=kind_order.index)
+            if kind == "object":
+                vocab.setdefault(col, set()).update(series.dropna().astype(str).unique())
+
+    # A header without rows may yield no chunk at all; its columns are kept as empty text columns
+    for col in pd.read_csv(input_path, nrows=0).columns:
+        if col not in dropped_columns and col not in kinds:
+            kinds[col] = "object"
+            vocab[col] = set()
+
+    # Columns that turned to text after the first chunk are rescanned as text for a complete vocabulary
+    if late_object:
+        columns = sorted(late_object)
+        for chunk in pd.read_csv(input_path, chunksize=chunksize, usecols=columns, dtype=str):
+            for col in columns:
+                vocab[col].update(chunk[col].dropna().unique())
+    return {"kinds": kinds, "vocab": {col: sorted(values) for col, values in vocab.items()}}
+
+
+# Encode one chunk against the fixed vocabularies so every chunk has the same columns and types
+def encode_chunk(chunk: pd.DataFrame, kinds: dict, vocab: dict, encoding: str) -> pd.DataFrame:
+    out = {}
+    for col, kind in kinds.items():
+        series = chunk[col]
+        if kind != "object":
+            series = series.fillna(0)
+            out[col] = series.astype({"bool": np.uint8, "int": np.int64, "float": np.float64}[kind])
+            continue
+
+        categories = vocab[col]
+        values = pd.Categorical(series, categories=categories)
+        if encoding == "categorical":
+            out[col] = values
+        elif encoding == "codes" or len(categories) > max_onehot_categories:
+            # -1 marks a missing value, the categories sidecar maps codes back to labels
+            out[col] = values.codes.astype(np.int32)
+        else:
+            codes = values.codes
+            for i, category in enumerate(categories):
+                out[f"{col}_{category}"] = (codes == i).astype(np.uint8)
+    return pd.DataFrame(out, index=chunk.index)
+
+
+def process_data(input_path: str = "../testing_tools/data_analysis/data.csv",
+                 output_path: str = "files/clean_data.parquet",
+                 encoding: str = categorical_encoding,
+                 chunksize: int = chunk_rows):
+    scan = scan_columns(input_path, chunksize)
+    kinds, vocab = scan["kinds"], scan["vocab"]
+
+    stem = os.path.splitext(output_path)[0]
+    if pa is None or not output_path.endswith(".parquet"):
+        output_path = f"{stem}.csv"
+    tmp_path = output_path + ".tmp"
+
+    writer = None
+    rows = 0
+    written = False
+    dtypes = {col: str for col in vocab}
+    try:
+        for chunk in pd.read_csv(input_path, chunksize=chunksize, dtype=dtypes):
+            encoded = encode_chunk(chunk, kinds, vocab, encoding)
+            if pa is None or not output_path.endswith(".parquet"):
+                encoded.to_csv(tmp_path, mode="a" if written else "w", header=not written, index=False)
+            else:
+                table = pa.Table.from_pandas(encoded, preserve_index=False)
+                if writer is None:
+                    writer = pq.ParquetWriter(tmp_path, table.schema)
+                writer.write_table(table.cast(writer.schema))
+            written = True
+            rows += len(encoded)
+        # No rows still writes the columns, so the output exists and loads as an empty table
+        if not written:
+            encoded = encode_chunk(pd.read_csv(input_path, nrows=0, dtype=dtypes), kinds, vocab, encoding)
+            if pa is None or not output_path.endswith(".parquet"):
+                encoded.to_csv(tmp_path, index=False)
+            else:
+                pq.write_table(pa.Table.from_pandas(encoded, preserve_index=False), tmp_path)
+    finally:
+        if writer is not None:
+            writer.close()
+    os.replace(tmp_path, output_path)
+    log.info("dataset_cleaned", rows=rows, path=output_path, encoding=encoding)
+
+    # Record which one-hot columns came from which source column for the schema selector,
+    # and the labels behind integer codes
+    families = {}
+    categories = {}
+    for col, values in vocab.items():
+        if encoding == "onehot" and len(values) <= max_onehot_categories:
+            families[col] = [f"{col}_{value}" for value in values]
+        elif encoding != "categorical":
+            categories[col] = values
+    with open(f"{stem}.families.json", 'w') as f:
+        json.dump(families, f)
+    with open(f"{stem}.categories.json", 'w') as f:
+        json.dump(categories, f)
+    return output_path
 
 if __name__ == "__main__":
-    process_data()
\ No newline at end of file
+    process_data()
@@ -0,0 +1,150 @@
+import json
+import os
+import threading
+
+import pandas as pd
+
+try:
+    import duckdb
+    import pyarrow.parquet as pq
+except ImportError:
+    duckdb = None
+
+from dataset_store import dataset_store
+from telemetry import log
+
+# Number of distinct sample values kept per column
+sample_size = 10
+
+_lock = threading.Lock()
+_profiles = {}
+
+
+def profile_path_for(data_file_path: str) -> str:
+    stem = os.path.splitext(data_file_path)[0]
+    return f"{stem}.profile.json"
+
+
+# Scan the frame once: dtypes, cardinalities, sample values and numeric summaries
+def build_profile(df: pd.DataFrame, version: str) -> dict:
+    columns = []
+    for name in df.columns:
+        series = df[name]
+        non_null = series.dropna()
+        column = {
+            "name": str(name),
+            "dtype": str(series.dtype),
+            "n_unique": int(non_null.nunique()),
+            "null_count": int(series.isna().sum()),
+            "samples": non_null.unique()[:sample_size].tolist(),
+        }
+        if pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series) and len(non_null):
+            column["numeric"] = {
+                "min": float(non_null.min()),
+                "max": float(non_null.max()),
+                "mean": float(non_null.mean()),
+                "std": float(non_null.std()) if len(non_null) > 1 else 0.0,
+            }
+        columns.append(column)
+    return {"version": version, "shape": list(df.shape), "columns": columns}
+
+
+def _quote(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+# Same profile as build_profile, computed by DuckDB over the Parquet copy so the dataset is
+# never loaded into memory: one aggregate scan, plus a short distinct read per column for samples
+def build_parquet_profile(parquet_path: str, version: str) -> dict:
+    # dtypes as the sandbox's to_pandas() will produce them, read from the schema alone
+    dtypes = pq.read_schema(parquet_path).empty_table().to_pandas().dtypes
+    rows = pq.ParquetFile(parquet_path).metadata.num_rows
+    numeric = [str(name) for name, dtype in dtypes.items()
+               if pd.api.types.is_numeric_dtype(dtype) and not pd.api.types.is_bool_dtype(dtype)]
+
+    connection = duckdb.connect(database=":memory:")
+    try:
+        escaped = parquet_path.replace("'", "''")
+        connection.execute(f"CREATE VIEW data AS SELECT * FROM read_parquet('{escaped}')")
+        aggregates = []
+        for name in dtypes.index:
+            column = _quote(str(name))
+            aggregates += [f"count(DISTINCT {column})", f"count(*) - count({column})"]
+            if str(name) in numeric:
+                aggregates += [f"min({column})::DOUBLE", f"max({column})::DOUBLE",
+                               f"avg({column})::DOUBLE", f"stddev_samp({column})::DOUBLE"]
+        values = iter(connection.execute(f"SELECT {', '.join(aggregates)} FROM data").fetchone())
+
+        columns = []
+        for name, dtype in dtypes.items():
+            column = {"name": str(name), "dtype": str(dtype), "n_unique": int(next(values)), "null_count": int(next(values))}
+            quoted = _quote(str(name))
+            column["samples"] = [r[0] for r in connection.execute(
+                f"SELECT DISTINCT {quoted} FROM data WHERE {quoted} IS NOT NULL LIMIT {sample_size}").fetchall()]
+            # to_pandas() turns integer columns holding nulls into float64
+            if pd.api.types.is_integer_dtype(dtype) and column["null_count"]:
+                column["dtype"] = "float64"
+                column["samples"] = [float(v) for v in column["samples"]]
+            if str(name) in numeric:
+                low, high, mean, std = next(values), next(values), next(values), next(values)
+                if rows - column["null_count"] > 0:
+                    column["numeric"] = {"min": low, "max": high, "mean": mean, "std": std if std is not None else 0.0}
+            columns.append(column)
+    finally:
+        connection.close()
+    return {"version": version, "shape": [rows, len(dtypes)], "columns": columns}
+
+
+# Profile for the current dataset version, read from disk or rebuilt when the data changed
+def load_profile(data_file_path: str) -> dict:
+    version = dataset_store.version(data_file_path)
+    with _lock:
+        cached = _profiles.get(data_file_path)
+        if cached is not None and cached["version"] == version:
+            return cached
+
+        profile_path = profile_path_for(data_file_path)
+        profile = None
+        if os.path.exists(profile_path):
+            try:
+                with open(profile_path, "r", encoding="utf-8") as f:
+                    profile = json.load(f)
+            except (OSError, ValueError) as e:
+                log.warning("dataset_profile_unreadable", path=profile_path, error=str(e))
+            if profile is not None and profile.get("version") != version:
+                profile = None
+
+        if profile is None:
+            log.info("dataset_profile_building", file=os.path.basename(data_file_path))
+            # Round-trip through JSON so fresh and reloaded profiles render identically
+            parquet_path = dataset_store.parquet_path(data_file_path)
+            if duckdb is not None and parquet_path is not None:
+                profile = build_parquet_profile(parquet_path, version)
+            else:
+                profile = build_profile(dataset_store.load(data_file_path), version)
+            serialized = json.dumps(profile, default=str)
+            profile = json.loads(serialized)
+            tmp_path = profile_path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(serialized)
+            os.replace(tmp_path, profile_path)
+
+        _profiles[data_file_path] = profile
+        return profile
+
+
+def profile_columns(profile: dict) -> list:
+    return [column["name"] for column in profile["columns"]]
+
+
+# Column name to dtype string, the JSON shown to the model in both prompts
+def format_dtypes(profile: dict, columns: list = None) -> str:
+    wanted = None if columns is None else set(columns)
+    return json.dumps({c["name"]: c["dtype"] for c in profile["columns"] if wanted is None or c["name"] in wanted})
+
+
+def format_column_values(profile: dict, columns: list = None) -> str:
+    wanted = None if columns is None else set(columns)
+    return "\n".join(
+        f"{c['name']}: {c['samples']}" for c in profile["columns"] if wanted is None or c["name"] in wanted
+    )
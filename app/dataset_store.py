@@ -0,0 +1,149 @@
+import hashlib
+import os
+import threading
+
+import pandas as pd
+
+try:
+    import pyarrow.parquet as pq
+    import pyarrow.csv as pa_csv
+except ImportError:
+    pq = None
+    pa_csv = None
+
+try:
+    import duckdb
+except ImportError:
+    duckdb = None
+
+from telemetry import log
+
+# Columnar copies live next to the data they were converted from
+cache_dir_name = ".dataset_cache"
+# Types DuckDB may infer from a CSV, matching what pandas.read_csv produces so the
+# sandbox sees the same columns it did before the Parquet copy existed
+csv_type_candidates = "['BOOLEAN', 'BIGINT', 'DOUBLE', 'VARCHAR']"
+
+
+def file_fingerprint(path: str):
+    stat = os.stat(path)
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+# Prefer the Parquet output of the cleaning pipeline over a CSV with the same stem
+def resolve_data_file(path: str) -> str:
+    parquet_path = os.path.splitext(path)[0] + ".parquet"
+    if os.path.exists(parquet_path):
+        return parquet_path
+    return path
+
+
+# Keeps a Parquet copy of each dataset and hands the same DataFrame to every caller. The
+# DataFrame is only read on first load(), so version and Parquet lookups stay out of memory.
+class DatasetStore:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}
+
+    # Return the cached DataFrame for path, rebuilding it only when the file content changed
+    def load(self, path: str) -> pd.DataFrame:
+        entry = self._entry(path)
+        with self._lock:
+            if entry["df"] is None:
+                entry["df"] = self._read(path, entry["parquet_path"])
+            return entry["df"]
+
+    # Content hash identifying the current version of the dataset
+    def version(self, path: str) -> str:
+        return self._entry(path)["sha256"]
+
+    # Parquet file holding the current version, None when pyarrow is unavailable
+    def parquet_path(self, path: str) -> str:
+        return self._entry(path)["parquet_path"]
+
+    def _entry(self, path: str) -> dict:
+        path = os.path.abspath(path)
+        fingerprint = file_fingerprint(path)
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None and entry["fingerprint"] == fingerprint:
+                return entry
+
+            # mtime or size moved, the hash decides whether the content really changed
+            sha256 = file_sha256(path)
+            if entry is not None and entry["sha256"] == sha256:
+                entry["fingerprint"] = fingerprint
+                return entry
+
+            entry = self._build(path, sha256)
+            entry["fingerprint"] = fingerprint
+            self._entries[path] = entry
+            return entry
+
+    def _build(self, path: str, sha256: str) -> dict:
+        if path.endswith(".parquet"):
+            parquet_path = path if pq is not None else None
+        elif pq is None:
+            parquet_path = None
+        else:
+            parquet_path = self._convert(path, sha256)
+        return {"df": None, "sha256": sha256, "parquet_path": parquet_path}
+
+    def _read(self, path: str, parquet_path: str) -> pd.DataFrame:
+        if parquet_path is None:
+            log.info("dataset_loaded", file=os.path.basename(path), format="csv", reason="pyarrow not installed")
+            return pd.read_csv(path)
+        # to_pandas copies the decoded columns into the heap; self_destruct frees each Arrow
+        # column as it is converted, so the peak stays near one copy of the data instead of two
+        table = pq.read_table(parquet_path)
+        df = table.to_pandas(self_destruct=True, split_blocks=True)
+        del table
+        log.info("dataset_loaded", file=os.path.basename(parquet_path), format="parquet", rows=df.shape[0], columns=df.shape[1])
+        return df
+
+    # Convert a CSV to Parquet once per content hash, dropping copies of older versions
+    def _convert(self, path: str, sha256: str) -> str:
+        cache_dir = os.path.join(os.path.dirname(path), cache_dir_name)
+        os.makedirs(cache_dir, exist_ok=True)
+        stem = os.path.splitext(os.path.basename(path))[0]
+        parquet_path = os.path.join(cache_dir, f"{stem}.{sha256[:16]}.parquet")
+        if os.path.exists(parquet_path):
+            return parquet_path
+
+        log.info("dataset_converting", file=os.path.basename(path), target=os.path.basename(parquet_path))
+        tmp_path = parquet_path + ".tmp"
+        # Streamed in both cases, so a CSV larger than memory still converts
+        if duckdb is not None:
+            # A full-file scan for types, like read_csv, instead of guessing from the first rows
+            connection = duckdb.connect(database=":memory:")
+            try:
+                source = path.replace("'", "''")
+                target = tmp_path.replace("'", "''")
+                connection.execute(
+                    f"COPY (SELECT * FROM read_csv('{source}', auto_detect = true, sample_size = -1, "
+                    f"auto_type_candidates = {csv_type_candidates})) TO '{target}' (FORMAT PARQUET)")
+            finally:
+                connection.close()
+        else:
+            reader = pa_csv.open_csv(path)
+            with pq.ParquetWriter(tmp_path, reader.schema) as writer:
+                for batch in reader:
+                    writer.write_batch(batch)
+        os.replace(tmp_path, parquet_path)
+
+        for name in os.listdir(cache_dir):
+            if name.startswith(f"{stem}.") and name.endswith(".parquet") and os.path.join(cache_dir, name) != parquet_path:
+                os.remove(os.path.join(cache_dir, name))
+        return parquet_path
+
+
+# Process-wide store shared by the DA agent and prompt builders
+dataset_store = DatasetStore()
@@ -1,6 +1,14 @@
 import pymupdf as fitz
 import os
 import ollama
+import time
+from llm_scheduler import llm_scheduler, PRIORITY_INGESTION, keep_alive
+from telemetry import log, metrics
+
+# Model used for image captions
+vision_model = 'gemma3:4b'
+# Markdown and extracted images are written here
+output_dir = "files"
 
 # Helper function to extract text from PDF blocks
 def _get_text_from_block(block: dict) -> str:
@@ -12,12 +20,71 @@ def _get_text_from_block(block: dict) -> str:
             text += "\n"
     return text
 
+# Where pdf_to_markdown writes the markdown for a PDF
+def markdown_path_for(pdf_path: str) -> str:
+    return os.path.join(output_dir, os.path.basename(pdf_path).replace(".pdf", ".md"))
+
+# A conversion is reusable when its markdown was written after the PDF
+def is_converted(pdf_path: str) -> bool:
+    md_path = markdown_path_for(pdf_path)
+    return os.path.exists(md_path) and os.path.getmtime(md_path) >= os.path.getmtime(pdf_path)
+
+def count_pages(pdf_path: str) -> int:
+    with fitz.open(pdf_path) as doc:
+        return doc.page_count
+
+# Text and image blocks of a page in reading order
+def page_blocks(page) -> list:
+    return page.get_text("dict", sort=True).get("blocks", [])
+
+# Text before and after image block i, trimmed to the 200 characters nearest the image
+def gather_image_context(blocks: list, i: int) -> tuple:
+    before_text = ""
+    for j in range(i - 1, -1, -1):
+        if blocks[j]["type"] == 0:
+            before_text = _get_text_from_block(blocks[j]) + before_text
+
+    after_text = ""
+    for j in range(i + 1, len(blocks)):
+        if blocks[j]["type"] == 0:
+            after_text += _get_text_from_block(blocks[j])
+
+    return before_text.strip()[-200:], after_text.strip()[:200]
+
+# Save an image block next to the markdown and return its path
+def write_image(block: dict, pdf_path: str, img_count: int) -> str:
+    image_filename = f"{os.path.basename(pdf_path).replace('.pdf', '')}{img_count}.{block['ext']}"
+    image_path = os.path.join(output_dir, image_filename)
+    with open(image_path, "wb") as img_file:
+        img_file.write(block["image"])
+    return image_path
+
+# One-sentence description of an image from the vision model, guided by the nearby text
+def caption_image(image_path: str, before_context: str, after_context: str) -> str:
+    context = (before_context + " " + after_context).strip()
+    vision_prompt = f'Provide a concise, one-sentence description for the following image or icon. If an image, the caption should describe what it shows and why it is important. If an icon, the caption should include what it is used for, not what it looks like. Choose either Before Context or After Context, but not both. Before Context: "{before_context} After Context: {after_context}"'
+    if not context:
+        vision_prompt = 'Provide a concise, one-sentence description for the following image or icon. If an image, the caption should describe what it shows and why it is important. If an icon, the caption should include what it is used for, not what it looks like.'
+
+    with llm_scheduler.slot(PRIORITY_INGESTION, vision_model) as ticket:
+        vision_response = ollama.chat(
+            model=vision_model,
+            messages=[{
+                'role': 'user',
+                'content': vision_prompt,
+                'images': [image_path]
+            }],
+            keep_alive=keep_alive
+        )
+        ticket.record_load((vision_response.get('load_duration') or 0) / 1e9)
+    return vision_response['message']['content'].strip()
+
 # Main function
-def pdf_to_markdown(pdf_path: str) -> str:
+# progress(done, total) is called after each page; it may raise to abort the conversion
+def pdf_to_markdown(pdf_path: str, progress=None) -> str:
     doc = fitz.open(pdf_path)
     markdown_text = ""
 
-    output_dir = "files"
     os.makedirs(output_dir, exist_ok=True)
 
     img_count = 0
@@ -27,8 +94,7 @@ def pdf_to_markdown(pdf_path: str) -> str:
         page = doc.load_page(page_number)
         markdown_text += f"## Page {page_number + 1}\n\n"
 
-        page_dict = page.get_text("dict", sort=True)
-        blocks = page_dict.get("blocks", [])
+        blocks = page_blocks(page)
         
         # Process each block (text or image) on the page
         for i, block in enumerate(blocks):
@@ -40,72 +106,46 @@ def pdf_to_markdown(pdf_path: str) -> str:
             # Handle image blocks
             elif block["type"] == 1:
                 img_count += 1
-                print(f"\n--- Processing Image {img_count} on Page {page_number + 1} ---")
 
                 # Gather context from surrounding text blocks
-                before_text = ""
-                for j in range(i - 1, -1, -1):
-                    if blocks[j]["type"] == 0:
-                        before_text = _get_text_from_block(blocks[j]) + before_text
-                
-                after_text = ""
-                for j in range(i + 1, len(blocks)):
-                    if blocks[j]["type"] == 0:
-                        after_text += _get_text_from_block(blocks[j])
-
-                before_context = before_text.strip()[-200:]
-                after_context = after_text.strip()[:200]
-                context = (before_context + " " + after_context).strip()
-                print(f"  [Context] Gathered {len(context)} characters: \"{context[:100]}...\"")
+                before_context, after_context = gather_image_context(blocks, i)
                 
                 # Process and save the image
                 try:
-                    image_bytes = block["image"]
-                    image_ext = block["ext"]
-                    
                     img_count += 1
-                    image_filename = f"{os.path.basename(pdf_path).replace('.pdf', '')}{img_count}.{image_ext}"
-                    image_path = os.path.join(output_dir, image_filename)
-                    
-                    print(f"  [Image] Saving image to: {image_path}")
-                    with open(image_path, "wb") as img_file:
-                        img_file.write(image_bytes)
+                    image_path = write_image(block, pdf_path, img_count)
+                    normalized_image_path = image_path.replace('\\', '/')
 
                     # Generate AI description for the image using context
                     try:
-                        vision_prompt = f'Provide a concise, one-sentence description for the following image or icon. If an image, the caption should describe what it shows and why it is important. If an icon, the caption should include what it is used for, not what it looks like. Choose either Before Context or After Context, but not both. Before Context: "{before_context} After Context: {after_context}"'
-                        if not context.strip():
-                            vision_prompt = 'Provide a concise, one-sentence description for the following image or icon. If an image, the caption should describe what it shows and why it is important. If an icon, the caption should include what it is used for, not what it looks like.'
-
-                        print("  [AI] Calling vision model for description...")
-                        vision_response = ollama.chat(
-                            model='gemma3:4b',
-                            messages=[{
-                                'role': 'user',
-                                'content': vision_prompt,
-                                'images': [image_path]
-                            }]
-                        )
-                        image_desc = vision_response['message']['content'].strip()
-                        print(f"  [AI] Generated description: \"{image_desc}\"")
-
-                        normalized_image_path = image_path.replace('\\', '/')
+                        vision_start = time.time()
+                        image_desc = caption_image(image_path, before_context, after_context)
+                        vision_time = time.time() - vision_start
+                        metrics.observe("ingest_caption_seconds", vision_time)
+                        log.debug("image_captioned", page=page_number + 1, image=os.path.basename(image_path),
+                                  context_chars=len(before_context) + len(after_context), seconds=round(vision_time, 3))
+
                         markdown_text += f"![{image_desc}]({normalized_image_path})\n\n"
-                        print(f"--- Finished Processing Image {img_count} ---")
 
                     except Exception as e:
-                        print(f"Warning: Could not process image with Ollama on page {page_number + 1}. Error: {e}")
-                        normalized_image_path = image_path.replace('\\', '/')
+                        metrics.incr("ingest_caption_errors_total")
+                        log.warning("image_caption_failed", page=page_number + 1, error=str(e))
                         markdown_text += f"![{os.path.basename(normalized_image_path)}]({normalized_image_path})\n\n"
 
                 except Exception as e:
-                    print(f"Warning: Could not extract an image on page {page_number + 1}. Error: {e}")
+                    log.warning("image_extract_failed", page=page_number + 1, error=str(e))
+
+        if progress is not None:
+            progress(page_number + 1, len(doc))
 
     # Save the generated markdown to a file
-    output_md_path = os.path.join(output_dir, os.path.basename(pdf_path).replace(".pdf", ".md"))
+    output_md_path = markdown_path_for(pdf_path)
     
-    with open(output_md_path, "w", encoding="utf-8") as f:
+    # Written under a temporary name so an existing .md is always a complete conversion
+    tmp_md_path = output_md_path + ".tmp"
+    with open(tmp_md_path, "w", encoding="utf-8") as f:
         f.write(markdown_text)
+    os.replace(tmp_md_path, output_md_path)
     
     return output_md_path
 
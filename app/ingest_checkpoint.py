@@ -0,0 +1,115 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+
+import numpy as np
+
+from telemetry import log
+
+# Chunks summarized and embedded per checkpointed batch
+checkpoint_batch_size = int(os.environ.get("INGEST_CHECKPOINT_BATCH", "16"))
+
+# Held across the two renames of a publish and by readers opening the index, so a reader never
+# sees the gap between them and mistakes it for an interrupted publish
+index_swap_lock = threading.Lock()
+
+
+def text_sha256(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _write_atomic(path: str, write):
+    tmp_path = path + ".tmp"
+    write(tmp_path)
+    os.replace(tmp_path, path)
+
+
+# Per-batch summaries and vectors of one index build, kept in <faiss_db_path>.build until the
+# index is published. A build over different inputs or settings starts from scratch.
+class BuildCheckpoint:
+    def __init__(self, faiss_db_path: str, fingerprint: str):
+        self.dir = f"{faiss_db_path}.build"
+        self.fingerprint = fingerprint
+        manifest_path = os.path.join(self.dir, "manifest.json")
+
+        manifest = None
+        if os.path.exists(manifest_path):
+            try:
+                with open(manifest_path, "r", encoding="utf-8") as f:
+                    manifest = json.load(f)
+            except (OSError, ValueError):
+                manifest = None
+        if manifest is None or manifest.get("fingerprint") != fingerprint:
+            if os.path.exists(self.dir):
+                log.info("index_checkpoint_discarded", path=self.dir, reason="different inputs")
+                shutil.rmtree(self.dir)
+            os.makedirs(self.dir)
+            _write_atomic(manifest_path, lambda p: self._dump(p, {"fingerprint": fingerprint}))
+        else:
+            done = len([n for n in os.listdir(self.dir) if n.startswith("vectors-")])
+            log.info("index_build_resumed", path=self.dir, embedded_batches=done)
+
+    @staticmethod
+    def _dump(path: str, payload):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(payload, f)
+
+    def _path(self, kind: str, batch: int, ext: str) -> str:
+        return os.path.join(self.dir, f"{kind}-{batch:05d}.{ext}")
+
+    # Enriched chunk texts and metadata of a summarized batch, None if not done yet
+    def load_summaries(self, batch: int):
+        path = self._path("summaries", batch, "json")
+        if not os.path.exists(path):
+            return None
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def save_summaries(self, batch: int, chunks: list):
+        _write_atomic(self._path("summaries", batch, "json"), lambda p: self._dump(p, chunks))
+
+    def load_vectors(self, batch: int):
+        path = self._path("vectors", batch, "npy")
+        if not os.path.exists(path):
+            return None
+        return np.load(path)
+
+    def save_vectors(self, batch: int, vectors):
+        def write(tmp_path):
+            with open(tmp_path, "wb") as f:
+                np.save(f, np.asarray(vectors, dtype=np.float32))
+        _write_atomic(self._path("vectors", batch, "npy"), write)
+
+    def clear(self):
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+
+# Swap a fully written index directory into place; readers see the old index or the new one
+def publish_index(staged_path: str, faiss_db_path: str):
+    old_path = f"{faiss_db_path}.old"
+    with index_swap_lock:
+        if os.path.exists(old_path):
+            shutil.rmtree(old_path)
+        if os.path.exists(faiss_db_path):
+            os.rename(faiss_db_path, old_path)
+        os.rename(staged_path, faiss_db_path)
+    shutil.rmtree(old_path, ignore_errors=True)
+
+
+# load(faiss_db_path) with no publish in progress, or None when there is no index yet
+def load_index(faiss_db_path: str, load):
+    with index_swap_lock:
+        recover_index(faiss_db_path)
+        if not os.path.exists(faiss_db_path):
+            return None
+        return load(faiss_db_path)
+
+
+# Undo a publish that a crash interrupted between its two renames; caller holds index_swap_lock
+def recover_index(faiss_db_path: str):
+    old_path = f"{faiss_db_path}.old"
+    if not os.path.exists(faiss_db_path) and os.path.exists(old_path):
+        log.warning("index_publish_recovered", path=faiss_db_path)
+        os.rename(old_path, faiss_db_path)
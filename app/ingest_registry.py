@@ -0,0 +1,57 @@
+import json
+import os
+import threading
+import time
+
+from telemetry import log
+
+
+# Content hashes of ingested documents, kept next to the files so a database reset clears it
+class IngestRegistry:
+    def __init__(self, files_path: str = "files"):
+        self.path = os.path.join(files_path, ".ingested.json")
+        self._lock = threading.Lock()
+        # Hashes uploaded but not yet ingested, so concurrent uploads of one file are not both queued
+        self._pending = {}
+
+    def _load(self) -> dict:
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            log.warning("ingest_registry_unreadable", path=self.path, error=str(e))
+            return {}
+
+    # File name already holding this content, ingested or on its way
+    def lookup(self, sha256: str):
+        with self._lock:
+            if sha256 in self._pending:
+                return self._pending[sha256]
+            entry = self._load().get(sha256)
+            return entry["file_name"] if entry else None
+
+    def reserve(self, sha256: str, file_name: str) -> bool:
+        with self._lock:
+            if sha256 in self._pending or sha256 in self._load():
+                return False
+            self._pending[sha256] = file_name
+            return True
+
+    def release(self, sha256: str):
+        with self._lock:
+            self._pending.pop(sha256, None)
+
+    # Record finished documents and drop their reservations
+    def commit(self, documents: dict):
+        with self._lock:
+            entries = self._load()
+            for sha256, file_name in documents.items():
+                entries[sha256] = {"file_name": file_name, "ingested_at": time.time()}
+                self._pending.pop(sha256, None)
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(entries, f)
+            os.replace(tmp_path, self.path)
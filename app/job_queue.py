@@ -0,0 +1,202 @@
+import os
+import queue
+import threading
+import time
+import traceback
+import uuid
+
+from telemetry import log, metrics
+
+# Jobs running at once; ingestion jobs share the FAISS index so the default is one
+max_concurrent_jobs = int(os.environ.get("INGEST_MAX_CONCURRENT_JOBS", "1"))
+# Jobs waiting for a worker before new submissions are rejected
+max_queued_jobs = int(os.environ.get("INGEST_MAX_QUEUED_JOBS", "8"))
+# Finished jobs kept for the progress API
+job_history_size = 100
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class JobQueueFull(Exception):
+    def __init__(self, queued: int):
+        super().__init__(f"{queued} jobs already queued")
+        self.queued = queued
+
+
+# One background job with per-stage progress counters
+class Job:
+    def __init__(self, kind: str, fn, args, on_cancel=None):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.fn = fn
+        self.args = args
+        # Called with the job's args when it is cancelled before it starts, since fn never runs
+        self.on_cancel = on_cancel
+        self.status = "queued"
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.error = None
+        self.result = None
+        self.stages = {}
+        self.current_stage = None
+        self.rates = {}
+        self._cancel = threading.Event()
+        self._lock = threading.Lock()
+
+    def cancelled(self) -> bool:
+        return self._cancel.is_set()
+
+    # Called by the pipeline between units of work; raises once cancellation was requested
+    def check_cancelled(self):
+        if self._cancel.is_set():
+            raise JobCancelled(f"job {self.id} cancelled")
+
+    def progress(self, stage: str, done: int, total: int):
+        self.check_cancelled()
+        now = time.time()
+        with self._lock:
+            entry = self.stages.get(stage)
+            if entry is None:
+                entry = {"done": 0, "total": 0, "started": now, "updated": now}
+                self.stages[stage] = entry
+            entry["done"] = done
+            entry["total"] = total
+            entry["updated"] = now
+            self.current_stage = stage
+
+    # Remaining seconds per stage from its own rate so far, or the rate of earlier jobs
+    def _stage_eta(self, entry: dict, rate):
+        remaining = entry["total"] - entry["done"]
+        if remaining <= 0:
+            return 0.0
+        if entry["done"] > 0:
+            rate = (entry["updated"] - entry["started"]) / entry["done"]
+        if rate is None:
+            return None
+        return remaining * rate
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            stages = {}
+            eta = 0.0
+            for name, entry in self.stages.items():
+                stage_eta = self._stage_eta(entry, self.rates.get(name))
+                stages[name] = {
+                    "done": entry["done"],
+                    "total": entry["total"],
+                    "elapsed": round(entry["updated"] - entry["started"], 3),
+                    "eta_seconds": None if stage_eta is None else round(stage_eta, 1),
+                }
+                eta = None if eta is None or stage_eta is None else eta + stage_eta
+            end = self.finished or time.time()
+            return {
+                "job_id": self.id,
+                "kind": self.kind,
+                "status": self.status,
+                "stage": self.current_stage,
+                "stages": stages,
+                # Covers the stages reached so far; later stages are sized when they start
+                "eta_seconds": None if eta is None or self.status != "running" else round(eta, 1),
+                "queued_seconds": round((self.started or end) - self.created, 3),
+                "elapsed_seconds": round(end - self.started, 3) if self.started else 0.0,
+                "error": self.error,
+                "result": self.result,
+            }
+
+
+# Worker pool running submitted jobs with a concurrency limit, cancellation and history
+class JobQueue:
+    def __init__(self, workers: int = max_concurrent_jobs, max_queued: int = max_queued_jobs):
+        self.workers = workers
+        self.max_queued = max_queued
+        self._lock = threading.Lock()
+        self._pending = queue.Queue()
+        self._jobs = {}
+        self._order = []
+        self._threads = []
+        # Seconds per unit per stage from finished jobs, seeds the ETA of the next job
+        self._rates = {}
+
+    def submit(self, kind: str, fn, *args, on_cancel=None) -> Job:
+        with self._lock:
+            queued = sum(1 for job in self._jobs.values() if job.status == "queued")
+            if queued >= self.max_queued:
+                raise JobQueueFull(queued)
+            job = Job(kind, fn, args, on_cancel)
+            job.rates = dict(self._rates)
+            self._jobs[job.id] = job
+            self._order.append(job.id)
+            self._trim()
+            if len(self._threads) < self.workers:
+                thread = threading.Thread(target=self._worker, daemon=True)
+                self._threads.append(thread)
+                thread.start()
+        self._pending.put(job)
+        log.info("job_queued", job=job.id, kind=kind)
+        return job
+
+    def get(self, job_id: str):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list(self) -> list:
+        with self._lock:
+            jobs = [self._jobs[job_id] for job_id in self._order]
+        return [job.snapshot() for job in jobs]
+
+    # Queued jobs are cancelled at once, running jobs stop at their next progress check
+    def cancel(self, job_id: str) -> bool:
+        job = self.get(job_id)
+        if job is None or job.status not in ("queued", "running"):
+            return False
+        job._cancel.set()
+        with self._lock:
+            never_started = job.status == "queued"
+            if never_started:
+                job.status = "cancelled"
+                job.finished = time.time()
+        log.info("job_cancel_requested", job=job_id, queued=never_started)
+        if never_started and job.on_cancel is not None:
+            try:
+                job.on_cancel(*job.args)
+            except Exception as e:
+                log.error("job_cancel_cleanup_failed", job=job_id, error=str(e), traceback=traceback.format_exc())
+        return True
+
+    def _trim(self):
+        finished = [job_id for job_id in self._order if self._jobs[job_id].finished]
+        for job_id in finished[:max(0, len(finished) - job_history_size)]:
+            self._order.remove(job_id)
+            del self._jobs[job_id]
+
+    def _worker(self):
+        while True:
+            job = self._pending.get()
+            with self._lock:
+                if job.status != "queued":
+                    continue
+                job.status = "running"
+                job.started = time.time()
+
+            try:
+                job.result = job.fn(job, *job.args)
+                job.status = "succeeded"
+            except JobCancelled:
+                job.status = "cancelled"
+            except Exception as e:
+                job.status = "failed"
+                job.error = str(e)
+                log.error("job_failed", job=job.id, kind=job.kind, error=str(e), traceback=traceback.format_exc())
+            job.finished = time.time()
+            metrics.incr(f"jobs_{job.status}_total")
+            log.info("job_finished", job=job.id, kind=job.kind, status=job.status,
+                     seconds=round(job.finished - job.started, 3))
+
+            if job.status == "succeeded":
+                with self._lock:
+                    for name, entry in job.stages.items():
+                        if entry["done"] > 0:
+                            self._rates[name] = (entry["updated"] - entry["started"]) / entry["done"]
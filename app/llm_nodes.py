@@ -4,15 +4,30 @@ from langchain_core.output_parsers import JsonOutputParser, StrOutputParser
 from typing import List, Tuple, Dict, Any
 from langchain_community.llms import Ollama
 from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.runnables import RunnableLambda
 import pandas as pd
 import json
+import os
+import requests
+from llm_scheduler import keep_alive, ollama_base_url
+from prompt_layout import shared_context_prefix, layout_inputs
+from dataset_profile import profile_columns, format_dtypes, format_column_values
 
 # Model configuration
 model = "llama3.2:latest"
 
+# Continue follow-up turns from the context Ollama returned for the previous turn
+reuse_ollama_context = os.environ.get("OLLAMA_REUSE_CONTEXT", "1") == "1"
+# Past this many context tokens the full prompt is rebuilt from the compacted history
+context_reuse_max_tokens = int(os.environ.get("OLLAMA_CONTEXT_REUSE_MAX_TOKENS", "4096"))
+# Rows of a result table shown to the model in the analysis prompt
+analysis_result_rows = int(os.environ.get("DA_ANALYSIS_RESULT_ROWS", "50"))
+
 # LLM instance
 llm_str = ChatOllama(
     model=model,
+    base_url=ollama_base_url,
+    keep_alive=keep_alive,
     temperature=0,
     num_predict=2000,
     streaming=True
@@ -20,56 +35,53 @@ llm_str = ChatOllama(
 
 # QUESTION ANALYSIS COMPONENTS
 
+# Prompts below open with shared_context_prefix and only differ after the Knowledge Base,
+# so its fixed instructions are cached across requests and the rest within a request
+
 # Main response generator (text-only)
 generator_prompt = PromptTemplate(
-    template="""You are an expert assistant trained to answer questions using the provided documents.
-    You provide comprehensive technical guidance based on the uploaded documentation and context. Your answers
-    should rely only on the content and context of this unless explicitly instructed otherwise. If the user's
-    question falls outside the document's scope, politely inform them that the information is not covered. Never provide code or command line instructions.
-
-    Your task is to answer the user's question based on the provided "Knowledge Base".
+    template=shared_context_prefix + """Your task is to answer the user's question based on the Knowledge Base above.
 
     Provide a detailed, comprehensive answer to the user's question. Be direct, comprehensive, thorough, and accurate.
     Provide a complete answer without preamble or closing remarks. Just provide the answer as plain text.
 
-    Conversation Context: {conversation_history}
+    Question: {question}
+
+    Answer:""",
+    input_variables=["conversation_history", "document", "question"]
+)
+generator = RunnableLambda(layout_inputs) | generator_prompt | llm_str | StrOutputParser()
 
-    Knowledge Base: {document}
+# Follow-up turn appended to a reused Ollama context, which already holds the instructions and earlier turns
+followup_prompt = PromptTemplate(
+    template="""Knowledge Base:
+    {document}
+
+    Using the Knowledge Base above and our conversation so far, answer the next question with the same rules as before.
 
     Question: {question}
 
     Answer:""",
-    input_variables=["conversation_history", "document", "question"]
+    input_variables=["document", "question"]
 )
-generator = generator_prompt | llm_str | StrOutputParser()
 
 # Hallucination detection component
 hallucination_prompt = PromptTemplate(
-    template="""Evaluate whether the Answer is mentioned in either the "Documents" OR the "Conversation Context". The answer can be found separated between the Documents or Conversation Context, they do not need to be found together. 
+    template=shared_context_prefix + """Evaluate whether the Answer is mentioned in either the Knowledge Base OR the Conversation Context above. The answer can be found separated between the Knowledge Base or Conversation Context, they do not need to be found together.
 
-    Documents: {documents}
-
-    Conversation Context: {conversation_history}
+    Score 'no' if it contains claims not mentioned in or contradictions from either the provided Knowledge Base or Conversation Context.
+    Else Score 'yes'.
 
     Answer to evaluate: {generation}
 
-    Score 'no' if it contains claims not mentioned in or contradictions from either the provided Documents or Conversation Context.
-    Else Score 'yes'.
-
     {{"score": "yes"}} or {{"score": "no"}}""",
-    input_variables=["generation", "documents", "conversation_history"],
+    input_variables=["conversation_history", "document", "generation"],
 )
-hallucination_grader = hallucination_prompt | llm_str | StrOutputParser()
+hallucination_grader = RunnableLambda(layout_inputs) | hallucination_prompt | llm_str | StrOutputParser()
 
 # Answer quality evaluation component
 answer_prompt = PromptTemplate(
-    template="""Does this answer adequately address the question? If the conversation context is relevant, consider it.
-
-    Answer to evaluate: {generation}
-
-    Conversation context: {conversation_history}
-
-    Question: {question}
+    template=shared_context_prefix + """Does the answer below adequately address the question? If the conversation context is relevant, consider it.
 
     Score 'yes' if the answer:
     - Provides relevant detail
@@ -77,10 +89,14 @@ answer_prompt = PromptTemplate(
 
     Score 'no' if off-topic.
 
+    Question: {question}
+
+    Answer to evaluate: {generation}
+
     {{"score": "yes"}} or {{"score": "no"}}""",
-    input_variables=["generation", "question", "conversation_history"],
+    input_variables=["conversation_history", "document", "question", "generation"],
 )
-answer_grader = answer_prompt | llm_str | StrOutputParser()
+answer_grader = RunnableLambda(layout_inputs) | answer_prompt | llm_str | StrOutputParser()
 
 # Query rewriting component
 rewrite_prompt = PromptTemplate(
@@ -93,6 +109,55 @@ rewrite_prompt = PromptTemplate(
 )
 question_rewriter = rewrite_prompt | llm_str | StrOutputParser()
 
+# Conversation compaction component
+history_summary_prompt = PromptTemplate(
+    template="""Summarize this conversation between a user and an assistant so it can replace the full transcript as context for later questions.
+    Keep names, numbers, decisions and open questions. Do not add anything that was not said.
+
+    Earlier Summary: {summary}
+
+    New Turns: {turns}
+
+    Summary:""",
+    input_variables=["summary", "turns"],
+)
+history_summarizer = history_summary_prompt | llm_str | StrOutputParser()
+
+# Stream a generator answer through /api/generate, continuing from a previous turn's context
+# when given one. Ollama's final context and prefill stats are written into result.
+def stream_generation(inputs: dict, context: List[int] = None, result: Dict = None):
+    laid_out = layout_inputs(inputs)
+    if context:
+        prompt = followup_prompt.format(document=laid_out["document"], question=laid_out["question"])
+    else:
+        prompt = generator_prompt.format(**laid_out)
+
+    payload = {
+        "model": model,
+        "prompt": prompt,
+        "stream": True,
+        "keep_alive": keep_alive,
+        "options": {"temperature": 0, "num_predict": 2000}
+    }
+    if context:
+        payload["context"] = context
+
+    with requests.post(f"{ollama_base_url}/api/generate", json=payload, stream=True, timeout=300) as response:
+        response.raise_for_status()
+        for line in response.iter_lines():
+            if not line:
+                continue
+            data = json.loads(line)
+            if data.get("response"):
+                yield data["response"]
+            if data.get("done") and result is not None:
+                result.update({
+                    "context": data.get("context"),
+                    "prompt_eval_count": data.get("prompt_eval_count", 0),
+                    "prompt_eval_duration": data.get("prompt_eval_duration", 0) / 1e9,
+                    "usage": data,
+                })
+
 
 # DATA ANALYSIS COMPONENTS
 
@@ -118,22 +183,17 @@ def create_planning_prompt(question: str, columns: List[str], df_info: str) -> s
     prompt = planning_prompt.format(question=question, columns=columns, df_info=df_info)
     return prompt
 
-# Function to create code generation prompt
-def create_da_code_prompt(data_file_path: str, df_shape: tuple, df_columns: list, user_question: str, plan_steps: str, df_info: dict) -> str:
-    # Get unique values for each column (up to 10)
-    df = pd.read_csv(data_file_path)
-    column_values = {}
-    for column in df_columns:
-        unique_values = df[column].dropna().unique()
-        column_values[column] = unique_values[:10].tolist()
-    
-    # Convert column values to a readable string
-    column_values_str = "\n".join([
-        f"{col}: {vals}" for col, vals in column_values.items()
-    ])
+# Function to create code generation prompt, schema details come from the precomputed dataset profile
+# or, when given, from a relevance-pruned schema selection
+def schema_sections(profile: dict, schema: dict = None):
+    if schema is None:
+        # Unique values (up to 10) and dtypes were collected once per dataset version
+        return profile_columns(profile), format_column_values(profile), format_dtypes(profile)
+    return "\n" + schema["columns_text"], schema["values_text"], schema["dtypes_text"]
 
-    df_info_serializable = {col: str(dtype) for col, dtype in df_info.items()}
-    df_info_string = json.dumps(df_info_serializable)
+def create_da_code_prompt(data_file_path: str, profile: dict, user_question: str, plan_steps: str, schema: dict = None) -> str:
+    df_shape = tuple(profile["shape"])
+    df_columns, column_values_str, df_info_string = schema_sections(profile, schema)
 
     prompt = f"""
     You are a Python data analysis expert. Given a DataFrame 'df', a question, and a specific step from a data analysis plan, write Python code to execute that step.
@@ -159,7 +219,7 @@ def create_da_code_prompt(data_file_path: str, df_shape: tuple, df_columns: list
     2. Available libraries: pandas (pd), numpy (np), matplotlib.pyplot (plt), seaborn (sns).
     3. Only return executable Python code. No explanations or markdown.
     4. DO NOT USE code marks such as ```. 
-    5. Print the final response. If it is a dataframe, print df.to_string().
+    5. Assign the final answer to a variable named result (a DataFrame, Series, numpy array or single value). Do not print large tables.
     6. Do not use any libraries or attributes that are not explicitly allowed. For example, do not use attributes like .total_seconds() or .to_datetime()
 
     **NEVER CREATE YOUR OWN DATAFRAME. NO SYNTHETIC OR EXAMPLE DATA.**
@@ -169,10 +229,76 @@ def create_da_code_prompt(data_file_path: str, df_shape: tuple, df_columns: list
     """
     return prompt
 
-# Function to create analysis prompt
-def create_da_analysis_prompt(user_question: str, result, plan: str, df: pd.DataFrame) -> str:
-    print(f"result: {result}")
+# Function to create the SQL prompt for the DuckDB backend, the dataset is the table 'data'
+def create_da_sql_prompt(profile: dict, user_question: str, plan_steps: str, schema: dict = None) -> str:
+    df_columns, column_values_str, df_info_string = schema_sections(profile, schema)
+
+    prompt = f"""
+    You are a SQL data analysis expert. Given a table named data, a question, and a data analysis plan, write one DuckDB SQL query that answers the question.
+
+    Table Info:
+    - Rows: {profile["shape"][0]}
+    - Columns: {df_columns}
+    
+    Unique Column Values (up to 10 per column):
+    {column_values_str}
+
+    Column Types (pandas dtypes):
+    {df_info_string}
+
+    User Question: {user_question}
+
+    Plan Steps:
+    {plan_steps}
+
+    Requirements:
+    1. Query the table data. Quote column names with double quotes.
+    2. Return exactly one SELECT (or WITH ... SELECT) statement. No explanations or markdown.
+    3. DO NOT USE code marks such as ```.
+    4. Aggregate in SQL; return only the rows needed to answer the question.
+    """
+    return prompt
 
+# Function to create the fused prompt: one JSON answer carrying both the plan steps and the code
+def create_da_plan_and_code_prompt(data_file_path: str, profile: dict, user_question: str, schema: dict = None) -> str:
+    df_shape = tuple(profile["shape"])
+    df_columns, column_values_str, df_info_string = schema_sections(profile, schema)
+
+    prompt = f"""
+    You are a Python data analysis expert. Given a DataFrame 'df' and a question, plan the analysis and write the Python code that carries it out.
+
+    DataFrame Info:
+    - Data: {data_file_path}
+    - Shape: {df_shape}
+    - Columns: {df_columns}
+    
+    Unique Column Values (up to 10 per column):
+    {column_values_str}
+
+    DataFrame Columns and Types:
+    {df_info_string}
+
+    User Question: {user_question}
+
+    Respond with a JSON object with exactly two keys:
+    - "plan": a list of short analysis steps, as strings.
+    - "code": the Python code implementing the plan, as a single string.
+
+    Code requirements:
+    1. Use 'df' for the DataFrame.
+    2. Available libraries: pandas (pd), numpy (np), matplotlib.pyplot (plt), seaborn (sns).
+    3. Assign the final answer to a variable named result (a DataFrame, Series, numpy array or single value). Do not print large tables.
+    4. Do not use any libraries or attributes that are not explicitly allowed. For example, do not use attributes like .total_seconds() or .to_datetime()
+
+    **NEVER CREATE YOUR OWN DATAFRAME. NO SYNTHETIC OR EXAMPLE DATA.**
+
+    **ASSUME THAT THE DATA IS STORED IN A VARIABLE CALLED data**
+
+    """
+    return prompt
+
+# Function to create analysis prompt
+def create_da_analysis_prompt(user_question: str, result, plan: str, columns: List[str]) -> str:
     output = result['output']
 
     context = f"Original Question: {user_question}\n"
@@ -180,10 +306,15 @@ def create_da_analysis_prompt(user_question: str, result, plan: str, df: pd.Data
     
     if output:
         context += f"Text Output:\n{output}\n"
-    else:
+    if result.get('dataframe') is not None:
+        frame = result['dataframe']
+        context += f"Result ({frame.shape[0]} rows x {frame.shape[1]} columns):\n{frame.head(analysis_result_rows).to_string()}\n"
+    elif result.get('value') is not None:
+        context += f"Result: {result['value']}\n"
+    elif not output:
         context += "No output.\n"
     
-    columns_string = ", ".join(df.columns.tolist())
+    columns_string = ", ".join(columns)
     
     return f"""
     You are a data analysis expert. Keep the values raw and analyze the provided data objectively. The data comes from various sources and may include performance metrics, system traces, or other analytical information. Analyze the following results and provide a concise and comprehensive explanation on how this information is valuable. Focus on patterns, anomalies, and actionable insights. DO NOT SHOW CODE.
@@ -0,0 +1,313 @@
+import contextvars
+import itertools
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from tracing import Span, span, current_span, OllamaUsageHandler
+
+# Priority classes, lower value is served first
+PRIORITY_INTERACTIVE = 0
+PRIORITY_INGESTION = 1
+
+# Scheduler configuration
+max_inflight = int(os.environ.get("OLLAMA_MAX_INFLIGHT", "2"))
+max_queue = int(os.environ.get("OLLAMA_MAX_QUEUE", "16"))
+# Waiting longer than this promotes a ticket to interactive priority so ingestion never starves
+aging_seconds = float(os.environ.get("OLLAMA_QUEUE_AGING_SECONDS", "30"))
+
+# Model residency configuration
+ollama_base_url = os.environ.get("OLLAMA_BASE_URL", "http://localhost:11434")
+keep_alive = os.environ.get("OLLAMA_KEEP_ALIVE", "30m")
+# Mirrors OLLAMA_MAX_LOADED_MODELS on the server, how many models fit in memory at once
+max_loaded_models = int(os.environ.get("OLLAMA_MAX_LOADED_MODELS", "1"))
+# How many times a waiting call may be bypassed in favour of an already loaded model
+max_affinity_skips = int(os.environ.get("OLLAMA_MAX_AFFINITY_SKIPS", "4"))
+# Ollama reports a load_duration on every response; above this it really loaded the weights
+model_load_threshold = float(os.environ.get("OLLAMA_MODEL_LOAD_THRESHOLD_SECONDS", "0.5"))
+
+# Per-request model load accounting, set by the caller that owns the request
+request_stats = contextvars.ContextVar("request_stats", default=None)
+
+
+# Raised when the wait queue is full and a new LLM call cannot be admitted
+class SchedulerSaturated(Exception):
+    def __init__(self, queued: int):
+        super().__init__(f"llm queue is full ({queued} requests waiting)")
+        self.queued = queued
+
+
+# A single queued or running LLM call
+class Ticket:
+    def __init__(self, scheduler, priority: int, seq: int, model: str = None, stats: dict = None):
+        self.scheduler = scheduler
+        self.priority = priority
+        self.seq = seq
+        self.model = model
+        self.stats = stats
+        self.skips = 0
+        self.loaded_model = False
+        self.enqueued_at = time.time()
+        self.admitted_at = None
+        self.released = False
+
+    def effective_priority(self, now: float) -> int:
+        if now - self.enqueued_at >= aging_seconds:
+            return PRIORITY_INTERACTIVE
+        return self.priority
+
+    # Block until admitted or timeout, returns True once the call may run
+    def wait(self, timeout: float = None) -> bool:
+        return self.scheduler._wait(self, timeout)
+
+    # 1-based position in the wait queue, 0 once admitted
+    def position(self) -> int:
+        return self.scheduler._position(self)
+
+    def release(self):
+        self.scheduler._release(self)
+
+    # Count a model load when Ollama's load_duration (seconds) shows the call paid for one
+    def record_load(self, load_seconds: float):
+        if load_seconds is not None and load_seconds >= model_load_threshold:
+            self.scheduler._record_load(self)
+
+
+# Bounded priority scheduler for calls into the single Ollama host
+class LLMScheduler:
+    def __init__(self, max_inflight: int = max_inflight, max_queue: int = max_queue):
+        self.max_inflight = max_inflight
+        self.max_queue = max_queue
+        self._cond = threading.Condition()
+        self._waiting = []
+        self._inflight = 0
+        self._seq = itertools.count()
+        self._wait_samples = []
+        # Most recently used models, oldest first, capped at max_loaded_models
+        self._resident = OrderedDict()
+        # Admitted calls per model, a model with calls running is never swapped out
+        self._running = {}
+        self._model_loads = {}
+        self._metrics = {
+            "admitted_total": 0,
+            "rejected_total": 0,
+            "abandoned_total": 0,
+            "model_loads_total": 0,
+            "queue_wait_seconds_total": 0.0,
+            "queue_wait_seconds_max": 0.0,
+        }
+
+    # Register a call; raises SchedulerSaturated when nothing can be queued
+    def enqueue(self, priority: int = PRIORITY_INTERACTIVE, model: str = None) -> Ticket:
+        with self._cond:
+            if self._inflight >= self.max_inflight and len(self._waiting) >= self.max_queue:
+                self._metrics["rejected_total"] += 1
+                raise SchedulerSaturated(len(self._waiting))
+            ticket = Ticket(self, priority, next(self._seq), model, request_stats.get())
+            self._waiting.append(ticket)
+            self._dispatch()
+            return ticket
+
+    # Context manager wrapping one LLM call
+    @contextmanager
+    def slot(self, priority: int = PRIORITY_INTERACTIVE, model: str = None):
+        ticket = self.enqueue(priority, model)
+        try:
+            ticket.wait()
+            yield ticket
+        finally:
+            ticket.release()
+
+    def is_saturated(self) -> bool:
+        with self._cond:
+            return self._inflight >= self.max_inflight and len(self._waiting) >= self.max_queue
+
+    # Reject up front when a new call could not be queued, for responses that cannot report it later
+    def check_capacity(self):
+        with self._cond:
+            if self._inflight >= self.max_inflight and len(self._waiting) >= self.max_queue:
+                self._metrics["rejected_total"] += 1
+                raise SchedulerSaturated(len(self._waiting))
+
+    def _order(self, now: float):
+        return sorted(self._waiting, key=lambda t: (t.effective_priority(now), t.seq))
+
+    # A call may start without evicting a model that other calls are still using
+    def _admissible(self, ticket: Ticket) -> bool:
+        if ticket.model is None or ticket.model in self._resident:
+            return True
+        return len(self._running) < max_loaded_models
+
+    # Pick the next ticket, or None to hold admission until running calls finish. A resident model
+    # is preferred within the best priority class; a call that would force a swap waits for the
+    # other models to drain, and once it has been bypassed max_affinity_skips times nothing
+    # else is admitted ahead of it.
+    def _next_ticket(self, now: float):
+        ordered = self._order(now)
+        head = ordered[0]
+        admissible = self._admissible(head)
+        if head.model is None or head.model in self._resident or head.skips >= max_affinity_skips:
+            return head if admissible else None
+        best_priority = head.effective_priority(now)
+        for ticket in ordered[1:]:
+            if admissible and ticket.effective_priority(now) != best_priority:
+                break
+            if ticket.model in self._resident or (not admissible and ticket.model is None):
+                head.skips += 1
+                return ticket
+        return head if admissible else None
+
+    # Track which models Ollama holds in memory; a load evicts the least recently used idle model
+    def _touch_model(self, ticket: Ticket):
+        model = ticket.model
+        if model is None:
+            return
+        self._running[model] = self._running.get(model, 0) + 1
+        if model in self._resident:
+            self._resident.move_to_end(model)
+            return
+        self._resident[model] = True
+        ticket.loaded_model = True
+        for resident in list(self._resident):
+            if len(self._resident) <= max_loaded_models:
+                break
+            if resident not in self._running:
+                del self._resident[resident]
+
+    def _record_load(self, ticket: Ticket):
+        with self._cond:
+            self._metrics["model_loads_total"] += 1
+            self._model_loads[ticket.model] = self._model_loads.get(ticket.model, 0) + 1
+        if ticket.stats is not None:
+            ticket.stats["model_loads"] = ticket.stats.get("model_loads", 0) + 1
+            ticket.stats.setdefault("models_loaded", []).append(ticket.model)
+
+    # Admit waiting tickets while there is capacity, caller holds the lock
+    def _dispatch(self):
+        now = time.time()
+        while self._waiting and self._inflight < self.max_inflight:
+            ticket = self._next_ticket(now)
+            if ticket is None:
+                break
+            self._waiting.remove(ticket)
+            ticket.admitted_at = now
+            self._inflight += 1
+            self._touch_model(ticket)
+            self._record_wait(now - ticket.enqueued_at)
+        self._cond.notify_all()
+
+    def _record_wait(self, waited: float):
+        self._metrics["admitted_total"] += 1
+        self._metrics["queue_wait_seconds_total"] += waited
+        self._metrics["queue_wait_seconds_max"] = max(self._metrics["queue_wait_seconds_max"], waited)
+        self._wait_samples.append(waited)
+        if len(self._wait_samples) > 1000:
+            del self._wait_samples[:500]
+
+    def _wait(self, ticket: Ticket, timeout: float = None) -> bool:
+        deadline = None if timeout is None else time.time() + timeout
+        with self._cond:
+            while ticket.admitted_at is None:
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+            return True
+
+    def _position(self, ticket: Ticket) -> int:
+        with self._cond:
+            if ticket.admitted_at is not None:
+                return 0
+            return self._order(time.time()).index(ticket) + 1
+
+    def _release(self, ticket: Ticket):
+        with self._cond:
+            if ticket.released:
+                return
+            ticket.released = True
+            if ticket.admitted_at is None:
+                self._waiting.remove(ticket)
+                self._metrics["abandoned_total"] += 1
+            else:
+                self._inflight -= 1
+                if ticket.model is not None:
+                    self._running[ticket.model] -= 1
+                    if not self._running[ticket.model]:
+                        del self._running[ticket.model]
+            self._dispatch()
+
+    # Snapshot of queue state and wait-time statistics
+    def metrics(self) -> dict:
+        with self._cond:
+            samples = sorted(self._wait_samples)
+            queued = {"interactive": 0, "ingestion": 0}
+            for ticket in self._waiting:
+                queued["interactive" if ticket.priority == PRIORITY_INTERACTIVE else "ingestion"] += 1
+
+            def percentile(p):
+                if not samples:
+                    return 0.0
+                return samples[min(len(samples) - 1, int(p * len(samples)))]
+
+            return {
+                **self._metrics,
+                "model_loads": dict(self._model_loads),
+                "resident_models": list(self._resident),
+                "inflight": self._inflight,
+                "max_inflight": self.max_inflight,
+                "max_queue": self.max_queue,
+                "queued": queued,
+                "queue_wait_seconds_p50": percentile(0.50),
+                "queue_wait_seconds_p95": percentile(0.95),
+            }
+
+
+# Process-wide scheduler shared by the QA graph, summarizer and DA agent
+llm_scheduler = LLMScheduler()
+
+
+# Run runnable.invoke inside a scheduler slot
+def scheduled_invoke(runnable, inputs, priority: int = PRIORITY_INTERACTIVE, model: str = None):
+    with span("llm", model=model) as llm_span:
+        with llm_scheduler.slot(priority, model) as ticket:
+            llm_span.set(queue_wait=round(ticket.admitted_at - ticket.enqueued_at, 6))
+            result = runnable.invoke(inputs, config={"callbacks": [OllamaUsageHandler(llm_span)]})
+            ticket.record_load(llm_span.attrs.get("load_duration"))
+            return result
+
+
+# Run runnable.stream, holding the slot until the stream is exhausted or closed. The span is
+# not made current, the generator's body runs interleaved with its consumer.
+def scheduled_stream(runnable, inputs, priority: int = PRIORITY_INTERACTIVE, model: str = None):
+    llm_span = Span("llm", current_span.get(), model=model, stream=True)
+    try:
+        with llm_scheduler.slot(priority, model) as ticket:
+            llm_span.set(queue_wait=round(ticket.admitted_at - ticket.enqueued_at, 6))
+            for chunk in runnable.stream(inputs, config={"callbacks": [OllamaUsageHandler(llm_span)]}):
+                yield chunk
+            ticket.record_load(llm_span.attrs.get("load_duration"))
+    finally:
+        llm_span.end()
+
+
+# Start per-request model load accounting in the current context
+def start_request_stats() -> dict:
+    stats = {"model_loads": 0, "models_loaded": []}
+    request_stats.set(stats)
+    return stats
+
+
+# Load a model ahead of the first request and pin it with keep_alive
+def warm_up(model: str, priority: int = PRIORITY_INGESTION):
+    import requests
+
+    with llm_scheduler.slot(priority, model) as ticket:
+        # An empty prompt makes Ollama load the weights without generating
+        response = requests.post(
+            f"{ollama_base_url}/api/generate",
+            json={"model": model, "prompt": "", "keep_alive": keep_alive},
+            timeout=300
+        )
+        response.raise_for_status()
+        ticket.record_load((response.json().get("load_duration") or 0) / 1e9)
@@ -5,7 +5,8 @@ import time
 from enhanced_pdf_to_md import pdf_to_markdown
 from chunks import create_retriever
 from qa_graph import build_graph as build_qa_graph
-from da_graph import build_da_graph
+from da_graph import get_da_graph
+from dataset_store import resolve_data_file
 import pandas as pd
 import re
 import json
@@ -418,7 +419,7 @@ elif st.session_state.app_mode == "Advanced Data Analysis":
     if "analysis_messages" not in st.session_state:
         st.session_state.analysis_messages = []
 
-    data_file_path = "files/clean_data.csv"
+    data_file_path = resolve_data_file("files/clean_data.csv")
 
     if os.path.exists(data_file_path):
         # Display chat history
@@ -444,7 +445,7 @@ elif st.session_state.app_mode == "Advanced Data Analysis":
                     start_time = time.time()
                     
                     try:
-                        app = build_da_graph(data_file_path)
+                        app = get_da_graph(data_file_path)
                         
                         inputs = {"question": prompt}
                         
@@ -0,0 +1,76 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+from single_flight import normalize_question
+from telemetry import log
+
+# Cached plans live next to the dataset they were generated for
+cache_dir_name = ".plan_cache"
+plan_cache_enabled = os.environ.get("DA_PLAN_CACHE", "1") == "1"
+
+
+# Hash of column names and dtypes only, so daily refreshes with the same schema keep their entries
+def schema_hash(profile: dict) -> str:
+    payload = json.dumps([[c["name"], c["dtype"]] for c in profile["columns"]])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def plan_key(question: str, profile: dict) -> str:
+    payload = json.dumps({"question": normalize_question(question), "schema": schema_hash(profile)})
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+# Disk-backed plan and code cache keyed by question and dataset schema
+class PlanCache:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.metrics = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+
+    def _path(self, data_file_path: str, key: str) -> str:
+        return os.path.join(os.path.dirname(os.path.abspath(data_file_path)), cache_dir_name, f"{key}.json")
+
+    def get(self, data_file_path: str, question: str, profile: dict):
+        if not plan_cache_enabled:
+            return None
+        path = self._path(data_file_path, plan_key(question, profile))
+        entry = None
+        if os.path.exists(path):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    entry = json.load(f)
+            except (OSError, ValueError) as e:
+                log.warning("plan_cache_unreadable", path=path, error=str(e))
+        with self._lock:
+            self.metrics["hits" if entry else "misses"] += 1
+        return entry
+
+    def put(self, data_file_path: str, question: str, profile: dict, plan: str, code: str, schema: dict, language: str = "python"):
+        if not plan_cache_enabled:
+            return
+        path = self._path(data_file_path, plan_key(question, profile))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        entry = {"question": question, "plan": plan, "code": code, "language": language, "schema": schema, "created": time.time()}
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(entry, f, default=str)
+        os.replace(tmp_path, path)
+        with self._lock:
+            self.metrics["stores"] += 1
+
+    # Drop an entry whose code no longer runs against the current data
+    def evict(self, data_file_path: str, question: str, profile: dict):
+        path = self._path(data_file_path, plan_key(question, profile))
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            return
+        with self._lock:
+            self.metrics["evictions"] += 1
+        log.info("plan_cache_evicted", question_chars=len(question))
+
+
+# Process-wide cache used by the DA graph
+plan_cache = PlanCache()
@@ -0,0 +1,208 @@
+import contextvars
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from functools import wraps
+
+from telemetry import log, metrics
+
+# Folded-stack profiles are written here, one file per profiled request
+profile_dir = os.environ.get("PROFILE_DIR", "profiles")
+# Seconds between stack samples
+profile_interval = float(os.environ.get("PROFILE_INTERVAL_MS", "5")) / 1000
+# A profile stops sampling after this long even if the request is still streaming
+profile_max_seconds = float(os.environ.get("PROFILE_MAX_SECONDS", "120"))
+# Profiles kept on disk, oldest are removed first
+profile_keep = int(os.environ.get("PROFILE_KEEP", "200"))
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+# Root-first stack of one thread, in the folded format flamegraph tools read
+def fold_stack(frame) -> str:
+    labels = []
+    while frame is not None:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    return ";".join(reversed(labels))
+
+
+# Profiled request of the current context, read when work for it is handed to another thread
+current_profile = contextvars.ContextVar("current_profile", default=None)
+
+
+# Samples of one request. Work for a request hops between the event loop, threadpool and
+# producer threads, so only threads attached to it are sampled, with the thread name as root frame.
+class ProfileSession:
+    def __init__(self, label: str):
+        self.id = uuid.uuid4().hex[:12]
+        self.label = label
+        self.samples = Counter()
+        self.threads = Counter()
+        self.started = time.time()
+        self.duration = None
+        self._lock = threading.Lock()
+
+    # Nested attaches of one thread are counted, it stays sampled until the outermost detach
+    def attach(self, ident: int):
+        with self._lock:
+            self.threads[ident] += 1
+
+    def detach(self, ident: int):
+        with self._lock:
+            self.threads[ident] -= 1
+            if self.threads[ident] <= 0:
+                del self.threads[ident]
+
+    def record(self, frames: dict, names: dict):
+        with self._lock:
+            if self.duration is not None or time.time() - self.started > profile_max_seconds:
+                return
+            for ident in self.threads:
+                frame = frames.get(ident)
+                if frame is not None:
+                    self.samples[f"{names.get(ident, ident)};{fold_stack(frame)}"] += 1
+
+    def stop(self):
+        with self._lock:
+            self.duration = time.time() - self.started
+
+    def folded(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.samples.most_common())
+
+
+# Wrap fn so the thread running it is sampled for the profiled request of the current context
+def profiled(fn):
+    session = current_profile.get()
+    if session is None:
+        return fn
+
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        ident = threading.get_ident()
+        session.attach(ident)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            session.detach(ident)
+    return wrapper
+
+
+# Admin-armed profiler: the next N requests, or requests carrying a matching header
+class RequestProfiler:
+    def __init__(self, output_dir: str = profile_dir, interval: float = profile_interval):
+        self.output_dir = output_dir
+        self.interval = interval
+        self.remaining = 0
+        self.header = None
+        self.header_value = None
+        self.armed = False
+        self._lock = threading.Lock()
+        # One sampler thread serves every profiled request, it exits when none are left
+        self._sessions = []
+        self._sampler = None
+
+    def arm(self, requests: int = 0, header: str = None, header_value: str = "1", interval_ms: float = None):
+        with self._lock:
+            self.remaining = max(0, requests)
+            self.header = header.lower() if header else None
+            self.header_value = header_value
+            if interval_ms:
+                self.interval = interval_ms / 1000
+            self.armed = self.remaining > 0 or self.header is not None
+
+    def disarm(self):
+        self.arm(0, None)
+
+    # Called for every request; a single attribute check while disarmed
+    def should_profile(self, headers) -> bool:
+        if not self.armed:
+            return False
+        with self._lock:
+            if self.header is not None and headers.get(self.header) == self.header_value:
+                return True
+            if self.remaining > 0:
+                self.remaining -= 1
+                self.armed = self.remaining > 0 or self.header is not None
+                return True
+        return False
+
+    def start(self, label: str) -> ProfileSession:
+        session = ProfileSession(label)
+        with self._lock:
+            self._sessions.append(session)
+            if self._sampler is None:
+                self._sampler = threading.Thread(target=self._sample, name="profiler", daemon=True)
+                self._sampler.start()
+        return session
+
+    def _sample(self):
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                if not self._sessions:
+                    self._sampler = None
+                    return
+                sessions = list(self._sessions)
+            frames = sys._current_frames()
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for session in sessions:
+                session.record(frames, names)
+
+    def finish(self, session: ProfileSession) -> str:
+        session.stop()
+        with self._lock:
+            self._sessions.remove(session)
+        os.makedirs(self.output_dir, exist_ok=True)
+        safe_label = "".join(c if c.isalnum() else "_" for c in session.label).strip("_")
+        path = os.path.join(self.output_dir, f"{int(session.started)}-{session.id}-{safe_label}.folded")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(session.folded())
+        self._prune()
+        metrics.incr("profiled_requests_total")
+        log.info("request_profiled", label=session.label, seconds=round(session.duration, 3),
+                 samples=sum(session.samples.values()), path=path)
+        return path
+
+    def _prune(self):
+        profiles = sorted(self.list_profiles(), key=lambda p: p["created"])
+        for profile in profiles[:max(0, len(profiles) - profile_keep)]:
+            os.remove(os.path.join(self.output_dir, profile["file"]))
+
+    def list_profiles(self) -> list:
+        if not os.path.exists(self.output_dir):
+            return []
+        profiles = []
+        for name in os.listdir(self.output_dir):
+            if not name.endswith(".folded"):
+                continue
+            path = os.path.join(self.output_dir, name)
+            profiles.append({"id": name.split("-")[1], "file": name, "created": os.path.getmtime(path),
+                             "bytes": os.path.getsize(path)})
+        return sorted(profiles, key=lambda p: p["created"], reverse=True)
+
+    def read(self, profile_id: str):
+        for profile in self.list_profiles():
+            if profile["id"] == profile_id:
+                with open(os.path.join(self.output_dir, profile["file"]), "r", encoding="utf-8") as f:
+                    return f.read()
+        return None
+
+    def status(self) -> dict:
+        with self._lock:
+            return {
+                "armed": self.armed,
+                "remaining_requests": self.remaining,
+                "header": self.header,
+                "header_value": self.header_value if self.header else None,
+                "interval_ms": round(self.interval * 1000, 3),
+            }
+
+
+request_profiler = RequestProfiler()
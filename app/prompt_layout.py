@@ -0,0 +1,52 @@
+# Shared opening for the generator and both graders, most stable part first so Ollama can
+# reuse the cached prefix instead of prefilling it again: the fixed instructions are identical
+# across every request, the history across turns of one conversation, and everything up to
+# and including the Knowledge Base across the three calls of one request.
+shared_instructions = """You are an expert assistant working with a knowledge base built from uploaded technical documentation.
+    Everything you produce must be grounded in the Conversation Context and the Knowledge Base below.
+    Answers provide technical guidance that relies only on the content and context of the documentation unless
+    explicitly instructed otherwise. If a question falls outside the documentation's scope, the answer politely
+    says that the information is not covered. Answers never contain code or command line instructions.
+
+    """
+
+shared_context_prefix = shared_instructions + """Conversation Context:
+    {conversation_history}
+
+    Knowledge Base:
+    {document}
+
+    """
+
+
+# Render history as stable plain text instead of a Python list repr
+def format_history(history) -> str:
+    if not history:
+        return "None"
+    if isinstance(history, str):
+        return history
+    lines = []
+    for turn in history:
+        question, answer = turn[0], turn[1]
+        if not question:
+            lines.append(f"Summary of the earlier conversation: {answer}")
+        else:
+            lines.append(f"User: {question}\nAssistant: {answer}")
+    return "\n\n".join(lines)
+
+
+# Chunks keep the retriever's relevance order, best match first. FAISS returns the same order
+# for the same question and index, which is all the cache needs; re-sorting by file name
+# would push the best chunk wherever the alphabet puts it.
+def documents_text(documents) -> str:
+    return "\n\n".join(doc.page_content for doc in documents)
+
+
+# Normalize chain inputs so every prompt renders history and documents identically
+def layout_inputs(inputs: dict) -> dict:
+    laid_out = dict(inputs)
+    if "conversation_history" in laid_out:
+        laid_out["conversation_history"] = format_history(laid_out["conversation_history"])
+    if "document" in laid_out and not isinstance(laid_out["document"], str):
+        laid_out["document"] = documents_text(laid_out["document"])
+    return laid_out
@@ -1,6 +1,10 @@
 from typing import List, Tuple, TypedDict
 from langgraph.graph import END, START, StateGraph
 from llm_nodes import *
+from llm_scheduler import scheduled_invoke, scheduled_stream
+from prompt_layout import documents_text
+from telemetry import log, metrics
+from tracing import span, traced
 import time
 import os
 import re
@@ -12,7 +16,6 @@ class GraphState(TypedDict):
     documents: List[str]
     conversation_history: List[Tuple[str, str]]
     recursion_count: int
-    last_step_time: float
 
 # Helper function to format sources for display
 def format_sources_for_display(documents) -> str:
@@ -28,37 +31,34 @@ def format_sources_for_display(documents) -> str:
         source_lines.append(f"{source['file']}")
     return "\n".join(source_lines)
 
+# Helper function to drop the appended sources block from a generation
+def strip_sources(generation: str) -> str:
+    return generation.split("\n\nSources:")[0].rstrip()
+
 # Main graph builder function
 def build_graph(retriever):
 
     # Document retrieval node
     def retrieve(state):
         step_start = time.time()
-        print("\n--- Executing RETRIEVE Node ---")
-        if "last_step_time" in state:
-            duration = step_start - state["last_step_time"]
-            print(f"Time since last step: {duration:.3f}s")
 
-        docs = retriever.get_relevant_documents(state["question"])
+        # Relevance order, best chunk first
+        with span("retriever"):
+            docs = retriever.get_relevant_documents(state["question"])
 
         total_time = time.time() - step_start
-        print(f"RETRIEVE completed in {total_time:.3f}s total\n")
+        metrics.observe("qa_retrieve_seconds", total_time)
+        log.debug("qa_node", node="retrieve", seconds=round(total_time, 3), documents=len(docs))
         return {
             **state,
-            "documents": docs,
-            "last_step_time": time.time()
+            "documents": docs
         }
 
     # Response generation
     def generate(state):
         step_start = time.time()
-        if "last_step_time" in state:
-            duration = step_start - state["last_step_time"]
-            print(f"Time since last step: {duration:.3f}s")
 
-        documents_text = ""
-        for doc in state["documents"]:
-            documents_text += doc.page_content
+        knowledge_base = documents_text(state["documents"])
 
         llm_start = time.time()
 
@@ -66,20 +66,20 @@ def build_graph(retriever):
         try:
             # Try streaming first
             chunks = []
-            for chunk in generator.stream({
+            for chunk in scheduled_stream(generator, {
                 "conversation_history": state["conversation_history"],
-                "document": documents_text,
+                "document": knowledge_base,
                 "question": state["question"]
-            }):
+            }, model=model):
                 chunks.append(chunk)
             llm_response = "".join(chunks)
         except:
             # Fallback to regular invoke
-            llm_response = generator.invoke({
+            llm_response = scheduled_invoke(generator, {
                 "conversation_history": state["conversation_history"],
-                "document": documents_text,
+                "document": knowledge_base,
                 "question": state["question"]
-            })
+            }, model=model)
 
         llm_time = time.time() - llm_start
 
@@ -89,115 +89,101 @@ def build_graph(retriever):
         generation_with_sources = generation_text + "\n\n" + source_info
 
         total_time = time.time() - step_start
-        print(f"LLM generation took {llm_time:.3f}s")
-        print(f"GENERATE completed in {total_time:.3f}s total\n")
+        metrics.observe("qa_llm_generate_seconds", llm_time)
+        metrics.observe("qa_generate_seconds", total_time)
+        log.debug("qa_node", node="generate", seconds=round(total_time, 3), llm_seconds=round(llm_time, 3))
 
         return {
             **state,
-            "generation": generation_with_sources,
-            "last_step_time": time.time()
+            "generation": generation_with_sources
         }
 
     # Query transformation node for improving retrieval
     def transform_query(state):
         step_start = time.time()
-        if "last_step_time" in state:
-            duration = step_start - state["last_step_time"]
-            print(f"Time since last step: {duration:.3f}s")
-        
+
         rewrite_start = time.time()
-        better_q = question_rewriter.invoke({"question": state["question"]})
+        better_q = scheduled_invoke(question_rewriter, {"question": state["question"]}, model=model)
         rewrite_time = time.time() - rewrite_start
-        
+
         total_time = time.time() - step_start
-        print(f"Query rewrite took {rewrite_time:.3f}s")
-        print(f"Original: '{state['question']}'")
-        print(f"Rewritten: '{better_q}'")
-        print(f"TRANSFORM_QUERY completed in {total_time:.3f}s total\n")
+        metrics.observe("qa_llm_rewrite_seconds", rewrite_time)
+        metrics.incr("qa_query_rewrites_total")
+        log.debug("qa_node", node="transform_query", seconds=round(total_time, 3), rewritten=better_q)
         
-        return {**state, "question": better_q, "recursion_count": state["recursion_count"] + 1, "last_step_time": time.time()}
+        return {**state, "question": better_q, "recursion_count": state["recursion_count"] + 1}
 
     # Response quality evaluation node
     def grade_generation(state):
         step_start = time.time()
-        if "last_step_time" in state:
-            duration = step_start - state["last_step_time"]
-            print(f"Time since last step: {duration:.3f}s")
-        
-        print(f"Current recursion count: {state['recursion_count']}")
-        
+
         if state["recursion_count"] >= 2:
-            total_time = time.time() - step_start
-            print(f"Recursion limit reached ({state['recursion_count']}), forcing end")
-            print(f"GRADE_GENERATION completed in {total_time:.3f}s total\n")
+            metrics.incr("qa_recursion_limit_total")
+            log.info("qa_recursion_limit", recursion_count=state["recursion_count"])
             return "useful"
         
-        documents_content_list = " ".join([doc.page_content for doc in state["documents"]]) if len(state["documents"]) > 0 else ""
+        # Same rendering as the generator so the graders hit the cached prompt prefix
+        knowledge_base = documents_text(state["documents"])
         
-        generation_to_check = state["generation"].split("\n\n**Source")[0]
+        generation_to_check = strip_sources(state["generation"])
 
         hallucination_start = time.time()
-        h_score_response = hallucination_grader.invoke({
-            "documents": documents_content_list,
+        h_score_response = scheduled_invoke(hallucination_grader, {
+            "document": knowledge_base,
             "generation": generation_to_check,
             "conversation_history": state["conversation_history"]
-        })
+        }, model=model)
 
         # Extract "yes" or "no" from the response
         h_score = "yes" if "yes" in h_score_response.lower() else "no"
         hallucination_time = time.time() - hallucination_start
-        print(f"Hallucination check: {h_score} (took {hallucination_time:.3f}s)")
-        
+        metrics.observe("qa_llm_hallucination_grade_seconds", hallucination_time)
+
         if h_score == "no":
             total_time = time.time() - step_start
-            print(f"Failed hallucination check")
-            print(f"GRADE_GENERATION completed in {total_time:.3f}s total\n")
+            metrics.observe("qa_grade_seconds", total_time)
+            metrics.incr("qa_hallucination_failures_total")
+            log.debug("qa_node", node="grade_generation", seconds=round(total_time, 3), decision="not useful", hallucination=h_score)
             return "not useful"
         
         answer_start = time.time()
-        a_score_response = answer_grader.invoke({
+        a_score_response = scheduled_invoke(answer_grader, {
+            "document": knowledge_base,
             "question": state["question"],
             "generation": generation_to_check,
             "conversation_history": state["conversation_history"]
-        })
+        }, model=model)
 
         # Extract "yes" or "no" from the response
         a_score = "yes" if "yes" in a_score_response.lower() else "no"
         answer_time = time.time() - answer_start
-        print(f"Answer quality check: {a_score} (took {answer_time:.3f}s)")
-        
+        metrics.observe("qa_llm_answer_grade_seconds", answer_time)
+
         decision = "useful" if a_score == "yes" else "not useful"
         total_time = time.time() - step_start
-        print(f"Final decision: {decision}")
-        print(f"GRADE_GENERATION completed in {total_time:.3f}s total\n")
-        
+        metrics.observe("qa_grade_seconds", total_time)
+        log.debug("qa_node", node="grade_generation", seconds=round(total_time, 3), decision=decision, answer=a_score)
+
         return decision
     
     # Workflow entry point for state initialization
     def entry_point(state):
-        step_start = time.time()
-        print("--- QA Graph Entry Point ---")
-        
-        history = state.get("conversation_history") 
+        history = state.get("conversation_history")
         if not isinstance(history, list):
             history = []
-        
-        total_time = time.time() - step_start
-        print(f"ENTRY_POINT completed in {total_time:.3f}s total\n")
-    
+
         return {
             "question": state["question"],
             "documents": [],
             "conversation_history": history,
-            "recursion_count": 0,
-            "last_step_time": time.time()
+            "recursion_count": 0
         }
     
     # Graph construction and workflow definition
     wf = StateGraph(GraphState)
-    wf.add_node("retrieve", retrieve)
-    wf.add_node("generate", generate)
-    wf.add_node("transform_query", transform_query)
+    wf.add_node("retrieve", traced("retrieve", retrieve))
+    wf.add_node("generate", traced("generate", generate))
+    wf.add_node("transform_query", traced("transform_query", transform_query))
     wf.add_node("unsure", lambda state: state)
     wf.add_node("entry_point", entry_point)
 
@@ -208,7 +194,7 @@ def build_graph(retriever):
     wf.add_edge("transform_query", "retrieve")
 
     # Conditional routing
-    wf.add_conditional_edges("generate", grade_generation, {
+    wf.add_conditional_edges("generate", traced("grade_generation", grade_generation), {
         "useful": END,
         "not useful": "transform_query"
     })
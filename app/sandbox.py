@@ -0,0 +1,336 @@
+import atexit
+import multiprocessing as mp
+import os
+import queue
+import sys
+import threading
+import time
+
+try:
+    import resource
+    import signal
+except ImportError:
+    resource = None
+
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+# Sandbox configuration
+sandbox_workers = int(os.environ.get("DA_SANDBOX_WORKERS", "2"))
+cpu_seconds = int(os.environ.get("DA_SANDBOX_CPU_SECONDS", "30"))
+memory_mb = int(os.environ.get("DA_SANDBOX_MEMORY_MB", "4096"))
+wall_timeout = float(os.environ.get("DA_SANDBOX_TIMEOUT", "60"))
+# Encoded results above this size go through shared memory instead of the pipe
+shared_memory_threshold = int(os.environ.get("DA_SANDBOX_SHM_THRESHOLD", str(1024 * 1024)))
+# Before 3.13 attaching to a segment registers it with the resource tracker too, and there is no track=False
+tracks_attached_segments = sys.version_info < (3, 13)
+
+
+class CPUTimeExceeded(Exception):
+    pass
+
+
+# A worker could not load the dataset; every worker of that dataset version would fail the same way
+class SandboxLoadFailed(Exception):
+    pass
+
+
+def _memory_limit_message(limit_mb: int) -> str:
+    return f"dataset exceeds sandbox memory limit (DA_SANDBOX_MEMORY_MB={limit_mb})"
+
+
+def _on_cpu_limit(signum, frame):
+    raise CPUTimeExceeded(f"cpu time limit of {cpu_seconds}s exceeded")
+
+
+# Turn the code's `result` variable into a DataFrame; scalars and other objects stay None
+def _result_frame(value):
+    import numpy as np
+    import pandas as pd
+
+    if isinstance(value, pd.DataFrame):
+        return value
+    if isinstance(value, pd.Series):
+        return value.to_frame(name=value.name if value.name is not None else "value")
+    if isinstance(value, np.ndarray) and value.ndim in (1, 2):
+        return pd.DataFrame(value)
+    return None
+
+
+# Worker side: encode the frame as an Arrow IPC stream, in shared memory when it is large
+def _encode_result(frame) -> dict:
+    if pa is None:
+        return {"kind": "pickle", "frame": frame}
+
+    table = pa.Table.from_pandas(frame, preserve_index=True)
+    if _stream_size(table) <= shared_memory_threshold:
+        sink = pa.BufferOutputStream()
+        _write_stream(sink, table)
+        return {"kind": "arrow", "payload": sink.getvalue().to_pybytes()}
+
+    # Large results are written straight into a shared-memory segment the parent maps
+    from multiprocessing import resource_tracker, shared_memory
+    size = _stream_size(table)
+    if tracks_attached_segments:
+        segment = shared_memory.SharedMemory(create=True, size=size)
+    else:
+        segment = shared_memory.SharedMemory(create=True, size=size, track=False)
+    try:
+        buffer = pa.py_buffer(segment.buf)
+        _write_stream(pa.FixedSizeBufferWriter(buffer), table)
+        del buffer
+    except BaseException:
+        segment.close()
+        segment.unlink()
+        raise
+    segment.close()
+    if tracks_attached_segments:
+        # The parent owns the segment from here and unlinks it; a second registration
+        # would make the tracker warn about a leak or unlink a name that is already gone
+        resource_tracker.unregister(segment._name, "shared_memory")
+    return {"kind": "shm", "name": segment.name, "size": size}
+
+
+def _write_stream(sink, table):
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+
+
+def _stream_size(table) -> int:
+    sink = pa.MockOutputStream()
+    _write_stream(sink, table)
+    return sink.size()
+
+
+def _read_stream(buffer):
+    return pa.ipc.open_stream(buffer).read_all().to_pandas()
+
+
+# Segments whose memory still backs a decoded frame; closed once nothing references them
+_mapped_segments = []
+_segments_lock = threading.Lock()
+
+
+def _release_segments():
+    with _segments_lock:
+        for segment in list(_mapped_segments):
+            try:
+                segment.close()
+                _mapped_segments.remove(segment)
+            except BufferError:
+                pass
+
+
+# Parent side: rebuild the DataFrame, mapping shared-memory results without copying
+def _decode_result(encoded: dict):
+    if encoded["kind"] == "pickle":
+        return encoded["frame"]
+    if encoded["kind"] == "arrow":
+        return _read_stream(pa.py_buffer(encoded["payload"]))
+
+    from multiprocessing import shared_memory
+    _release_segments()
+    segment = shared_memory.SharedMemory(name=encoded["name"])
+    try:
+        frame = _read_stream(pa.py_buffer(segment.buf)[:encoded["size"]])
+    finally:
+        # The name goes now; the mapping lives on while the frame's columns point into it
+        segment.unlink()
+        with _segments_lock:
+            _mapped_segments.append(segment)
+    return frame
+
+
+# Worker process: imports the analysis stack and loads the dataset once, then runs code on request
+def _worker_main(conn, data_file_path: str, memory_limit_mb: int):
+    import contextlib
+    import io
+    import traceback
+
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    import numpy as np
+    import pandas as pd
+    import seaborn as sns
+
+    from dataset_store import dataset_store
+
+    # Copy-on-write makes the shallow per-run copies below safe against in-place edits
+    pd.set_option("mode.copy_on_write", True)
+
+    if resource is not None:
+        # The loaded DataFrame lives in the heap, so the whole dataset counts against this budget
+        limit = memory_limit_mb * 1024 * 1024
+        resource.setrlimit(getattr(resource, "RLIMIT_DATA", resource.RLIMIT_AS), (limit, limit))
+        signal.signal(signal.SIGXCPU, _on_cpu_limit)
+
+    try:
+        base = dataset_store.load(data_file_path)
+    except MemoryError:
+        conn.send({"ready": False, "error": _memory_limit_message(memory_limit_mb)})
+        return
+    except Exception as e:
+        conn.send({"ready": False, "error": f"could not load dataset: {type(e).__name__}: {e}"})
+        return
+    conn.send({"ready": True, "shape": base.shape})
+
+    while True:
+        code = conn.recv()
+        if code is None:
+            break
+
+        data = base.copy(deep=False)
+        namespace = {'df': data, 'data': data, 'pd': pd, 'plt': plt, 'sns': sns, 'np': np}
+        stdout = io.StringIO()
+        error = None
+        encoded = None
+        value_text = None
+        start = time.time()
+
+        if resource is not None:
+            used = resource.getrusage(resource.RUSAGE_SELF)
+            budget = int(used.ru_utime + used.ru_stime) + cpu_seconds
+            _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+            resource.setrlimit(resource.RLIMIT_CPU, (budget, hard))
+
+        try:
+            with contextlib.redirect_stdout(stdout):
+                exec(code, namespace)
+            if "result" in namespace:
+                frame = _result_frame(namespace["result"])
+                if frame is not None:
+                    encoded = _encode_result(frame)
+                else:
+                    value_text = str(namespace["result"])[:2000]
+        except BaseException as e:
+            error = f"{type(e).__name__}: {e}"
+            stdout.write(f"\nError executing code: {e}")
+            traceback.print_exc()
+        finally:
+            if resource is not None:
+                _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+                resource.setrlimit(resource.RLIMIT_CPU, (hard, hard))
+            plt.close('all')
+
+        conn.send({
+            "output": stdout.getvalue().strip(),
+            "error": error,
+            "result": encoded,
+            "value": value_text,
+            "duration": time.time() - start,
+        })
+
+
+# One pre-warmed worker process and its pipe
+class SandboxWorker:
+    def __init__(self, data_file_path: str):
+        context = mp.get_context("spawn")
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(
+            target=_worker_main,
+            args=(child_conn, data_file_path, memory_mb),
+            daemon=True
+        )
+        self.process.start()
+        child_conn.close()
+        self.ready = False
+
+    def wait_ready(self, timeout: float):
+        if not self.ready:
+            if not self.conn.poll(timeout):
+                raise TimeoutError("sandbox worker did not start in time")
+            try:
+                message = self.conn.recv()
+            except EOFError:
+                # Killed outright while loading, which under RLIMIT_DATA means the data did not fit
+                self.process.join(timeout=1)
+                raise SandboxLoadFailed(f"{_memory_limit_message(memory_mb)}; worker exited with code {self.process.exitcode}")
+            if not message.get("ready"):
+                raise SandboxLoadFailed(message.get("error", "sandbox worker failed to start"))
+            self.ready = True
+
+    def run(self, code: str, timeout: float) -> dict:
+        self.conn.send(code)
+        if not self.conn.poll(timeout):
+            raise TimeoutError(f"code execution exceeded {timeout:.0f}s")
+        run = self.conn.recv()
+        encoded = run.pop("result")
+        run["dataframe"] = _decode_result(encoded) if encoded else None
+        return run
+
+    def stop(self):
+        try:
+            self.conn.send(None)
+        except (OSError, ValueError):
+            pass
+        self.process.join(timeout=1)
+        if self.process.is_alive():
+            self.process.kill()
+
+
+# Pool of workers holding one dataset version; runs are isolated and execute in parallel
+class SandboxPool:
+    def __init__(self, data_file_path: str, size: int = sandbox_workers):
+        self.data_file_path = data_file_path
+        self.size = size
+        # Set once a worker cannot load this dataset version; runs fail fast instead of respawning
+        self.failed = None
+        self._idle = queue.Queue()
+        for _ in range(size):
+            self._idle.put(SandboxWorker(data_file_path))
+
+    def run(self, code: str, timeout: float = wall_timeout) -> dict:
+        if self.failed:
+            return self._error_result(self.failed, 0.0)
+        worker = self._idle.get()
+        try:
+            worker.wait_ready(timeout=120)
+            result = worker.run(code, timeout)
+        except SandboxLoadFailed as e:
+            self.failed = str(e)
+            worker.stop()
+            result = self._error_result(self.failed, 0.0)
+        except (TimeoutError, EOFError, OSError) as e:
+            # Killed by a limit or stuck: replace the worker so the pool stays full
+            worker.stop()
+            worker = SandboxWorker(self.data_file_path)
+            result = self._error_result(str(e), timeout)
+        finally:
+            self._idle.put(worker)
+        return result
+
+    def _error_result(self, error: str, duration: float) -> dict:
+        return {"output": f"Error executing code: {error}", "error": error, "dataframe": None, "value": None, "duration": duration}
+
+    def close(self):
+        for _ in range(self.size):
+            self._idle.get().stop()
+
+
+_pools_lock = threading.Lock()
+_pools = {}
+
+
+# Pool for the current version of a dataset, replacing the pool when the data changes
+def get_sandbox_pool(data_file_path: str) -> SandboxPool:
+    from dataset_store import dataset_store
+
+    version = dataset_store.version(data_file_path)
+    with _pools_lock:
+        current = _pools.get(data_file_path)
+        if current is not None and current[0] == version:
+            return current[1]
+        pool = SandboxPool(data_file_path)
+        _pools[data_file_path] = (version, pool)
+    if current is not None:
+        threading.Thread(target=current[1].close, daemon=True).start()
+    return pool
+
+
+@atexit.register
+def _shutdown_pools():
+    for _, pool in list(_pools.values()):
+        pool.close()
@@ -0,0 +1,191 @@
+import json
+import os
+import re
+import threading
+
+import numpy as np
+
+from telemetry import log
+
+# Token budget for the schema section of the data-analysis prompts
+schema_token_budget = int(os.environ.get("DA_SCHEMA_TOKEN_BUDGET", "2000"))
+# One-hot member names listed per family before the rest are summarized
+max_family_members_listed = 30
+
+_lock = threading.Lock()
+# Group descriptors and their embeddings per dataset version
+_indexes = {}
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // 4 + 1
+
+
+def families_path_for(data_file_path: str) -> str:
+    stem = os.path.splitext(data_file_path)[0]
+    return f"{stem}.families.json"
+
+
+def _is_binary(column: dict) -> bool:
+    return column["n_unique"] <= 2 and all(v in (0, 1, True, False) for v in column["samples"])
+
+
+# Group one-hot columns back under their source column. The sidecar written by
+# data_processing is authoritative; otherwise binary columns sharing the longest
+# common "<prefix>_" are treated as one family.
+def find_families(profile: dict, data_file_path: str) -> dict:
+    names = {c["name"] for c in profile["columns"]}
+    sidecar = families_path_for(data_file_path)
+    if os.path.exists(sidecar):
+        try:
+            with open(sidecar, "r", encoding="utf-8") as f:
+                families = json.load(f)
+            return {source: [m for m in members if m in names] for source, members in families.items() if members}
+        except (OSError, ValueError) as e:
+            log.warning("schema_families_unreadable", path=sidecar, error=str(e))
+
+    binary = [c["name"] for c in profile["columns"] if "_" in c["name"] and _is_binary(c)]
+    prefix_counts = {}
+    for name in binary:
+        parts = name.split("_")
+        for i in range(1, len(parts)):
+            prefix = "_".join(parts[:i])
+            prefix_counts[prefix] = prefix_counts.get(prefix, 0) + 1
+
+    families = {}
+    for name in binary:
+        parts = name.split("_")
+        shared = [("_".join(parts[:i])) for i in range(1, len(parts)) if prefix_counts["_".join(parts[:i])] >= 2]
+        if shared:
+            families.setdefault(shared[-1], []).append(name)
+    return families
+
+
+# Schema groups: one per one-hot family and one per remaining column
+def build_groups(profile: dict, data_file_path: str) -> list:
+    by_name = {c["name"]: c for c in profile["columns"]}
+    families = find_families(profile, data_file_path)
+    grouped = set()
+    groups = []
+
+    for source, members in families.items():
+        grouped.update(members)
+        values = [m[len(source) + 1:] for m in members]
+        listed = members[:max_family_members_listed]
+        more = len(members) - len(listed)
+        line = f"{source} (one-hot, 0/1 columns named '{source}_<value>'): {', '.join(listed)}"
+        if more > 0:
+            line += f", ... +{more} more '{source}_' columns"
+        groups.append({
+            "name": source,
+            "columns": members,
+            "line": line,
+            "dtypes": {m: by_name[m]["dtype"] for m in listed},
+            "values_line": f"{source}: {values[:10]}",
+            "text": f"{source}: {' '.join(values[:50])}",
+        })
+
+    for column in profile["columns"]:
+        if column["name"] in grouped:
+            continue
+        groups.append({
+            "name": column["name"],
+            "columns": [column["name"]],
+            "line": column["name"],
+            "dtypes": {column["name"]: column["dtype"]},
+            "values_line": f"{column['name']}: {column['samples']}",
+            "text": f"{column['name']}: {' '.join(str(v) for v in column['samples'])}",
+        })
+    return groups
+
+
+def _group_index(profile: dict, data_file_path: str) -> dict:
+    key = (data_file_path, profile["version"])
+    with _lock:
+        index = _indexes.get(key)
+        if index is not None:
+            return index
+
+    groups = build_groups(profile, data_file_path)
+    vectors = None
+    try:
+        from chunks import get_embedding_model
+        vectors = np.array(get_embedding_model().embed_documents([g["text"] for g in groups]), dtype=np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True) + 1e-9
+    except Exception as e:
+        log.warning("schema_embeddings_unavailable", error=str(e))
+
+    index = {"groups": groups, "vectors": vectors}
+    with _lock:
+        _indexes[key] = index
+    return index
+
+
+def _words(text: str) -> set:
+    return {w for w in re.split(r"[^a-z0-9]+", text.lower()) if len(w) > 1}
+
+
+# Relevance of each group to the question: embedding similarity plus a boost for literal mentions
+def rank_groups(index: dict, question: str) -> list:
+    groups = index["groups"]
+    scores = np.zeros(len(groups), dtype=np.float32)
+
+    if index["vectors"] is not None:
+        try:
+            from chunks import get_embedding_model
+            query = np.array(get_embedding_model().embed_query(question), dtype=np.float32)
+            query /= np.linalg.norm(query) + 1e-9
+            scores += index["vectors"] @ query
+        except Exception as e:
+            log.warning("schema_question_embedding_failed", error=str(e))
+
+    question_words = _words(question)
+    question_lower = question.lower()
+    for i, group in enumerate(groups):
+        name_words = _words(group["name"])
+        if group["name"].lower() in question_lower:
+            scores[i] += 1.0
+        elif name_words:
+            scores[i] += 0.5 * len(name_words & question_words) / len(name_words)
+
+    order = np.argsort(-scores, kind="stable")
+    return [groups[i] for i in order]
+
+
+# Pick the most relevant schema groups that fit the token budget and render them for the prompts
+def select_schema(profile: dict, data_file_path: str, question: str, token_budget: int = None) -> dict:
+    budget = schema_token_budget if token_budget is None else token_budget
+    index = _group_index(profile, data_file_path)
+
+    selected = []
+    used = 0
+    for group in rank_groups(index, question):
+        cost = estimate_tokens(group["line"]) + estimate_tokens(group["values_line"]) + 4 * len(group["dtypes"])
+        if selected and used + cost > budget:
+            continue
+        selected.append(group)
+        used += cost
+
+    # Keep the dataset's own column order so related columns stay together
+    position = {g["name"]: i for i, g in enumerate(index["groups"])}
+    selected.sort(key=lambda g: position[g["name"]])
+
+    total_columns = len(profile["columns"])
+    columns = [c for g in selected for c in g["columns"]]
+    dtypes = {}
+    for group in selected:
+        dtypes.update(group["dtypes"])
+
+    columns_text = "\n".join(f"- {g['line']}" for g in selected)
+    if len(columns) < total_columns:
+        columns_text += f"\n(showing the {len(columns)} of {total_columns} columns most relevant to the question)"
+
+    log.debug("schema_selected", groups=len(selected), total_groups=len(index["groups"]), columns=len(columns),
+              total_columns=total_columns, tokens=used)
+    return {
+        "columns": columns,
+        "columns_text": columns_text,
+        "values_text": "\n".join(g["values_line"] for g in selected),
+        "dtypes_text": json.dumps(dtypes),
+        "total_columns": total_columns,
+    }
@@ -0,0 +1,170 @@
+import os
+import threading
+import time
+import uuid
+from typing import List, Tuple
+
+from llm_scheduler import scheduled_invoke, PRIORITY_INGESTION
+from telemetry import log
+
+# Compaction configuration
+history_token_budget = int(os.environ.get("HISTORY_TOKEN_BUDGET", "1500"))
+recent_turns = int(os.environ.get("HISTORY_RECENT_TURNS", "3"))
+session_ttl_seconds = int(os.environ.get("SESSION_TTL_SECONDS", "86400"))
+max_sessions = int(os.environ.get("MAX_SESSIONS", "1000"))
+
+
+# Rough token count, good enough for budgeting prompt sections
+def estimate_tokens(text: str) -> int:
+    return len(text) // 4 + 1
+
+
+def turn_tokens(turn: Tuple[str, str]) -> int:
+    return estimate_tokens(turn[0]) + estimate_tokens(turn[1])
+
+
+# One conversation held on the server
+class Session:
+    def __init__(self, session_id: str):
+        self.id = session_id
+        self.turns: List[Tuple[str, str]] = []
+        # Cached rolling summary of turns[:summarized_upto]
+        self.summary = ""
+        self.summarized_upto = 0
+        self.created_at = time.time()
+        self.updated_at = self.created_at
+        self.lock = threading.Lock()
+        self.compacting = False
+        # (turn count covered, token ids) returned by Ollama for the last answered turn
+        self.ollama_context = None
+
+    # History handed to the QA graph: cached summary plus the most recent turns verbatim
+    def compacted_history(self, token_budget: int = None) -> List[Tuple[str, str]]:
+        budget = history_token_budget if token_budget is None else token_budget
+        with self.lock:
+            summary = self.summary
+            turns = list(self.turns)
+            summarized_upto = self.summarized_upto
+
+        history = []
+        used = 0
+        if summary:
+            used = estimate_tokens(summary)
+            # An empty question marks the summary turn for format_history
+            history.append(("", summary))
+
+        # Walk backwards so the newest turns are kept when the budget runs out
+        recent = []
+        for index in range(len(turns) - 1, -1, -1):
+            # Older turns are covered by the summary once compaction has caught up
+            if index < summarized_upto:
+                break
+            cost = turn_tokens(turns[index])
+            if recent and used + cost > budget:
+                break
+            recent.insert(0, turns[index])
+            used += cost
+        return history + recent
+
+    # Ollama context to continue from, only when it covers exactly the stored turns
+    def reusable_context(self, max_tokens: int):
+        with self.lock:
+            if self.ollama_context is None:
+                return None
+            covered, context = self.ollama_context
+            if covered != len(self.turns) or not context or len(context) > max_tokens:
+                return None
+            return context
+
+    def store_context(self, covered_turns: int, context):
+        with self.lock:
+            self.ollama_context = (covered_turns, context) if context else None
+
+    def stats(self) -> dict:
+        history = self.compacted_history()
+        return {
+            "session_id": self.id,
+            "turns": len(self.turns),
+            "summarized_turns": self.summarized_upto,
+            "summary": self.summary,
+            "history_tokens": sum(turn_tokens(turn) for turn in history),
+            "updated_at": self.updated_at,
+        }
+
+
+# In-memory session registry with expiry and background compaction
+class SessionStore:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sessions = {}
+
+    def create(self) -> Session:
+        session = Session(uuid.uuid4().hex)
+        with self._lock:
+            self._expire()
+            self._sessions[session.id] = session
+        return session
+
+    def get(self, session_id: str) -> Session:
+        with self._lock:
+            self._expire()
+            return self._sessions.get(session_id)
+
+    def delete(self, session_id: str) -> bool:
+        with self._lock:
+            return self._sessions.pop(session_id, None) is not None
+
+    # Drop idle sessions and cap the total, caller holds the lock
+    def _expire(self):
+        now = time.time()
+        for session_id in [s.id for s in self._sessions.values() if now - s.updated_at > session_ttl_seconds]:
+            del self._sessions[session_id]
+        if len(self._sessions) >= max_sessions:
+            oldest = sorted(self._sessions.values(), key=lambda s: s.updated_at)
+            for session in oldest[:len(self._sessions) - max_sessions + 1]:
+                del self._sessions[session.id]
+
+    # Store a finished turn and summarize anything that fell out of the recent window
+    def record_turn(self, session: Session, question: str, answer: str):
+        with session.lock:
+            session.turns.append((question, answer))
+            session.updated_at = time.time()
+            needs_compaction = len(session.turns) - session.summarized_upto > recent_turns and not session.compacting
+            if needs_compaction:
+                session.compacting = True
+        if needs_compaction:
+            threading.Thread(target=self._compact, args=(session,), daemon=True).start()
+
+    # Fold older turns into the cached summary off the request path
+    def _compact(self, session: Session):
+        try:
+            while True:
+                with session.lock:
+                    upto = len(session.turns) - recent_turns
+                    if upto <= session.summarized_upto:
+                        return
+                    pending = session.turns[session.summarized_upto:upto]
+                    summary = session.summary
+
+                from llm_nodes import history_summarizer, model
+                turns_text = "\n".join(f"User: {q}\nAssistant: {a}" for q, a in pending)
+                new_summary = scheduled_invoke(
+                    history_summarizer,
+                    {"summary": summary or "None", "turns": turns_text},
+                    priority=PRIORITY_INGESTION,
+                    model=model
+                ).strip()
+
+                with session.lock:
+                    session.summary = new_summary
+                    session.summarized_upto = upto
+                log.debug("session_compacted", session=session.id[:8], turns=upto, tokens=estimate_tokens(new_summary))
+        except Exception as e:
+            log.warning("session_compaction_failed", session=session.id[:8], error=str(e))
+        finally:
+            with session.lock:
+                session.compacting = False
+
+
+# Process-wide session store used by the backend
+session_store = SessionStore()
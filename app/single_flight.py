@@ -0,0 +1,162 @@
+import hashlib
+import json
+import re
+import threading
+
+from telemetry import log
+
+
+# Normalize a question so trivially different phrasings share one computation
+def normalize_question(question: str) -> str:
+    question = re.sub(r"\s+", " ", question.strip().lower())
+    return question.rstrip("?!. ")
+
+
+# Build the coalescing key from question, conversation history and index version
+def flight_key(question: str, conversation_history, index_version: str) -> str:
+    payload = json.dumps({
+        "question": normalize_question(question),
+        "history": [list(turn) for turn in (conversation_history or [])],
+        "index": index_version,
+    }, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+# One in-flight computation shared by every request with the same key
+class Flight:
+    def __init__(self, group, key: str):
+        self.group = group
+        self.key = key
+        self.events = []
+        self.result = None
+        self.error = None
+        self.done = False
+        self.cancelled = False
+        self.subscribers = 0
+        self._cond = threading.Condition()
+
+    # Append an event for all current and future subscribers
+    def publish(self, event: dict):
+        with self._cond:
+            self.events.append(event)
+            self._cond.notify_all()
+
+    def finish(self, result=None, error: Exception = None):
+        with self._cond:
+            self.result = result
+            self.error = error
+            self.done = True
+            self._cond.notify_all()
+        self.group._forget(self)
+
+    # Run producer(flight) on a background thread so no single client owns the work
+    def start(self, producer):
+        def run():
+            try:
+                self.finish(result=producer(self))
+            except Exception as e:
+                self.finish(error=e)
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def attach(self):
+        with self._cond:
+            self.subscribers += 1
+
+    # The last subscriber leaving an unfinished flight cancels it, the producer stops at its next check
+    def detach(self):
+        with self._cond:
+            self.subscribers -= 1
+            abandoned = self.subscribers <= 0 and not self.done
+        if abandoned:
+            self.group._cancel(self)
+
+    # Events after cursor, waiting up to timeout for new ones; returns (events, cursor, finished)
+    def wait_events(self, cursor: int, timeout: float = None):
+        with self._cond:
+            if cursor >= len(self.events) and not self.done:
+                self._cond.wait(timeout)
+            pending = self.events[cursor:]
+            cursor = len(self.events)
+            return pending, cursor, self.done
+
+    # Iterate every event from the beginning, blocking until the flight finishes
+    def subscribe(self):
+        self.attach()
+        cursor = 0
+        try:
+            while True:
+                pending, cursor, finished = self.wait_events(cursor)
+                for event in pending:
+                    yield event
+                if finished:
+                    return
+        finally:
+            self.detach()
+
+    def wait_result(self):
+        with self._cond:
+            while not self.done:
+                self._cond.wait()
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+# Registry of in-flight computations keyed by flight_key
+class SingleFlight:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights = {}
+        self.metrics = {"leaders_total": 0, "coalesced_total": 0, "cancelled_total": 0}
+
+    # Return (flight, is_leader); the leader is responsible for running the work. With attach
+    # the caller is counted as a subscriber before the flight can be cancelled under it.
+    def join(self, key: str, attach: bool = False):
+        with self._lock:
+            flight = self._flights.get(key)
+            is_leader = flight is None
+            if is_leader:
+                flight = Flight(self, key)
+                self._flights[key] = flight
+                self.metrics["leaders_total"] += 1
+            else:
+                self.metrics["coalesced_total"] += 1
+            if attach:
+                flight.attach()
+            return flight, is_leader
+
+    # Run fn once per key, duplicates block and share the result; returns (result, shared)
+    def run(self, key: str, fn):
+        flight, is_leader = self.join(key)
+        if not is_leader:
+            return flight.wait_result(), True
+        try:
+            result = fn()
+        except Exception as e:
+            flight.finish(error=e)
+            raise
+        flight.finish(result=result)
+        return result, False
+
+    def _cancel(self, flight: Flight):
+        with self._lock:
+            with flight._cond:
+                # A new subscriber may have joined since the last one left
+                if flight.subscribers > 0 or flight.done or flight.cancelled:
+                    return
+                flight.cancelled = True
+                flight._cond.notify_all()
+            if self._flights.get(flight.key) is flight:
+                del self._flights[flight.key]
+            self.metrics["cancelled_total"] += 1
+        log.info("flight_cancelled", key=flight.key[:12], reason="no subscribers")
+
+    def _forget(self, flight: Flight):
+        with self._lock:
+            if self._flights.get(flight.key) is flight:
+                del self._flights[flight.key]
+
+    def inflight(self) -> int:
+        with self._lock:
+            return len(self._flights)
@@ -0,0 +1,109 @@
+import os
+import re
+import threading
+import time
+
+try:
+    import duckdb
+except ImportError:
+    duckdb = None
+
+from dataset_store import dataset_store
+from telemetry import log
+
+# DuckDB spills to disk past this, so datasets larger than RAM still run
+sql_memory_limit = os.environ.get("DA_SQL_MEMORY_LIMIT", "2GB")
+sql_threads = int(os.environ.get("DA_SQL_THREADS", str(os.cpu_count() or 2)))
+sql_timeout = float(os.environ.get("DA_SQL_TIMEOUT", os.environ.get("DA_SANDBOX_TIMEOUT", "60")))
+# Rows fetched back from a query; aggregates are far below this
+sql_max_rows = int(os.environ.get("DA_SQL_MAX_ROWS", "100000"))
+
+
+# Strip fences and trailing semicolons; only a single read-only query is accepted
+def clean_sql(sql: str) -> str:
+    sql = re.sub(r"```(sql)?", "", sql, flags=re.IGNORECASE).strip()
+    return sql.rstrip(";").strip()
+
+
+def is_read_only(sql: str) -> bool:
+    return re.match(r"^\s*(select|with)\b", sql, flags=re.IGNORECASE) is not None and ";" not in sql
+
+
+# Runs model-written SQL in DuckDB over the Parquet copy of the dataset, exposed as view `data`
+class SQLEngine:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._connections = {}
+
+    def _connection(self, data_file_path: str):
+        parquet_path = dataset_store.parquet_path(data_file_path)
+        if parquet_path is None:
+            raise RuntimeError("the SQL backend needs pyarrow for the Parquet copy of the dataset")
+
+        with self._lock:
+            current = self._connections.get(data_file_path)
+            if current is not None and current[0] == parquet_path:
+                return current[1]
+
+            connection = duckdb.connect(database=":memory:")
+            connection.execute(f"SET memory_limit = '{sql_memory_limit}'")
+            connection.execute(f"SET threads = {sql_threads}")
+            escaped = parquet_path.replace("'", "''")
+            connection.execute(f"CREATE VIEW data AS SELECT * FROM read_parquet('{escaped}')")
+            connection.execute("CREATE VIEW df AS SELECT * FROM data")
+            if current is not None:
+                current[1].close()
+            self._connections[data_file_path] = (parquet_path, connection)
+            return connection
+
+    # Read Arrow record batches until the row cap, keeping the query's own ordering
+    def _fetch(self, result):
+        import pyarrow as pa
+
+        reader = result.fetch_record_batch()
+        batches, rows = [], 0
+        for batch in reader:
+            batches.append(batch)
+            rows += batch.num_rows
+            if rows >= sql_max_rows:
+                log.info("sql_result_truncated", max_rows=sql_max_rows)
+                break
+        return pa.Table.from_batches(batches, schema=reader.schema).slice(0, sql_max_rows)
+
+    # Same result shape as a sandbox run: output text, error, DataFrame and scalar value
+    def run(self, data_file_path: str, sql: str, timeout: float = sql_timeout) -> dict:
+        start = time.time()
+        sql = clean_sql(sql)
+        run = {"output": "", "error": None, "dataframe": None, "value": None}
+        if duckdb is None:
+            run["error"] = "duckdb is not installed"
+        elif not is_read_only(sql):
+            run["error"] = "only a single SELECT or WITH query is allowed"
+        if run["error"]:
+            run["output"] = f"Error executing query: {run['error']}"
+            run["duration"] = time.time() - start
+            return run
+
+        # A cursor per query lets concurrent questions share the connection and its cache
+        cursor = self._connection(data_file_path).cursor()
+        timer = threading.Timer(timeout, cursor.interrupt)
+        timer.start()
+        try:
+            table = self._fetch(cursor.execute(sql))
+            if table.num_rows == 1 and table.num_columns == 1:
+                run["value"] = str(table.column(0)[0].as_py())
+                run["output"] = f"{table.column_names[0]}: {run['value']}"
+            else:
+                run["dataframe"] = table.to_pandas()
+        except Exception as e:
+            run["error"] = f"{type(e).__name__}: {e}"
+            run["output"] = f"Error executing query: {e}"
+        finally:
+            timer.cancel()
+            cursor.close()
+        run["duration"] = time.time() - start
+        return run
+
+
+# Process-wide engine used by the DA agent
+sql_engine = SQLEngine()
@@ -0,0 +1,158 @@
+import atexit
+import bisect
+import json
+import os
+import queue
+import random
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+LEVELS = {"debug": 10, "info": 20, "warning": 30, "error": 40}
+
+# Records below this level are dropped before they are formatted
+log_level = LEVELS.get(os.environ.get("LOG_LEVEL", "info").lower(), LEVELS["info"])
+# Records waiting for the writer thread; past this the caller drops instead of blocking
+log_queue_size = int(os.environ.get("LOG_QUEUE_SIZE", "10000"))
+# Share of high-volume records (per token, per chunk) that are kept
+log_sample_rate = float(os.environ.get("LOG_SAMPLE_RATE", "0.01"))
+# Upper bounds in seconds of the latency histogram buckets
+histogram_buckets = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+
+# Latency distribution with fixed buckets; quantiles are estimated from the bucket bounds
+class Histogram:
+    def __init__(self, buckets=histogram_buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q: float):
+        if self.count == 0:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank and count:
+                return min(self.buckets[i], self.max) if i < len(self.buckets) else self.max
+        return self.max
+
+    def snapshot(self) -> dict:
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 6),
+            "mean": round(self.sum / self.count, 6) if self.count else None,
+            "max": round(self.max, 6),
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "p99": self.quantile(0.99),
+            "buckets": {str(b): c for b, c in zip(self.buckets + ("+Inf",), self.counts)},
+        }
+
+
+# In-process counters and latency histograms
+class MetricsRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+
+    def incr(self, name: str, value: int = 1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def observe(self, name: str, seconds: float):
+        with self._lock:
+            histogram = self._histograms.get(name)
+            if histogram is None:
+                histogram = self._histograms[name] = Histogram()
+            histogram.observe(seconds)
+
+    # Time a block into the named histogram
+    @contextmanager
+    def timer(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "counters": dict(self._counters),
+                "histograms": {name: h.snapshot() for name, h in self._histograms.items()},
+            }
+
+
+# JSON-lines logger; callers only enqueue, a daemon thread formats and writes
+class StructuredLogger:
+    def __init__(self, stream=None, level: int = log_level, max_queue: int = log_queue_size):
+        self.stream = stream or sys.stdout
+        self.level = level
+        self.dropped = 0
+        self._queue = queue.Queue(max_queue)
+        threading.Thread(target=self._drain, name="log-writer", daemon=True).start()
+
+    def enabled(self, level: str) -> bool:
+        return LEVELS[level] >= self.level
+
+    # sample keeps roughly that share of calls, for records emitted per token or per chunk
+    def log(self, level: str, event: str, sample: float = None, **fields):
+        if LEVELS[level] < self.level:
+            return
+        if sample is not None and random.random() >= sample:
+            return
+        try:
+            self._queue.put_nowait((time.time(), level, event, fields))
+        except queue.Full:
+            self.dropped += 1
+            metrics.incr("log_records_dropped_total")
+
+    def debug(self, event: str, **fields):
+        self.log("debug", event, **fields)
+
+    def info(self, event: str, **fields):
+        self.log("info", event, **fields)
+
+    def warning(self, event: str, **fields):
+        self.log("warning", event, **fields)
+
+    def error(self, event: str, **fields):
+        self.log("error", event, **fields)
+
+    def _drain(self):
+        while True:
+            ts, level, event, fields = self._queue.get()
+            record = {"ts": round(ts, 6), "level": level, "event": event, **fields}
+            try:
+                self.stream.write(json.dumps(record, default=str) + "\n")
+                if self._queue.empty():
+                    self.stream.flush()
+            except Exception:
+                pass
+            self._queue.task_done()
+
+    # Wait for queued records to be written, used at shutdown
+    def flush(self, timeout: float = 2.0):
+        deadline = time.time() + timeout
+        while self._queue.unfinished_tasks and time.time() < deadline:
+            time.sleep(0.01)
+
+    def stats(self) -> dict:
+        return {"queued": self._queue.qsize(), "dropped": self.dropped, "level": self.level}
+
+
+metrics = MetricsRegistry()
+log = StructuredLogger()
+atexit.register(log.flush)
@@ -0,0 +1,241 @@
+import contextvars
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import closing, contextmanager
+from functools import wraps
+
+from langchain_core.callbacks import BaseCallbackHandler
+from telemetry import log, metrics
+
+# Local trace store, queryable through /traces
+trace_db_path = os.environ.get("TRACE_DB_PATH", "traces.db")
+# Oldest traces are pruned past this many
+trace_max_traces = int(os.environ.get("TRACE_MAX_TRACES", "5000"))
+
+# Fields of an Ollama response kept on LLM spans; *_duration values arrive in nanoseconds
+ollama_usage_fields = ("prompt_eval_count", "eval_count", "prompt_eval_duration", "eval_duration",
+                       "load_duration", "total_duration")
+
+current_span = contextvars.ContextVar("current_span", default=None)
+
+
+# One timed operation; spans of a request form a tree under the trace root
+class Span:
+    def __init__(self, name: str, parent=None, trace_id: str = None, **attrs):
+        self.id = uuid.uuid4().hex[:16]
+        self.name = name
+        self.parent = parent
+        self.trace_id = trace_id or (parent.trace_id if parent is not None else None)
+        self.attrs = attrs
+        self.children = []
+        self.started_at = time.time()
+        self._start = time.perf_counter()
+        self.duration = None
+        if parent is not None:
+            parent.children.append(self)
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def end(self):
+        if self.duration is None:
+            self.duration = time.perf_counter() - self._start
+
+    def walk(self, depth: int = 0):
+        yield self, depth
+        for child in list(self.children):
+            yield from child.walk(depth + 1)
+
+    # Durations in ms summed per span path, plus LLM token totals
+    def summary(self) -> dict:
+        breakdown = {}
+        llm = {"calls": 0, "prompt_eval_count": 0, "eval_count": 0}
+        paths = {self.id: ""}
+        for span, depth in self.walk():
+            if depth == 0:
+                continue
+            path = f"{paths[span.parent.id]}/{span.name}" if paths[span.parent.id] else span.name
+            paths[span.id] = path
+            breakdown[path] = round(breakdown.get(path, 0.0) + (span.duration or 0.0) * 1000, 1)
+            if "eval_count" in span.attrs:
+                llm["calls"] += 1
+                llm["prompt_eval_count"] += span.attrs.get("prompt_eval_count") or 0
+                llm["eval_count"] += span.attrs["eval_count"] or 0
+        return {
+            "trace_id": self.trace_id,
+            "total_ms": round((self.duration or 0.0) * 1000, 1),
+            "breakdown": breakdown,
+            "llm": llm,
+        }
+
+
+# Child of the current span, made current for the block; metric also records the duration
+@contextmanager
+def span(name: str, metric: str = None, **attrs):
+    current = Span(name, current_span.get(), **attrs)
+    token = current_span.set(current)
+    try:
+        yield current
+    finally:
+        current_span.reset(token)
+        current.end()
+        if metric:
+            metrics.observe(metric, current.duration)
+
+
+# Root span of a request; begin/end are split so a streamed request can run them in its context
+def begin_trace(name: str, **attrs) -> Span:
+    root = Span(name, trace_id=uuid.uuid4().hex, **attrs)
+    root._token = current_span.set(root)
+    return root
+
+
+def end_trace(root: Span) -> dict:
+    if root.duration is not None:
+        return root.summary()
+    current_span.reset(root._token)
+    root.end()
+    trace_store.record(root)
+    return root.summary()
+
+
+@contextmanager
+def start_trace(name: str, **attrs):
+    root = begin_trace(name, **attrs)
+    try:
+        yield root
+    finally:
+        end_trace(root)
+
+
+# Wrap a LangGraph node or router so every call runs in its own span
+def traced(name: str, fn, metric: str = None):
+    @wraps(fn)
+    def wrapper(state):
+        with span(name, metric=metric):
+            return fn(state)
+    return wrapper
+
+
+# Copy Ollama's token counts and timings from a response body onto a span
+def record_ollama_usage(target: Span, data: dict):
+    if target is None or not data:
+        return
+    for field in ollama_usage_fields:
+        value = data.get(field)
+        if value is None:
+            continue
+        target.attrs[field] = round(value / 1e9, 6) if field.endswith("_duration") else value
+
+
+# LangChain callback that records usage of ChatOllama calls onto the span it was created in
+class OllamaUsageHandler(BaseCallbackHandler):
+    def __init__(self, target: Span):
+        self.target = target
+
+    def on_llm_end(self, response, **kwargs):
+        for generations in response.generations:
+            for generation in generations:
+                record_ollama_usage(self.target, generation.generation_info or {})
+                message = getattr(generation, "message", None)
+                if message is not None:
+                    record_ollama_usage(self.target, getattr(message, "response_metadata", None) or {})
+
+
+# Finished traces written to SQLite by a background thread
+class TraceStore:
+    def __init__(self, path: str = trace_db_path, max_traces: int = trace_max_traces):
+        self.path = path
+        self.max_traces = max_traces
+        self._queue = queue.Queue(1000)
+        self._written = 0
+        self._init_lock = threading.Lock()
+        self._ready = False
+        threading.Thread(target=self._writer, name="trace-writer", daemon=True).start()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=5)
+        with self._init_lock:
+            if not self._ready:
+                conn.executescript("""
+                    CREATE TABLE IF NOT EXISTS traces (
+                        trace_id TEXT PRIMARY KEY, name TEXT, started_at REAL, duration_ms REAL, summary TEXT);
+                    CREATE TABLE IF NOT EXISTS spans (
+                        trace_id TEXT, span_id TEXT, parent_id TEXT, name TEXT, depth INTEGER,
+                        started_at REAL, duration_ms REAL, attrs TEXT);
+                    CREATE INDEX IF NOT EXISTS spans_trace ON spans (trace_id);
+                    CREATE INDEX IF NOT EXISTS traces_started ON traces (started_at);
+                """)
+                self._ready = True
+        return conn
+
+    def record(self, root: Span):
+        try:
+            self._queue.put_nowait(root)
+        except queue.Full:
+            metrics.incr("traces_dropped_total")
+
+    def _writer(self):
+        conn = None
+        while True:
+            root = self._queue.get()
+            try:
+                conn = conn or self._connect()
+                rows = [(root.trace_id, s.id, s.parent.id if s.parent else None, s.name, depth, s.started_at,
+                         round((s.duration or 0.0) * 1000, 3), json.dumps(s.attrs, default=str))
+                        for s, depth in root.walk()]
+                with conn:
+                    conn.execute("INSERT OR REPLACE INTO traces VALUES (?, ?, ?, ?, ?)",
+                                 (root.trace_id, root.name, root.started_at, round((root.duration or 0.0) * 1000, 3),
+                                  json.dumps(root.summary())))
+                    conn.executemany("INSERT INTO spans VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+                self._written += 1
+                if self._written % 100 == 0:
+                    self._prune(conn)
+            except sqlite3.Error as e:
+                log.warning("trace_write_failed", error=str(e))
+                if conn is not None:
+                    conn.close()
+                conn = None
+
+    def _prune(self, conn):
+        with conn:
+            cutoff = conn.execute("SELECT started_at FROM traces ORDER BY started_at DESC LIMIT 1 OFFSET ?",
+                                  (self.max_traces,)).fetchone()
+            if cutoff:
+                conn.execute("DELETE FROM spans WHERE trace_id IN (SELECT trace_id FROM traces WHERE started_at <= ?)", cutoff)
+                conn.execute("DELETE FROM traces WHERE started_at <= ?", cutoff)
+
+    # Recent traces, optionally only one request type or only slow ones
+    def list(self, name: str = None, min_ms: float = None, limit: int = 50) -> list:
+        query = "SELECT trace_id, name, started_at, duration_ms, summary FROM traces WHERE 1 = 1"
+        params = []
+        if name:
+            query += " AND name = ?"
+            params.append(name)
+        if min_ms is not None:
+            query += " AND duration_ms >= ?"
+            params.append(min_ms)
+        query += " ORDER BY started_at DESC LIMIT ?"
+        params.append(limit)
+        with closing(self._connect()) as conn:
+            rows = conn.execute(query, params).fetchall()
+        return [{"trace_id": r[0], "name": r[1], "started_at": r[2], "duration_ms": r[3], "summary": json.loads(r[4])}
+                for r in rows]
+
+    def get(self, trace_id: str):
+        with closing(self._connect()) as conn:
+            rows = conn.execute("SELECT span_id, parent_id, name, depth, started_at, duration_ms, attrs FROM spans "
+                                "WHERE trace_id = ? ORDER BY started_at", (trace_id,)).fetchall()
+        if not rows:
+            return None
+        return [{"span_id": r[0], "parent_id": r[1], "name": r[2], "depth": r[3], "started_at": r[4],
+                 "duration_ms": r[5], "attrs": json.loads(r[6])} for r in rows]
+
+
+trace_store = TraceStore()
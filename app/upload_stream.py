@@ -0,0 +1,135 @@
+import hashlib
+import os
+import uuid
+
+from multipart.multipart import MultipartParser, parse_options_header
+
+# Largest single uploaded file, enforced while the bytes arrive
+max_upload_bytes = int(os.environ.get("MAX_UPLOAD_MB", "200")) * 1024 * 1024
+# Whole request body, counted over every part including form fields and part headers
+max_request_bytes = int(os.environ.get("MAX_UPLOAD_REQUEST_MB", "1024")) * 1024 * 1024
+# Files accepted in one request
+max_upload_files = int(os.environ.get("MAX_UPLOAD_FILES", "50"))
+
+
+class UploadRejected(Exception):
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+# One file part written to a temporary path, hashed in the same pass
+class StreamedFile:
+    def __init__(self, file_name: str, tmp_path: str):
+        self.file_name = file_name
+        self.tmp_path = tmp_path
+        self.size = 0
+        self.sha256 = None
+        self._hasher = hashlib.sha256()
+        self._handle = open(tmp_path, "wb")
+
+    def write(self, data: bytes):
+        self._handle.write(data)
+        self._hasher.update(data)
+        self.size += len(data)
+
+    def close(self):
+        if not self._handle.closed:
+            self._handle.close()
+        self.sha256 = self._hasher.hexdigest()
+
+    def discard(self):
+        self.close()
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+
+
+# Parses a multipart/form-data body chunk by chunk, streaming file parts straight to disk
+class MultipartUploadReceiver:
+    def __init__(self, content_type: str, target_dir: str, suffix: str = ".pdf", max_bytes: int = max_upload_bytes,
+                 max_total_bytes: int = max_request_bytes, max_files: int = max_upload_files):
+        media_type, options = parse_options_header(content_type)
+        boundary = options.get(b"boundary")
+        if media_type != b"multipart/form-data" or not boundary:
+            raise UploadRejected(400, "expected multipart/form-data upload")
+
+        self.target_dir = target_dir
+        self.suffix = suffix
+        self.max_bytes = max_bytes
+        self.max_total_bytes = max_total_bytes
+        self.max_files = max_files
+        self.received = 0
+        self.files = []
+        self._current = None
+        self._headers = {}
+        self._field = b""
+        self._value = b""
+        self.parser = MultipartParser(boundary, {
+            "on_part_begin": self._on_part_begin,
+            "on_header_field": self._on_header_field,
+            "on_header_value": self._on_header_value,
+            "on_header_end": self._on_header_end,
+            "on_headers_finished": self._on_headers_finished,
+            "on_part_data": self._on_part_data,
+            "on_part_end": self._on_part_end,
+        })
+
+    def _on_part_begin(self):
+        self._headers = {}
+        self._current = None
+
+    def _on_header_field(self, data, start, end):
+        self._field += data[start:end]
+
+    def _on_header_value(self, data, start, end):
+        self._value += data[start:end]
+
+    def _on_header_end(self):
+        self._headers[self._field.lower()] = self._value
+        self._field = b""
+        self._value = b""
+
+    def _on_headers_finished(self):
+        _, options = parse_options_header(self._headers.get(b"content-disposition", b""))
+        raw_name = options.get(b"filename")
+        if raw_name is None:
+            return
+        file_name = os.path.basename(raw_name.decode("utf-8", errors="replace"))
+        if not file_name.endswith(self.suffix):
+            raise UploadRejected(400, f"only {self.suffix.lstrip('.')} files allowed: {file_name}")
+        if len(self.files) >= self.max_files:
+            raise UploadRejected(413, f"at most {self.max_files} files per upload")
+        tmp_path = os.path.join(self.target_dir, f".upload-{uuid.uuid4().hex}.part")
+        self._current = StreamedFile(file_name, tmp_path)
+        self.files.append(self._current)
+
+    def _on_part_data(self, data, start, end):
+        if self._current is None:
+            return
+        self._current.write(data[start:end])
+        if self._current.size > self.max_bytes:
+            raise UploadRejected(413, f"{self._current.file_name} exceeds the {self.max_bytes // (1024 * 1024)} MB upload limit")
+
+    def _on_part_end(self):
+        if self._current is not None:
+            self._current.close()
+            self._current = None
+
+    # Feed the request body through the parser; nothing larger than one network chunk is held
+    async def receive(self, stream) -> list:
+        try:
+            async for chunk in stream:
+                self.received += len(chunk)
+                if self.received > self.max_total_bytes:
+                    raise UploadRejected(413, f"upload exceeds the {self.max_total_bytes // (1024 * 1024)} MB request limit")
+                self.parser.write(chunk)
+            self.parser.finalize()
+        except BaseException:
+            self.discard()
+            raise
+        return self.files
+
+    def discard(self):
+        for streamed in self.files:
+            streamed.discard()
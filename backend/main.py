@@ -1,8 +1,10 @@
-from fastapi import FastAPI, HTTPException, UploadFile, File
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi.responses import JSONResponse, StreamingResponse, PlainTextResponse
+from starlette.concurrency import run_in_threadpool
 from pydantic import BaseModel
 from typing import List, Optional
+import asyncio
 import os
 import shutil
 import time
@@ -10,16 +12,67 @@ import json
 import traceback
 import sys
 import uuid
+import threading
+import contextvars
 
 # Add the app directory to the path to import existing modules
 sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'app'))
 
-from enhanced_pdf_to_md import pdf_to_markdown
+from enhanced_pdf_to_md import pdf_to_markdown, count_pages, is_converted, markdown_path_for
 from chunks import create_retriever
 from qa_graph import build_graph as build_qa_graph
+from llm_scheduler import llm_scheduler, SchedulerSaturated, PRIORITY_INTERACTIVE, start_request_stats, warm_up
+from llm_nodes import model as chat_model
+from single_flight import SingleFlight, flight_key
+from sessions import session_store
+from qa_graph import strip_sources
+from prompt_layout import documents_text
+from llm_nodes import generator, stream_generation, reuse_ollama_context, context_reuse_max_tokens
+from da_graph import get_da_graph
+from dataset_store import resolve_data_file, file_sha256
+from job_queue import JobQueue, JobQueueFull, JobCancelled
+from ingest_registry import IngestRegistry
+from upload_stream import MultipartUploadReceiver, UploadRejected
+from telemetry import log, metrics, log_sample_rate
+from tracing import begin_trace, end_trace, start_trace, span, record_ollama_usage, OllamaUsageHandler, trace_store
+from profiler import request_profiler, current_profile, profiled
 
 app = FastAPI(title="AI Assistant API", version="1.0.0")
 
+class ProfilingMiddleware:
+    """Sample stacks for the whole of an armed request, streamed bodies included"""
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        # Disarmed, this is the only work added to a request
+        if scope["type"] != "http" or not request_profiler.armed:
+            return await self.app(scope, receive, send)
+        headers = {k.decode("latin-1").lower(): v.decode("latin-1") for k, v in scope["headers"]}
+        if not request_profiler.should_profile(headers):
+            return await self.app(scope, receive, send)
+
+        session = request_profiler.start(f"{scope['method']} {scope['path']}")
+        # The event loop thread is sampled for the whole request, threadpool and producer
+        # threads only while they run work wrapped with profiled()
+        token = current_profile.set(session)
+        loop_thread = threading.get_ident()
+        session.attach(loop_thread)
+
+        async def send_with_profile_id(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + [(b"x-profile-id", session.id.encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_profile_id)
+        finally:
+            session.detach(loop_thread)
+            current_profile.reset(token)
+            await run_in_threadpool(request_profiler.finish, session)
+
+app.add_middleware(ProfilingMiddleware)
+
 # CORS middleware to allow React frontend
 app.add_middleware(
     CORSMiddleware,
@@ -32,20 +85,62 @@ app.add_middleware(
 # Global variables
 faiss_db_path = "faiss_db"
 files_path = "files"
+da_data_file = os.path.join(files_path, "clean_data.csv")
+# Rows of a result table sent to the client with the execution event
+da_preview_rows = 50
+# Models loaded into Ollama at startup so the first question does not pay the load
+warm_models = [m for m in os.environ.get("OLLAMA_WARM_MODELS", chat_model).split(",") if m]
+# In-flight coalescing of identical questions
+qa_flights = SingleFlight()
+qa_stream_flights = SingleFlight()
+# Seconds without a token before an idle stream sends a heartbeat and rechecks its client
+sse_heartbeat_seconds = float(os.environ.get("SSE_HEARTBEAT_SECONDS", "15"))
+stream_metrics = {"client_disconnects_total": 0, "cancelled_generations_total": 0}
+# Ingestion runs as background jobs; building the shared FAISS index is serialized
+ingest_jobs = JobQueue()
+index_build_lock = threading.Lock()
+# Content hashes of ingested PDFs, uploads of known content are skipped
+ingest_registry = IngestRegistry(files_path)
+# When set, /admin routes require it in the X-Admin-Token header; unset, they only answer local clients
+admin_token = os.environ.get("ADMIN_TOKEN")
+local_hosts = ("127.0.0.1", "::1", "localhost")
 
 # Pydantic models for request/response
 class ChatMessage(BaseModel):
     content: str
+    # Stateless clients send the full history; clients with a session from POST /sessions send only session_id
     conversation_history: Optional[List[tuple]] = []
+    session_id: Optional[str] = None
 
 class ChatResponse(BaseModel):
     content: str
     response_time: float
+    model_loads: int = 0
+    shared: bool = False
+    session_id: Optional[str] = None
+    timings: Optional[dict] = None
+
+class DAChatResponse(BaseModel):
+    content: str
+    response_time: float
+    plan: str = ""
+    code: str = ""
+    output: str = ""
+    model_loads: int = 0
+    llm_calls: int = 0
+    timings: dict = {}
+    trace: Optional[dict] = None
 
 class StatusResponse(BaseModel):
     status: str
     message: str
 
+class ProfilerSettings(BaseModel):
+    requests: int = 0
+    header: Optional[str] = None
+    header_value: str = "1"
+    interval_ms: Optional[float] = None
+
 class DatabaseStatus(BaseModel):
     exists: bool
     file_count: int
@@ -65,9 +160,206 @@ def get_database_status():
         file_count = len([f for f in os.listdir(files_path) if f.endswith('.pdf')])
     return DatabaseStatus(exists=exists, file_count=file_count)
 
+def get_index_version():
+    """Identify the current FAISS index so answers from a replaced index are never shared"""
+    index_file = os.path.join(faiss_db_path, "index.faiss")
+    if not os.path.exists(index_file):
+        return "none"
+    return str(os.stat(index_file).st_mtime_ns)
+
+def resolve_history(message: ChatMessage):
+    """Return (session, history) for a chat turn; without a session_id the turn is stateless"""
+    if message.session_id:
+        session = session_store.get(message.session_id)
+        if session is None:
+            raise HTTPException(status_code=404, detail="session not found. start a new conversation.")
+        return session, session.compacted_history()
+    # Sessions are only created through POST /sessions, so one-off clients leave no state behind
+    return None, message.conversation_history or []
+
+def produce_stream_events(flight, message, session, history, retriever, ticket, stats):
+    """Run retrieval and LLM streaming once, publishing events to every subscriber"""
+    # The producer runs in its own thread, so its trace starts here
+    root = begin_trace("qa_chat_stream", history=len(history))
+    try:
+        # Report queue position until the scheduler admits this request
+        with span("queue_wait", metric="qa_stream_queue_wait_seconds"):
+            while not ticket.wait(timeout=1.0):
+                if flight.cancelled:
+                    stream_metrics["cancelled_generations_total"] += 1
+                    log.info("stream_cancelled", stage="queued")
+                    root.set(cancelled=True)
+                    return
+                position = ticket.position()
+                log.debug("stream_queued", position=position)
+                flight.publish({'type': 'queued', 'position': position})
+
+        # First get documents (retrieval phase)
+        with span("retriever", metric="qa_retrieve_seconds") as retrieval:
+            docs = retriever.get_relevant_documents(message.content)
+        knowledge_base = documents_text(docs)
+        log.debug("stream_retrieved", documents=len(docs), context_chars=len(knowledge_base),
+                  seconds=round(retrieval.duration, 3))
+
+        # Stream the LLM response directly
+        stream_start = time.time()
+        generator_inputs = {
+            "conversation_history": history,
+            "document": knowledge_base,
+            "question": message.content
+        }
+        with span("llm", metric="qa_stream_generate_seconds", model=chat_model, stream=True) as llm_span:
+            generation_result = {}
+            if session is not None and reuse_ollama_context:
+                # Follow-up turns continue from Ollama's context so earlier turns are not prefilled again
+                covered_turns = len(session.turns)
+                context = session.reusable_context(context_reuse_max_tokens)
+                metrics.incr("qa_context_reused_total" if context else "qa_context_new_total")
+                llm_span.set(reused_context=bool(context))
+                stream_generator = stream_generation(generator_inputs, context, generation_result)
+            else:
+                stream_generator = generator.stream(generator_inputs, config={"callbacks": [OllamaUsageHandler(llm_span)]})
+
+            response_content = ""
+            chunk_count = 0
+            for chunk in stream_generator:
+                if flight.cancelled:
+                    # Closing the generator closes the HTTP stream, which stops Ollama generating
+                    stream_generator.close()
+                    stream_metrics["cancelled_generations_total"] += 1
+                    log.info("stream_cancelled", stage="generating", chunks=chunk_count)
+                    root.set(cancelled=True)
+                    return
+                if chunk:
+                    chunk_count += 1
+                    if chunk_count == 1:
+                        first_token = time.time() - stream_start
+                        llm_span.set(first_token=round(first_token, 6))
+                        metrics.observe("qa_stream_first_token_seconds", first_token)
+                    response_content += chunk
+                    log.debug("stream_chunk", sample=log_sample_rate, index=chunk_count, chars=len(chunk))
+                    # Send each chunk as it arrives
+                    flight.publish({'content': chunk, 'type': 'chunk'})
+            llm_span.set(chunks=chunk_count)
+
+        stream_time = time.time() - stream_start
+        metrics.incr("qa_stream_chunks_total", chunk_count)
+        if generation_result:
+            record_ollama_usage(llm_span, generation_result.get("usage"))
+            metrics.observe("qa_prefill_seconds", generation_result["prompt_eval_duration"])
+            session.store_context(covered_turns + 1, generation_result.get("context"))
+        # Counted from Ollama's reported load time, not from the scheduler's residency guess
+        ticket.record_load(llm_span.attrs.get("load_duration"))
+
+        # Add sources after the main content
+        from qa_graph import format_sources_for_display
+        source_info = format_sources_for_display(docs)
+        if source_info:
+            flight.publish({'content': source_info, 'type': 'chunk'})
+
+        # Send completion signal, each subscriber fills in its own response time
+        log.info("stream_complete", chunks=chunk_count, chars=len(response_content),
+                 seconds=round(stream_time, 3), subscribers=flight.subscribers)
+        flight.publish({'type': 'complete', 'model_loads': stats['model_loads'], 'timings': end_trace(root)})
+
+    except Exception as e:
+        metrics.incr("qa_stream_errors_total")
+        log.error("stream_failed", error=str(e), traceback=traceback.format_exc())
+        root.set(error=str(e))
+        raise
+    finally:
+        ticket.release()
+        end_trace(root)
+
+def get_da_data_file():
+    """Return the cleaned data file, preferring its Parquet copy"""
+    path = resolve_data_file(da_data_file)
+    if not os.path.exists(path):
+        raise HTTPException(status_code=400, detail="no data file found. upload csv data first.")
+    return path
+
+def result_preview(result):
+    """First rows of an execution result table as JSON-safe split records"""
+    frame = result.get("dataframe")
+    if frame is None:
+        return None
+    preview = json.loads(frame.head(da_preview_rows).to_json(orient="split", date_format="iso", default_handler=str))
+    preview["total_rows"] = len(frame)
+    return preview
+
+def da_node_events(node, state):
+    """Translate a finished DA graph node into the events shown to the client"""
+    events = []
+    cache_hit = node == "lookup_cache" and state.get("cache_status") == "hit"
+    if node == "lookup_cache":
+        events.append({'type': 'cache', 'hit': cache_hit})
+    if node in ("plan", "plan_and_code") or cache_hit:
+        events.append({'type': 'plan', 'content': state.get("plan", "")})
+    if node in ("generate_code", "plan_and_code") or cache_hit:
+        events.append({'type': 'code', 'content': state.get("code", ""), 'language': state.get("language", "python")})
+    if node == "execute_code":
+        result = state.get("execution_result") or {}
+        events.append({
+            'type': 'execution',
+            'output': result.get("output", ""),
+            'error': result.get("error"),
+            'value': result.get("value"),
+            'table': result_preview(result)
+        })
+    if node == "analyze_results":
+        events.append({'type': 'analysis', 'content': state.get("generation", "")})
+
+    duration = (state.get("timings") or {}).get(node)
+    return [{**event, 'node': node, 'duration': duration} for event in events]
+
+def saturated_response(e: SchedulerSaturated):
+    """Build the 429 returned when the LLM queue is full"""
+    return JSONResponse(
+        status_code=429,
+        content={"detail": f"server busy: {str(e)}. retry shortly.", "queued": e.queued},
+        headers={"Retry-After": "5"}
+    )
+
 
 # API Routes
 
+@app.on_event("startup")
+async def warm_up_models():
+    """Load the chat model and DA graph in the background so startup is not blocked"""
+    def run():
+        for name in warm_models:
+            try:
+                warm_up(name)
+                log.info("model_warmed_up", model=name)
+            except Exception as e:
+                log.warning("model_warm_up_failed", model=name, error=str(e))
+        # Build the DA graph now so its sandbox workers load the dataset before the first question
+        if os.path.exists(resolve_data_file(da_data_file)):
+            try:
+                get_da_graph(da_data_file)
+                log.info("da_graph_ready")
+            except Exception as e:
+                log.warning("da_graph_warm_up_failed", error=str(e))
+
+    threading.Thread(target=run, daemon=True).start()
+
+@app.on_event("startup")
+async def resume_ingestion():
+    """Requeue ingestion that a restart interrupted: unregistered PDFs or an unfinished index build"""
+    if not os.path.exists(files_path):
+        return
+    pending = [os.path.join(files_path, f) for f in sorted(os.listdir(files_path)) if f.endswith('.pdf')]
+    hashes = {}
+    for pdf_path in pending:
+        sha256 = file_sha256(pdf_path)
+        if ingest_registry.reserve(sha256, os.path.basename(pdf_path)):
+            hashes[sha256] = os.path.basename(pdf_path)
+    pending = [p for p in pending if os.path.basename(p) in hashes.values()]
+    if not pending and not os.path.exists(f"{faiss_db_path}.build"):
+        return
+    job = ingest_jobs.submit("ingest", ingest_documents, pending, hashes, on_cancel=discard_upload)
+    log.info("ingestion_resumed", files=len(pending), job=job.id)
+
 @app.get("/")
 async def root():
     return {"message": "ai assistant api"}
@@ -76,6 +368,95 @@ async def root():
 async def health_check():
     return {"status": "healthy"}
 
+@app.get("/scheduler/metrics")
+async def scheduler_metrics():
+    """Get LLM queue depth, queue-wait statistics and request coalescing counts"""
+    return {
+        **llm_scheduler.metrics(),
+        "single_flight": {
+            "chat": {**qa_flights.metrics, "inflight": qa_flights.inflight()},
+            "stream": {**qa_stream_flights.metrics, "inflight": qa_stream_flights.inflight()},
+        },
+        "streams": stream_metrics
+    }
+
+@app.get("/metrics")
+async def get_metrics():
+    """Get request counters, per-stage latency histograms and logger queue state"""
+    return {**metrics.snapshot(), "log": log.stats()}
+
+@app.get("/traces")
+async def list_traces(name: Optional[str] = None, min_ms: Optional[float] = None, limit: int = 50):
+    """List recent request traces with their timing breakdown, optionally only slow ones"""
+    return {"traces": await run_in_threadpool(trace_store.list, name, min_ms, min(limit, 500))}
+
+@app.get("/traces/{trace_id}")
+async def get_trace(trace_id: str):
+    """Get every span of one request trace"""
+    spans = await run_in_threadpool(trace_store.get, trace_id)
+    if spans is None:
+        raise HTTPException(status_code=404, detail="trace not found")
+    return {"trace_id": trace_id, "spans": spans}
+
+def require_admin(request: Request):
+    if admin_token:
+        if request.headers.get("x-admin-token") != admin_token:
+            raise HTTPException(status_code=403, detail="admin token required")
+    elif request.client is None or request.client.host not in local_hosts:
+        raise HTTPException(status_code=403, detail="admin routes are local only unless ADMIN_TOKEN is set")
+
+@app.get("/admin/profiler")
+async def profiler_status(request: Request):
+    """Get the profiler switch and the stored per-request profiles"""
+    require_admin(request)
+    return {**request_profiler.status(), "profiles": request_profiler.list_profiles()}
+
+@app.post("/admin/profiler")
+async def arm_profiler(settings: ProfilerSettings, request: Request):
+    """Profile the next N requests, and/or every request carrying the given header"""
+    require_admin(request)
+    if settings.requests <= 0 and not settings.header:
+        raise HTTPException(status_code=400, detail="set requests or header")
+    request_profiler.arm(settings.requests, settings.header, settings.header_value, settings.interval_ms)
+    return request_profiler.status()
+
+@app.delete("/admin/profiler")
+async def disarm_profiler(request: Request):
+    """Stop profiling new requests"""
+    require_admin(request)
+    request_profiler.disarm()
+    return request_profiler.status()
+
+@app.get("/admin/profiler/profiles/{profile_id}")
+async def get_profile(profile_id: str, request: Request):
+    """Get one profile as folded stacks, the input format of flamegraph.pl and speedscope"""
+    require_admin(request)
+    folded = request_profiler.read(profile_id)
+    if folded is None:
+        raise HTTPException(status_code=404, detail="profile not found")
+    return PlainTextResponse(folded)
+
+@app.post("/sessions")
+async def create_session():
+    """Start a server-side conversation session"""
+    session = session_store.create()
+    return {"session_id": session.id}
+
+@app.get("/sessions/{session_id}")
+async def get_session(session_id: str):
+    """Get turn count, cached summary and history size for a session"""
+    session = session_store.get(session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="session not found")
+    return session.stats()
+
+@app.delete("/sessions/{session_id}")
+async def delete_session(session_id: str):
+    """End a session and drop its stored history"""
+    if not session_store.delete(session_id):
+        raise HTTPException(status_code=404, detail="session not found")
+    return StatusResponse(status="success", message="session deleted")
+
 @app.get("/database/status")
 async def database_status():
     """Get the current database status"""
@@ -86,8 +467,10 @@ async def database_status():
 async def reset_database():
     """Reset the database and clear all files"""
     try:
-        if os.path.exists(faiss_db_path):
-            shutil.rmtree(faiss_db_path)
+        # Unfinished build checkpoints go too, otherwise the next build would resume stale work
+        for path in (faiss_db_path, f"{faiss_db_path}.build", f"{faiss_db_path}.staging", f"{faiss_db_path}.old"):
+            if os.path.exists(path):
+                shutil.rmtree(path)
         if os.path.exists(files_path):
             shutil.rmtree(files_path)
         ensure_directories()
@@ -95,239 +478,476 @@ async def reset_database():
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"failed to reset database: {str(e)}")
 
+def discard_upload(uploaded_files, hashes):
+    """Drop a cancelled upload: release its reserved hashes and remove its files so a restart does not requeue them"""
+    for sha256 in hashes:
+        ingest_registry.release(sha256)
+    for pdf_path in uploaded_files:
+        for path in (pdf_path, markdown_path_for(pdf_path)):
+            if os.path.exists(path):
+                os.remove(path)
+
+def ingest_documents(job, uploaded_files, hashes):
+    """Convert uploaded PDFs and build the FAISS database, then record their content hashes"""
+    try:
+        result = build_documents(job, uploaded_files)
+    except JobCancelled:
+        discard_upload(uploaded_files, hashes)
+        raise
+    except BaseException:
+        for sha256 in hashes:
+            ingest_registry.release(sha256)
+        raise
+    ingest_registry.commit(hashes)
+    return result
+
+def build_documents(job, uploaded_files):
+    """Convert PDFs and build the FAISS database, reporting progress on the job"""
+    stats = start_request_stats()
+
+    # Process PDFs to markdown, progress is counted in pages across all files
+    conversion_start = time.time()
+    page_counts = [count_pages(pdf_path) for pdf_path in uploaded_files]
+    total_pages = sum(page_counts)
+    converted_pages = 0
+    job.progress("convert", 0, total_pages)
+    for i, pdf_path in enumerate(uploaded_files):
+        # Documents converted before a restart are not converted again
+        if is_converted(pdf_path):
+            converted_pages += page_counts[i]
+            job.progress("convert", converted_pages, total_pages)
+            log.info("pdf_already_converted", job=job.id, file=os.path.basename(pdf_path))
+            continue
+        offset = converted_pages
+        pdf_to_markdown(pdf_path, progress=lambda done, total: job.progress("convert", offset + done, total_pages))
+        converted_pages += page_counts[i]
+        log.info("pdf_converted", job=job.id, file=os.path.basename(pdf_path), pages=page_counts[i])
+
+    conversion_time = time.time() - conversion_start
+    metrics.observe("ingest_convert_seconds", conversion_time)
+
+    # Create retriever (this builds the FAISS database)
+    db_start = time.time()
+    with index_build_lock:
+        create_retriever(files_path, faiss_db_path, progress=job.progress)
+    db_time = time.time() - db_start
+    log.info("ingestion_built", job=job.id, files=len(uploaded_files), pages=total_pages,
+             convert_seconds=round(conversion_time, 3), index_seconds=round(db_time, 3),
+             model_loads=stats["model_loads"], models_loaded=stats["models_loaded"])
+    return {"files": len(uploaded_files), "pages": total_pages, "model_loads": stats["model_loads"]}
+
+
 @app.post("/documents/upload")
-async def upload_documents(files: List[UploadFile] = File(...)):
+async def upload_documents(request: Request):
     """Upload PDF documents and create database"""
     try:
-        print(f"\n=== DOCUMENT UPLOAD START ===")
-        print(f"Number of files received: {len(files)}")
-
+        metrics.incr("upload_requests_total")
         upload_start = time.time()
         ensure_directories()
-        print(f"Directories ensured: {files_path}, {faiss_db_path}")
 
-        # Save uploaded files
+        # Stream each file part to disk in network-sized chunks, hashing and size-checking as it arrives
+        receiver = MultipartUploadReceiver(request.headers.get("content-type", ""), files_path)
+        received = await receiver.receive(request.stream())
+        if not received:
+            raise HTTPException(status_code=400, detail="no files uploaded")
+
+        # Save new files, skip content that is already ingested or queued
         uploaded_files = []
-        for i, file in enumerate(files):
-            print(f"Processing file {i+1}/{len(files)}: {file.filename}")
-
-            if not file.filename.endswith('.pdf'):
-                print(f"ERROR: Invalid file type for {file.filename}")
-                raise HTTPException(status_code=400, detail=f"only pdf files allowed: {file.filename}")
-
-            file_path = os.path.join(files_path, file.filename)
-            file_size = 0
-            with open(file_path, "wb") as f:
-                content = await file.read()
-                file_size = len(content)
-                f.write(content)
+        hashes = {}
+        skipped = []
+        for streamed in received:
+            if not ingest_registry.reserve(streamed.sha256, streamed.file_name):
+                existing = ingest_registry.lookup(streamed.sha256)
+                log.info("upload_duplicate", file=streamed.file_name, existing=existing, sha256=streamed.sha256[:12])
+                streamed.discard()
+                skipped.append(streamed.file_name)
+                continue
+
+            file_path = os.path.join(files_path, streamed.file_name)
+            os.replace(streamed.tmp_path, file_path)
             uploaded_files.append(file_path)
-            print(f"  - Saved: {file.filename} ({file_size:,} bytes)")
+            hashes[streamed.sha256] = streamed.file_name
+            log.debug("upload_saved", file=streamed.file_name, bytes=streamed.size, sha256=streamed.sha256[:12])
 
         upload_time = time.time() - upload_start
-        print(f"File upload completed in {upload_time:.3f}s")
-
-        # Process PDFs to markdown
-        print("Converting PDFs to markdown...")
-        conversion_start = time.time()
-        for i, pdf_path in enumerate(uploaded_files):
-            print(f"Converting PDF {i+1}/{len(uploaded_files)}: {os.path.basename(pdf_path)}")
-            pdf_to_markdown(pdf_path)
-            print(f"  - Converted: {os.path.basename(pdf_path)}")
-
-        conversion_time = time.time() - conversion_start
-        print(f"PDF conversion completed in {conversion_time:.3f}s")
-
-        # Create retriever (this builds the FAISS database)
-        print("Building FAISS database...")
-        db_start = time.time()
-        create_retriever(files_path, faiss_db_path)
-        db_time = time.time() - db_start
-        print(f"FAISS database created in {db_time:.3f}s")
-
-        total_time = time.time() - upload_start
-        print(f"Total upload process time: {total_time:.3f}s")
-        print(f"=== DOCUMENT UPLOAD END ===\n")
-
-        return StatusResponse(status="success", message=f"uploaded {len(uploaded_files)} files and created database")
+        metrics.observe("upload_receive_seconds", upload_time)
+        log.info("upload_received", files=len(received), saved=len(uploaded_files), skipped=len(skipped),
+                 seconds=round(upload_time, 3))
+
+        if not uploaded_files:
+            return {"status": "skipped", "message": f"all {len(skipped)} files were already ingested", "skipped": skipped}
+
+        # Conversion, captioning, summaries and embedding run as a background job
+        try:
+            job = ingest_jobs.submit("ingest", ingest_documents, uploaded_files, hashes, on_cancel=discard_upload)
+        except JobQueueFull:
+            for sha256 in hashes:
+                ingest_registry.release(sha256)
+            raise
+
+        return JSONResponse(
+            status_code=202,
+            content={
+                "status": "queued",
+                "message": f"uploaded {len(uploaded_files)} files, building database",
+                "job_id": job.id,
+                "skipped": skipped
+            }
+        )
 
+    except HTTPException:
+        raise
+    except UploadRejected as e:
+        metrics.incr("upload_rejected_total")
+        log.warning("upload_rejected", status=e.status_code, detail=e.detail)
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    except JobQueueFull as e:
+        log.warning("ingestion_queue_full", queued=e.queued)
+        return JSONResponse(
+            status_code=429,
+            content={"detail": f"ingestion busy: {str(e)}. retry later.", "queued": e.queued},
+            headers={"Retry-After": "30"}
+        )
     except Exception as e:
-        print(f"ERROR in upload_documents: {str(e)}")
-        traceback.print_exc()
+        metrics.incr("upload_errors_total")
+        log.error("upload_failed", error=str(e), traceback=traceback.format_exc())
         raise HTTPException(status_code=500, detail=f"failed to upload documents: {str(e)}")
 
+@app.get("/jobs")
+async def list_jobs():
+    """List recent ingestion jobs with their progress"""
+    return {"jobs": ingest_jobs.list()}
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Get per-stage progress and ETA for an ingestion job"""
+    job = ingest_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="job not found")
+    return job.snapshot()
+
+@app.post("/jobs/{job_id}/cancel")
+async def cancel_job(job_id: str):
+    """Cancel a queued job, or stop a running one at its next progress check"""
+    if ingest_jobs.get(job_id) is None:
+        raise HTTPException(status_code=404, detail="job not found")
+    if not ingest_jobs.cancel(job_id):
+        raise HTTPException(status_code=409, detail="job already finished")
+    return StatusResponse(status="success", message="cancellation requested")
+
 @app.post("/qa/chat")
 async def qa_chat(message: ChatMessage):
     """Process Q&A chat message"""
     try:
-        print(f"\n=== QA CHAT REQUEST START ===")
-        print(f"Question: {message.content}")
-        print(f"Conversation History: {len(message.conversation_history)} messages")
+        metrics.incr("qa_requests_total")
+        session, history = resolve_history(message)
+        log.info("qa_request", question_chars=len(message.content), history=len(history),
+                 session=session.id if session else None)
 
         if not os.path.exists(faiss_db_path):
-            print(f"ERROR: FAISS database not found at {faiss_db_path}")
+            log.error("faiss_db_missing", path=faiss_db_path)
             raise HTTPException(status_code=400, detail="no database found. upload documents first.")
 
         start_time = time.time()
-        print(f"Request start time: {start_time}")
-
-        # Build QA graph with retriever
-        print("Building QA graph and retriever...")
-        retriever_start = time.time()
-        retriever = create_retriever(files_path, faiss_db_path)
-        app_graph = build_qa_graph(retriever)
-        retriever_time = time.time() - retriever_start
-        print(f"QA graph built in {retriever_time:.3f}s")
 
         inputs = {
             "question": message.content,
-            "conversation_history": message.conversation_history
+            "conversation_history": history
         }
-        print(f"Graph inputs prepared: {inputs}")
 
-        # Stream through the graph
-        print("Starting graph execution...")
+        # Graph setup and execution block on disk and LLM calls, keep them off the event loop
+        def run_graph():
+            stats = start_request_stats()
+
+            with start_trace("qa_chat", history=len(history)) as root:
+                # Build QA graph with retriever
+                with span("setup", metric="qa_setup_seconds"):
+                    retriever = create_retriever(files_path, faiss_db_path)
+                    app_graph = build_qa_graph(retriever)
+
+                # Stream through the graph
+                final_state = {}
+                step_count = 0
+                for output in app_graph.stream(inputs):
+                    step_count += 1
+                    for key, value in output.items():
+                        if key == "generate":
+                            final_state = value
+            return final_state, step_count, stats, root.summary()
+
+        # Identical concurrent questions attach to the computation already running
         graph_start = time.time()
         full_response = ""
-
-        final_state = {}
-        step_count = 0
-        for output in app_graph.stream(inputs):
-            step_count += 1
-            print(f"Graph step {step_count}: {list(output.keys())}")
-            for key, value in output.items():
-                if key == "generate":
-                    final_state = value
-                    print(f"Final generation received (length: {len(value.get('generation', ''))} chars)")
+        key = flight_key(message.content, history, get_index_version())
+        (final_state, step_count, stats, timings), shared = await run_in_threadpool(profiled(qa_flights.run), key, run_graph)
+        if shared:
+            metrics.incr("qa_requests_shared_total")
 
         graph_time = time.time() - graph_start
-        print(f"Graph execution completed in {graph_time:.3f}s ({step_count} steps)")
+        metrics.observe("qa_graph_seconds", graph_time)
 
         if final_state:
             full_response = final_state.get("generation", "")
-            print(f"Response extracted (length: {len(full_response)} chars)")
 
         if not full_response:
             full_response = "i couldn't generate a response. please try rephrasing your question."
-            print("WARNING: No response generated, using fallback message")
+            metrics.incr("qa_empty_responses_total")
+            log.warning("qa_empty_response")
+        elif session is not None:
+            session_store.record_turn(session, message.content, strip_sources(full_response))
 
         end_time = time.time()
         response_time = end_time - start_time
-        print(f"Total request time: {response_time:.3f}s")
-        print(f"=== QA CHAT REQUEST END ===\n")
+        metrics.observe("qa_request_seconds", response_time)
+        log.info("qa_response", seconds=round(response_time, 3), steps=step_count, chars=len(full_response),
+                 shared=shared, model_loads=stats["model_loads"])
 
         return ChatResponse(
             content=full_response,
-            response_time=response_time
+            response_time=response_time,
+            model_loads=stats["model_loads"],
+            shared=shared,
+            session_id=session.id if session else None,
+            timings=timings
         )
 
+    except HTTPException:
+        raise
+    except SchedulerSaturated as e:
+        metrics.incr("qa_rejected_total")
+        log.warning("scheduler_saturated", error=str(e))
+        return saturated_response(e)
     except Exception as e:
-        print(f"ERROR in qa_chat: {str(e)}")
-        traceback.print_exc()
+        metrics.incr("qa_errors_total")
+        log.error("qa_failed", error=str(e), traceback=traceback.format_exc())
         raise HTTPException(status_code=500, detail=f"chat processing failed: {str(e)}")
 
 @app.post("/qa/chat/stream")
-async def qa_chat_stream(message: ChatMessage):
+async def qa_chat_stream(message: ChatMessage, request: Request):
     """Process Q&A chat message with streaming response"""
     try:
-        print(f"\n=== STREAMING CHAT REQUEST START ===")
-        print(f"Question: {message.content}")
-        print(f"Conversation History: {len(message.conversation_history)} messages")
+        metrics.incr("qa_stream_requests_total")
+        session, history = resolve_history(message)
+        log.info("qa_stream_request", question_chars=len(message.content), history=len(history),
+                 session=session.id if session else None)
 
         if not os.path.exists(faiss_db_path):
-            print(f"ERROR: FAISS database not found at {faiss_db_path}")
+            log.error("faiss_db_missing", path=faiss_db_path)
             raise HTTPException(status_code=400, detail="no database found. upload documents first.")
 
-        # Build QA graph with retriever
-        print("Building QA graph and retriever for streaming...")
-        setup_start = time.time()
-        retriever = create_retriever(files_path, faiss_db_path)
-        app_graph = build_qa_graph(retriever)
-        setup_time = time.time() - setup_start
-        print(f"QA graph built in {setup_time:.3f}s")
+        # Identical concurrent questions share one computation and one token stream
+        key = flight_key(message.content, history, get_index_version())
+        # Attached up front so a disconnect of this client can cancel the shared generation
+        flight, is_leader = qa_stream_flights.join(key, attach=True)
 
-        inputs = {
-            "question": message.content,
-            "conversation_history": message.conversation_history
-        }
-        print(f"Stream inputs prepared: {inputs}")
+        if is_leader:
+            try:
+                # Load the retriever; reading the index from disk stays off the event loop
+                setup_start = time.time()
+                retriever = await run_in_threadpool(profiled(create_retriever), files_path, faiss_db_path)
+                metrics.observe("qa_setup_seconds", time.time() - setup_start)
+
+                # Reserve an LLM slot up front so a full queue is reported as 429
+                stats = start_request_stats()
+                ticket = llm_scheduler.enqueue(PRIORITY_INTERACTIVE, chat_model)
+            except Exception as e:
+                flight.finish(error=e)
+                flight.detach()
+                raise
+
+            flight.start(profiled(lambda flight: produce_stream_events(flight, message, session, history, retriever, ticket, stats)))
+        else:
+            metrics.incr("qa_stream_requests_shared_total")
+            log.debug("stream_attached", key=key[:12], subscribers=flight.subscribers)
 
+        # Waits for events in the threadpool at most one heartbeat at a time, so a closed
+        # connection is noticed even while the model is silent
         async def generate_stream():
+            start_time = time.time()
+            response_content = ""
+            cursor = 0
+            # Starlette usually notices the disconnect first and cancels this generator, so the
+            # poll below is only a fallback and both paths are counted here
+            disconnected = False
             try:
-                start_time = time.time()
-                print("Starting streaming response generation...")
-
-                # First get documents (retrieval phase)
-                print("Retrieving relevant documents...")
-                retrieval_start = time.time()
-                docs = retriever.get_relevant_documents(message.content)
-                retrieval_time = time.time() - retrieval_start
-                print(f"Retrieved {len(docs)} documents in {retrieval_time:.3f}s")
-
-                documents_text = ""
-                for i, doc in enumerate(docs):
-                    documents_text += doc.page_content
-                    print(f"  Doc {i+1}: {len(doc.page_content)} chars from {doc.metadata.get('file_name', 'Unknown')}")
-
-                print(f"Total document context: {len(documents_text)} characters")
-
-                # Stream the LLM response directly
-                print("Starting LLM streaming...")
-                stream_start = time.time()
-                from llm_nodes import generator
-                stream_generator = generator.stream({
-                    "conversation_history": message.conversation_history,
-                    "document": documents_text,
-                    "question": message.content
-                })
-
-                response_content = ""
-                chunk_count = 0
-                for chunk in stream_generator:
-                    if chunk:
-                        chunk_count += 1
-                        response_content += chunk
-                        print(f"Streaming chunk {chunk_count}: '{chunk}' ({len(chunk)} chars)")
-                        # Send each chunk as it arrives
-                        yield f"data: {json.dumps({'content': chunk, 'type': 'chunk'})}\n\n"
-
-                stream_time = time.time() - stream_start
-                print(f"LLM streaming completed in {stream_time:.3f}s ({chunk_count} chunks)")
-
-                # Add sources after the main content
-                print("Adding source information...")
-                from qa_graph import format_sources_for_display
-                source_info = format_sources_for_display(docs)
-                if source_info:
-                    print(f"Source info: {source_info}")
-                    yield f"data: {json.dumps({'content': source_info, 'type': 'chunk'})}\n\n"
-
-                # Send completion signal with total time
-                end_time = time.time()
-                response_time = end_time - start_time
-                print(f"Total streaming response time: {response_time:.3f}s")
-                print(f"Final response length: {len(response_content)} characters")
-                print("=== STREAMING CHAT REQUEST END ===\n")
-                yield f"data: {json.dumps({'type': 'complete', 'response_time': response_time})}\n\n"
+                while True:
+                    if await request.is_disconnected():
+                        disconnected = True
+                        return
+                    events, cursor, finished = await run_in_threadpool(flight.wait_events, cursor, sse_heartbeat_seconds)
+                    if not events and not finished:
+                        yield f"data: {json.dumps({'type': 'heartbeat'})}\n\n"
+                        continue
+                    for event in events:
+                        if event["type"] == "chunk":
+                            response_content += event["content"]
+                        elif event["type"] == "complete":
+                            metrics.observe("qa_stream_request_seconds", time.time() - start_time)
+                            if session is not None:
+                                session_store.record_turn(session, message.content, strip_sources(response_content))
+                            event = {
+                                **event,
+                                "response_time": time.time() - start_time,
+                                "shared": not is_leader,
+                                "session_id": session.id if session else None
+                            }
+                        yield f"data: {json.dumps(event)}\n\n"
+                    if finished:
+                        break
+                if flight.error is not None:
+                    yield f"data: {json.dumps({'type': 'error', 'message': str(flight.error)})}\n\n"
+            except (asyncio.CancelledError, GeneratorExit):
+                disconnected = True
+                raise
+            finally:
+                if disconnected:
+                    stream_metrics["client_disconnects_total"] += 1
+                    log.info("stream_client_disconnected", key=key[:12])
+                flight.detach()
+
+        return StreamingResponse(
+            generate_stream(),
+            media_type="text/event-stream",
+            headers={
+                "Cache-Control": "no-cache",
+                "Connection": "keep-alive",
+                "X-Accel-Buffering": "no"
+            }
+        )
+
+    except HTTPException:
+        raise
+    except SchedulerSaturated as e:
+        metrics.incr("qa_rejected_total")
+        log.warning("scheduler_saturated", error=str(e))
+        return saturated_response(e)
+    except Exception as e:
+        metrics.incr("qa_stream_errors_total")
+        log.error("qa_stream_failed", error=str(e), traceback=traceback.format_exc())
+        raise HTTPException(status_code=500, detail=f"streaming chat failed: {str(e)}")
+
+
+@app.post("/da/chat")
+async def da_chat(message: ChatMessage):
+    """Answer a data-analysis question with the cached DA graph"""
+    try:
+        metrics.incr("da_requests_total")
+        log.info("da_request", question_chars=len(message.content))
+        data_file = get_da_data_file()
+        start_time = time.time()
 
+        # Graph execution blocks on LLM calls and code execution, keep it off the event loop
+        def run_graph():
+            stats = start_request_stats()
+            with start_trace("da_chat") as root:
+                app_graph = get_da_graph(data_file)
+                final_state = {}
+                for output in app_graph.stream({"question": message.content}):
+                    for node, state in output.items():
+                        final_state = state
+            return final_state, stats, root.summary()
+
+        final_state, stats, trace = await run_in_threadpool(profiled(run_graph))
+        result = final_state.get("execution_result") or {}
+        response_time = time.time() - start_time
+        metrics.observe("da_request_seconds", response_time)
+        log.info("da_response", seconds=round(response_time, 3), llm_calls=final_state.get("llm_calls", 0),
+                 model_loads=stats["model_loads"])
+
+        return DAChatResponse(
+            content=final_state.get("generation") or "no analysis generated. please try rephrasing your question.",
+            response_time=response_time,
+            plan=final_state.get("plan", ""),
+            code=final_state.get("code", ""),
+            output=result.get("output", ""),
+            model_loads=stats["model_loads"],
+            llm_calls=final_state.get("llm_calls", 0),
+            timings=final_state.get("timings") or {},
+            trace=trace
+        )
+
+    except HTTPException:
+        raise
+    except SchedulerSaturated as e:
+        metrics.incr("da_rejected_total")
+        log.warning("scheduler_saturated", error=str(e))
+        return saturated_response(e)
+    except Exception as e:
+        metrics.incr("da_errors_total")
+        log.error("da_failed", error=str(e), traceback=traceback.format_exc())
+        raise HTTPException(status_code=500, detail=f"data analysis failed: {str(e)}")
+
+@app.post("/da/chat/stream")
+async def da_chat_stream(message: ChatMessage):
+    """Answer a data-analysis question, streaming plan, code, execution and analysis as each node finishes"""
+    try:
+        metrics.incr("da_stream_requests_total")
+        log.info("da_stream_request", question_chars=len(message.content))
+        data_file = get_da_data_file()
+        # Once the stream has started a full queue can only be an error event, so it is a 429 here
+        llm_scheduler.check_capacity()
+
+        # Sync generator, StreamingResponse iterates it in the threadpool. Every step runs in
+        # one context so the scheduler attributes model loads to this request.
+        step = profiled(next)
+
+        def generate_stream():
+            start_time = time.time()
+            context = contextvars.copy_context()
+            stats = context.run(start_request_stats)
+            root = context.run(begin_trace, "da_chat_stream")
+            final_state = {}
+            try:
+                steps = context.run(lambda: iter(get_da_graph(data_file).stream({"question": message.content})))
+                while True:
+                    try:
+                        output = context.run(step, steps)
+                    except StopIteration:
+                        break
+                    for node, state in output.items():
+                        final_state = state
+                        for event in da_node_events(node, state):
+                            yield f"data: {json.dumps(event, default=str)}\n\n"
+
+                complete = {
+                    'type': 'complete',
+                    'response_time': time.time() - start_time,
+                    'model_loads': stats['model_loads'],
+                    'llm_calls': final_state.get("llm_calls", 0),
+                    'timings': final_state.get("timings") or {},
+                    'trace': context.run(end_trace, root)
+                }
+                metrics.observe("da_stream_request_seconds", complete["response_time"])
+                log.info("da_stream_complete", seconds=round(complete["response_time"], 3), llm_calls=complete["llm_calls"])
+                yield f"data: {json.dumps(complete)}\n\n"
             except Exception as e:
-                print(f"ERROR in streaming generator: {str(e)}")
-                traceback.print_exc()
+                metrics.incr("da_stream_errors_total")
+                log.error("da_stream_failed", error=str(e), traceback=traceback.format_exc())
+                root.set(error=str(e))
                 yield f"data: {json.dumps({'type': 'error', 'message': str(e)})}\n\n"
+            finally:
+                context.run(end_trace, root)
 
         return StreamingResponse(
             generate_stream(),
-            media_type="text/plain",
+            media_type="text/event-stream",
             headers={
                 "Cache-Control": "no-cache",
                 "Connection": "keep-alive",
-                "Content-Type": "text/event-stream"
+                "X-Accel-Buffering": "no"
             }
         )
 
+    except HTTPException:
+        raise
+    except SchedulerSaturated as e:
+        metrics.incr("da_rejected_total")
+        log.warning("scheduler_saturated", error=str(e))
+        return saturated_response(e)
     except Exception as e:
-        traceback.print_exc()
-        raise HTTPException(status_code=500, detail=f"streaming chat failed: {str(e)}")
+        metrics.incr("da_stream_errors_total")
+        log.error("da_stream_failed", error=str(e), traceback=traceback.format_exc())
+        raise HTTPException(status_code=500, detail=f"streaming data analysis failed: {str(e)}")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,11 @@
+"""Helpers shared by the benchmark scripts."""
+import math
+
+
+def percentile(values: list, q: float):
+    if not values:
+        return None
+    ordered = sorted(values)
+    # Nearest rank
+    index = max(0, min(len(ordered) - 1, math.ceil(q / 100 * len(ordered)) - 1))
+    return round(ordered[index], 4)
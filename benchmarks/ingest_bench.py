@@ -0,0 +1,231 @@
+"""Per-stage micro-benchmark of PDF conversion and index building.
+
+Runs the stages of pdf_to_markdown (block extraction, image context, image writes,
+captioning) and create_retriever (loading, splitting, summarization, embedding, index
+build) one at a time over synthetic corpora. The LLM is fake_ollama.py in-process and
+embeddings use the hash backend, so the numbers measure this code rather than a model.
+Reports wall time and peak traced memory per stage, and saves or compares a baseline.
+
+    python benchmarks/ingest_bench.py --pdfs 4 --pages 8 --images-per-page 3 --save-baseline ingest_baseline.json
+    python benchmarks/ingest_bench.py --pdfs 4 --pages 8 --images-per-page 3 --baseline ingest_baseline.json
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+from fake_ollama import FakeOllamaConfig, start_fake_ollama
+from synthetic_docs import write_markdown_corpus, write_pdf
+
+repo_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+app_dir = os.path.join(repo_root, "app")
+
+
+class StageRecorder:
+    """Wall time, call count and peak traced allocation, accumulated per stage name"""
+    def __init__(self, trace_memory: bool = True):
+        self.trace_memory = trace_memory
+        self.stages = {}
+        if trace_memory:
+            tracemalloc.start()
+
+    @contextmanager
+    def measure(self, name: str):
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+            baseline, _ = tracemalloc.get_traced_memory()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            stage = self.stages.setdefault(name, {"seconds": 0.0, "calls": 0, "peak_kb": None})
+            stage["seconds"] += elapsed
+            stage["calls"] += 1
+            if self.trace_memory:
+                _, peak = tracemalloc.get_traced_memory()
+                stage["peak_kb"] = max(stage["peak_kb"] or 0.0, round((peak - baseline) / 1024, 1))
+
+    def report(self) -> dict:
+        return {name: {"seconds": round(s["seconds"], 6), "calls": s["calls"],
+                       "per_call_ms": round(s["seconds"] / s["calls"] * 1000, 4), "peak_kb": s["peak_kb"]}
+                for name, s in self.stages.items()}
+
+
+def bench_pdf_stages(recorder: StageRecorder, pdf_paths: list, caption: bool):
+    """The loop of pdf_to_markdown with each stage measured separately"""
+    import pymupdf as fitz
+    import enhanced_pdf_to_md as pdf
+
+    os.makedirs(pdf.output_dir, exist_ok=True)
+    for pdf_path in pdf_paths:
+        img_count = 0
+        with recorder.measure("pdf_open"):
+            doc = fitz.open(pdf_path)
+        for page_number in range(len(doc)):
+            with recorder.measure("block_extraction"):
+                blocks = pdf.page_blocks(doc.load_page(page_number))
+            for i, block in enumerate(blocks):
+                if block["type"] == 0:
+                    with recorder.measure("block_text"):
+                        pdf._get_text_from_block(block)
+                    continue
+                img_count += 1
+                with recorder.measure("context_gathering"):
+                    before_context, after_context = pdf.gather_image_context(blocks, i)
+                with recorder.measure("image_write"):
+                    image_path = pdf.write_image(block, pdf_path, img_count)
+                if caption:
+                    with recorder.measure("image_caption"):
+                        pdf.caption_image(image_path, before_context, after_context)
+        doc.close()
+
+    # End to end, so stage totals can be checked against the real function
+    for pdf_path in pdf_paths:
+        with recorder.measure("pdf_to_markdown_total"):
+            pdf.pdf_to_markdown(pdf_path)
+
+
+def bench_index_stages(recorder: StageRecorder, md_files: list, chunk_size: int, chunk_overlap: int,
+                       summarize: bool):
+    """The build path of create_retriever with each stage measured separately"""
+    import chunks
+
+    embedding_model = chunks.get_embedding_model()
+    with recorder.measure("load"):
+        documents = chunks.load_markdown_documents(md_files)
+    with recorder.measure("split"):
+        texts = chunks.split_documents(documents, chunk_size, chunk_overlap)
+    if summarize:
+        for i in range(len(texts)):
+            with recorder.measure("summarize"):
+                chunks.enrich_chunk(texts, i)
+    vectors = []
+    for start in range(0, len(texts), chunks.checkpoint_batch_size):
+        with recorder.measure("embed"):
+            batch = embedding_model.embed_documents([t.page_content for t in texts[start:start + chunks.checkpoint_batch_size]])
+        vectors.extend([list(map(float, v)) for v in batch])
+    with recorder.measure("index_build"):
+        vectorstore = chunks.build_vectorstore(texts, vectors, embedding_model)
+    with recorder.measure("index_save"):
+        vectorstore.save_local("faiss_bench")
+    return len(texts)
+
+
+def compare(current: dict, baseline: dict, threshold: float, min_seconds: float) -> list:
+    """Stages slower than baseline by more than threshold; stages under min_seconds are noise"""
+    if baseline.get("config") != current["config"]:
+        print("Warning: baseline was recorded with a different configuration")
+    regressions = []
+    print(f"{'stage':<24}{'baseline_s':>12}{'current_s':>12}{'change':>9}{'base_kb':>11}{'cur_kb':>11}")
+    for name, stage in current["stages"].items():
+        old = baseline["stages"].get(name)
+        if old is None:
+            print(f"{name:<24}{'-':>12}{stage['seconds']:>12.4f}{'new':>9}")
+            continue
+        change = (stage["seconds"] - old["seconds"]) / old["seconds"] if old["seconds"] else 0.0
+        flag = ""
+        if change > threshold and max(stage["seconds"], old["seconds"]) >= min_seconds:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        print(f"{name:<24}{old['seconds']:>12.4f}{stage['seconds']:>12.4f}{change:>+9.1%}"
+              f"{str(old.get('peak_kb')):>11}{str(stage.get('peak_kb')):>11}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pdfs", type=int, default=3, help="synthetic PDFs, 0 to skip the PDF stages")
+    parser.add_argument("--pages", type=int, default=6)
+    parser.add_argument("--paragraphs-per-page", type=int, default=4)
+    parser.add_argument("--images-per-page", type=int, default=2)
+    parser.add_argument("--image-size", type=int, default=64)
+    parser.add_argument("--no-caption", action="store_true", help="skip the vision call per image")
+    parser.add_argument("--md-docs", type=int, default=5, help="markdown documents for the index stages, 0 to skip")
+    parser.add_argument("--md-words", type=int, default=4000, help="words per markdown document")
+    parser.add_argument("--chunk-size", type=int, default=1200)
+    parser.add_argument("--chunk-overlap", type=int, default=200)
+    parser.add_argument("--no-summarize", action="store_true", help="skip per-chunk summaries")
+    parser.add_argument("--token-rate", type=float, default=0.0, help="fake LLM decode speed, 0 for instant")
+    parser.add_argument("--first-token-latency", type=float, default=0.0)
+    parser.add_argument("--tokens", type=int, default=32)
+    parser.add_argument("--no-memory", action="store_true", help="skip tracemalloc, which slows allocation-heavy stages")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="ingest_bench_results.json")
+    parser.add_argument("--save-baseline", help="write the results here as the new baseline")
+    parser.add_argument("--baseline", help="compare against this baseline and exit 1 on regressions")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed slowdown per stage, 0.2 is 20%%")
+    parser.add_argument("--min-seconds", type=float, default=0.01, help="stages faster than this are not compared")
+    parser.add_argument("--keep-workdir", action="store_true")
+    args = parser.parse_args()
+
+    # The ollama client reads OLLAMA_HOST and chunks reads EMBEDDING_BACKEND at import
+    ollama = start_fake_ollama(0, FakeOllamaConfig(args.token_rate, args.first_token_latency, args.tokens))
+    ollama_url = f"http://127.0.0.1:{ollama.server_address[1]}"
+    os.environ.update({"OLLAMA_HOST": ollama_url, "OLLAMA_BASE_URL": ollama_url, "EMBEDDING_BACKEND": "hash",
+                       "LOG_LEVEL": os.environ.get("LOG_LEVEL", "warning")})
+    sys.path.insert(0, app_dir)
+
+    # pdf_to_markdown writes to a relative output_dir, so everything runs in a scratch directory
+    workdir = tempfile.mkdtemp(prefix="ragchatbot-ingest-")
+    cwd = os.getcwd()
+    output = os.path.abspath(args.output)
+    config = {k: v for k, v in vars(args).items()
+              if k not in ("output", "save_baseline", "baseline", "threshold", "min_seconds", "keep_workdir")}
+    recorder = StageRecorder(trace_memory=not args.no_memory)
+    results = {"config": config}
+
+    try:
+        os.chdir(workdir)
+        if args.pdfs:
+            os.makedirs("corpus")
+            pdf_paths = [write_pdf(os.path.join("corpus", f"doc{i}.pdf"), args.pages, seed=args.seed + i,
+                                   paragraphs_per_page=args.paragraphs_per_page,
+                                   images_per_page=args.images_per_page, image_size=args.image_size)
+                         for i in range(args.pdfs)]
+            print(f"PDF stages: {args.pdfs} PDFs x {args.pages} pages, {args.images_per_page} images per page")
+            bench_pdf_stages(recorder, pdf_paths, caption=not args.no_caption)
+        if args.md_docs:
+            md_files = write_markdown_corpus("markdown", args.md_docs, args.md_words, seed=args.seed)
+            print(f"Index stages: {args.md_docs} documents x {args.md_words} words")
+            results["chunks"] = bench_index_stages(recorder, md_files, args.chunk_size, args.chunk_overlap,
+                                                   summarize=not args.no_summarize)
+    finally:
+        os.chdir(cwd)
+        ollama.shutdown()
+        if args.keep_workdir:
+            print(f"Scratch directory kept at {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    results["stages"] = recorder.report()
+    results["fake_ollama_requests"] = ollama.RequestHandlerClass.config.requests
+
+    print(f"{'stage':<24}{'calls':>7}{'total_s':>11}{'per_call_ms':>13}{'peak_kb':>11}")
+    for name, stage in results["stages"].items():
+        print(f"{name:<24}{stage['calls']:>7}{stage['seconds']:>11.4f}{stage['per_call_ms']:>13.4f}"
+              f"{'-' if stage['peak_kb'] is None else stage['peak_kb']:>11}")
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {output}")
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Baseline saved to {args.save_baseline}")
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold, args.min_seconds)
+        if regressions:
+            print(f"Regressed stages: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,265 @@
+"""End-to-end load test of the backend against a fake Ollama server.
+
+Starts benchmarks/fake_ollama.py in-process and backend/main.py under uvicorn in a scratch
+directory, with the deterministic hash embedding so no model is downloaded. Ingests a
+synthetic PDF corpus, then replays concurrent upload and chat workloads and reports
+throughput, p50/p95/p99 latency and time-to-first-token per endpoint.
+
+    python benchmarks/load_test.py --requests 200 --concurrency 16 --token-rate 40
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from bench_utils import percentile
+from fake_ollama import FakeOllamaConfig, start_fake_ollama
+from synthetic_docs import write_pdf
+
+repo_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+backend_dir = os.path.join(repo_root, "backend")
+
+questions = [
+    "What does the report say about quarterly revenue?",
+    "Summarize the maintenance procedure for the pump assembly.",
+    "Which risks are listed in the project plan?",
+    "How is the onboarding process described?",
+    "What are the safety requirements for the lab?",
+    "Explain the data retention policy.",
+]
+
+
+def summarize(name: str, samples: list, wall: float) -> dict:
+    ok = [s for s in samples if s["ok"]]
+    latencies = [s["latency"] for s in ok]
+    first_tokens = [s["ttft"] for s in ok if s.get("ttft") is not None]
+    return {
+        "workload": name,
+        "requests": len(samples),
+        "errors": len(samples) - len(ok),
+        "wall_seconds": round(wall, 3),
+        "throughput_rps": round(len(ok) / wall, 3) if wall else None,
+        "latency_p50": percentile(latencies, 50),
+        "latency_p95": percentile(latencies, 95),
+        "latency_p99": percentile(latencies, 99),
+        "ttft_p50": percentile(first_tokens, 50),
+        "ttft_p95": percentile(first_tokens, 95),
+        "ttft_p99": percentile(first_tokens, 99),
+        "status_codes": {str(code): sum(1 for s in samples if s["status"] == code)
+                         for code in sorted({s["status"] for s in samples}, key=str)},
+    }
+
+
+class Backend:
+    """uvicorn running backend/main.py with its files, index and traces in a scratch directory"""
+    def __init__(self, workdir: str, port: int, ollama_url: str):
+        self.workdir = workdir
+        self.url = f"http://127.0.0.1:{port}"
+        env = dict(os.environ)
+        env.update({
+            "OLLAMA_BASE_URL": ollama_url,
+            "OLLAMA_HOST": ollama_url,
+            "EMBEDDING_BACKEND": "hash",
+            "LOG_LEVEL": env.get("LOG_LEVEL", "warning"),
+            "TRACE_DB_PATH": os.path.join(workdir, "traces.db"),
+            "PROFILE_DIR": os.path.join(workdir, "profiles"),
+        })
+        self.log_path = os.path.join(workdir, "backend.log")
+        self._log = open(self.log_path, "w")
+        self.process = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--app-dir", backend_dir,
+             "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+            cwd=workdir, env=env, stdout=self._log, stderr=subprocess.STDOUT)
+
+    def wait_ready(self, timeout: float = 120.0):
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"backend exited with {self.process.returncode}, see {self.log_path}")
+            try:
+                if requests.get(f"{self.url}/health", timeout=1).ok:
+                    return
+            except requests.RequestException:
+                pass
+            time.sleep(0.25)
+        raise TimeoutError(f"backend not ready after {timeout}s, see {self.log_path}")
+
+    def stop(self):
+        self.process.terminate()
+        try:
+            self.process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+        self._log.close()
+
+
+def upload(backend: Backend, paths: list) -> dict:
+    """POST PDFs to /documents/upload and wait for the ingestion job; latency covers both"""
+    start = time.time()
+    handles = [open(p, "rb") for p in paths]
+    try:
+        response = requests.post(f"{backend.url}/documents/upload",
+                                 files=[("files", (os.path.basename(p), h, "application/pdf")) for p, h in zip(paths, handles)],
+                                 timeout=300)
+    finally:
+        for h in handles:
+            h.close()
+    accepted = time.time() - start
+    sample = {"ok": response.status_code in (200, 202), "status": response.status_code, "accept": accepted}
+    job_id = response.json().get("job_id") if sample["ok"] else None
+    while job_id:
+        job = requests.get(f"{backend.url}/jobs/{job_id}", timeout=10).json()
+        if job["status"] in ("succeeded", "failed", "cancelled"):
+            sample["ok"] = job["status"] == "succeeded"
+            sample["job_status"] = job["status"]
+            break
+        time.sleep(0.2)
+    sample["latency"] = time.time() - start
+    return sample
+
+
+def chat(backend: Backend, question: str) -> dict:
+    start = time.time()
+    try:
+        response = requests.post(f"{backend.url}/qa/chat", json={"content": question}, timeout=600)
+    except requests.RequestException as e:
+        return {"ok": False, "status": type(e).__name__, "latency": time.time() - start}
+    latency = time.time() - start
+    # Nothing reaches the client before the full answer, so first token is the whole response
+    return {"ok": response.ok, "status": response.status_code, "latency": latency, "ttft": latency}
+
+
+def chat_stream(backend: Backend, question: str) -> dict:
+    start = time.time()
+    sample = {"ok": False, "status": None, "ttft": None}
+    try:
+        with requests.post(f"{backend.url}/qa/chat/stream", json={"content": question}, stream=True, timeout=600) as response:
+            sample["status"] = response.status_code
+            for line in response.iter_lines():
+                if not line.startswith(b"data: "):
+                    continue
+                event = json.loads(line[6:])
+                if event["type"] == "chunk" and sample["ttft"] is None:
+                    sample["ttft"] = time.time() - start
+                elif event["type"] == "complete":
+                    sample["ok"] = True
+                elif event["type"] == "error":
+                    break
+    except requests.RequestException as e:
+        sample["status"] = type(e).__name__
+    sample["latency"] = time.time() - start
+    return sample
+
+
+def run_workload(name: str, fn, jobs: list, concurrency: int) -> dict:
+    print(f"Running {name}: {len(jobs)} requests at concurrency {concurrency}")
+    start = time.time()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        samples = list(pool.map(lambda job: fn(*job), jobs))
+    return summarize(name, samples, time.time() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=50, help="chat requests per endpoint")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--endpoints", default="qa_chat,qa_chat_stream")
+    parser.add_argument("--corpus-docs", type=int, default=5, help="PDFs ingested before the chat workload")
+    parser.add_argument("--corpus-pages", type=int, default=4)
+    parser.add_argument("--uploads", type=int, default=4, help="upload requests in the upload workload, 0 to skip")
+    parser.add_argument("--upload-concurrency", type=int, default=2)
+    parser.add_argument("--mixed", action="store_true", help="run the upload workload during the chat workloads")
+    parser.add_argument("--repeat-questions", action="store_true",
+                        help="send identical questions so concurrent requests coalesce")
+    parser.add_argument("--token-rate", type=float, default=50.0)
+    parser.add_argument("--first-token-latency", type=float, default=0.2)
+    parser.add_argument("--tokens", type=int, default=64)
+    parser.add_argument("--load-time", type=float, default=0.0)
+    parser.add_argument("--ollama-parallel", type=int, default=2, help="fake server's parallel generations")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--output", default="load_test_results.json")
+    parser.add_argument("--keep-workdir", action="store_true")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    workdir = tempfile.mkdtemp(prefix="ragchatbot-load-")
+    config = FakeOllamaConfig(args.token_rate, args.first_token_latency, args.tokens, args.load_time,
+                              max_concurrency=args.ollama_parallel)
+    ollama = start_fake_ollama(0, config)
+    ollama_url = f"http://127.0.0.1:{ollama.server_address[1]}"
+    backend = Backend(workdir, args.port, ollama_url)
+    results = {"config": vars(args), "workloads": []}
+
+    try:
+        backend.wait_ready()
+        corpus_dir = os.path.join(workdir, "corpus")
+        os.makedirs(corpus_dir)
+        corpus = [write_pdf(os.path.join(corpus_dir, f"doc{i}.pdf"), args.corpus_pages, seed=args.seed + i)
+                  for i in range(args.corpus_docs)]
+        print(f"Ingesting {len(corpus)} synthetic PDFs")
+        seeded = upload(backend, corpus)
+        if not seeded["ok"]:
+            raise RuntimeError(f"corpus ingestion failed: {seeded}, see {backend.log_path}")
+        results["corpus_ingest_seconds"] = round(seeded["latency"], 3)
+
+        # Each upload request carries one fresh document so nothing is deduplicated. The corpus
+        # already built faiss_db, so create_retriever only loads it and these latencies cover
+        # conversion plus an index load, not an index rebuild.
+        results["upload_note"] = ("faiss_db exists after corpus ingestion, so upload latency covers PDF conversion "
+                                  "and loading the existing index, not rebuilding it")
+        upload_jobs = [([write_pdf(os.path.join(corpus_dir, f"upload{i}.pdf"), args.corpus_pages,
+                                   seed=args.seed + 1000 + i)],) for i in range(args.uploads)]
+        upload_thread = None
+        if upload_jobs and args.mixed:
+            upload_thread = threading.Thread(target=lambda: results["workloads"].append(
+                run_workload("upload (mixed)", lambda paths: upload(backend, paths), upload_jobs, args.upload_concurrency)))
+            upload_thread.start()
+        elif upload_jobs:
+            results["workloads"].append(
+                run_workload("upload", lambda paths: upload(backend, paths), upload_jobs, args.upload_concurrency))
+
+        endpoints = {"qa_chat": chat, "qa_chat_stream": chat_stream}
+        for name in [e.strip() for e in args.endpoints.split(",") if e.strip()]:
+            if args.repeat_questions:
+                jobs = [(backend, questions[i % len(questions)]) for i in range(args.requests)]
+            else:
+                jobs = [(backend, f"{rng.choice(questions)} (request {i})") for i in range(args.requests)]
+            results["workloads"].append(run_workload(name, endpoints[name], jobs, args.concurrency))
+
+        if upload_thread is not None:
+            upload_thread.join()
+        results["backend_metrics"] = requests.get(f"{backend.url}/metrics", timeout=10).json()
+        results["fake_ollama_requests"] = config.requests
+    finally:
+        backend.stop()
+        ollama.shutdown()
+        if args.keep_workdir:
+            print(f"Scratch directory kept at {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+
+    header = f"{'workload':<16}{'reqs':>6}{'err':>5}{'rps':>8}{'p50':>8}{'p95':>8}{'p99':>8}{'ttft50':>8}{'ttft95':>8}{'ttft99':>8}"
+    print(header)
+    for w in results["workloads"]:
+        cells = [w["throughput_rps"], w["latency_p50"], w["latency_p95"], w["latency_p99"],
+                 w["ttft_p50"], w["ttft_p95"], w["ttft_p99"]]
+        print(f"{w['workload']:<16}{w['requests']:>6}{w['errors']:>5}" + "".join(
+            f"{'-' if c is None else c:>8}" for c in cells))
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+"""Retrieval quality against latency over a sweep of create_retriever settings.
+
+Builds the index the way create_retriever does for every combination of chunk_size,
+chunk_overlap, summary enrichment and FAISS index type, then runs a question set at each
+top_k. Reports recall@k, MRR, query latency, build time and index size, and marks the
+configurations on the Pareto front of quality against p95 query latency.
+
+The question set is JSON: [{"question": "...", "expected": [{"file": "doc.md", "text": "..."}]}].
+A retrieved chunk matches an expected entry when it comes from that file (if given) and
+contains its text. Without --corpus a synthetic corpus with planted facts is generated.
+
+    python benchmarks/retrieval_eval.py --chunk-sizes 400,800,1200 --overlaps 0,100,200 --top-ks 1,3,5
+    python benchmarks/retrieval_eval.py --corpus files --qa questions.json --ollama-url http://localhost:11434 --embedding-backend nomic
+"""
+import argparse
+import itertools
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from bench_utils import percentile
+from fake_ollama import FakeOllamaConfig, start_fake_ollama
+from synthetic_docs import write_qa_corpus
+
+repo_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+app_dir = os.path.join(repo_root, "app")
+
+
+def _normalize(text: str) -> str:
+    return " ".join(text.split()).lower()
+
+
+def matches(doc, expected: dict) -> bool:
+    if expected.get("file") and os.path.basename(doc.metadata.get("file_name", "")) != expected["file"]:
+        return False
+    return _normalize(expected["text"]) in _normalize(doc.page_content)
+
+
+def score(docs: list, expected: list) -> tuple:
+    """Share of expected entries found in docs, and reciprocal rank of the first relevant doc"""
+    found = sum(1 for e in expected if any(matches(doc, e) for doc in docs))
+    reciprocal_rank = 0.0
+    for rank, doc in enumerate(docs, start=1):
+        if any(matches(doc, e) for e in expected):
+            reciprocal_rank = 1.0 / rank
+            break
+    return found / len(expected), reciprocal_rank
+
+
+def evaluate(vectorstore, qa: list, top_k: int) -> dict:
+    retriever = vectorstore.as_retriever(search_kwargs={"k": top_k})
+    recalls, reciprocal_ranks, latencies = [], [], []
+    for item in qa:
+        start = time.perf_counter()
+        docs = retriever.invoke(item["question"])
+        latencies.append((time.perf_counter() - start) * 1000)
+        recall, reciprocal_rank = score(docs, [e if isinstance(e, dict) else {"text": e} for e in item["expected"]])
+        recalls.append(recall)
+        reciprocal_ranks.append(reciprocal_rank)
+    return {
+        "recall": round(sum(recalls) / len(recalls), 4),
+        "mrr": round(sum(reciprocal_ranks) / len(reciprocal_ranks), 4),
+        "query_ms_p50": percentile(latencies, 50),
+        "query_ms_p95": percentile(latencies, 95),
+    }
+
+
+def sweep(md_files: list, qa: list, chunk_sizes: list, overlaps: list, summaries: list,
+          index_types: list, top_ks: list) -> list:
+    import faiss
+    import chunks
+
+    embedding_model = chunks.get_embedding_model()
+    documents = chunks.load_markdown_documents(md_files)
+    rows = []
+    for chunk_size, chunk_overlap, summarize in itertools.product(chunk_sizes, overlaps, summaries):
+        if chunk_overlap >= chunk_size:
+            continue
+        # enrich_chunk rewrites chunks in place, so every setting starts from a fresh split
+        texts = chunks.split_documents(documents, chunk_size, chunk_overlap)
+        start = time.perf_counter()
+        for i in range(len(texts)):
+            chunks.enrich_chunk(texts, i, summarize)
+        summary_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        vectors = embedding_model.embed_documents([t.page_content for t in texts])
+        embed_seconds = time.perf_counter() - start
+
+        for index_type in index_types:
+            start = time.perf_counter()
+            vectorstore = chunks.build_vectorstore(texts, vectors, embedding_model, index_type)
+            index_seconds = time.perf_counter() - start
+            index_bytes = int(faiss.serialize_index(vectorstore.index).nbytes)
+            for top_k in top_ks:
+                row = {
+                    "chunk_size": chunk_size, "chunk_overlap": chunk_overlap, "summarize": summarize,
+                    "index_type": index_type, "top_k": top_k, "chunks": len(texts),
+                    "summary_seconds": round(summary_seconds, 4), "embed_seconds": round(embed_seconds, 4),
+                    "index_build_seconds": round(index_seconds, 4), "index_kb": round(index_bytes / 1024, 1),
+                }
+                row.update(evaluate(vectorstore, qa, top_k))
+                rows.append(row)
+                print(f"size={chunk_size} overlap={chunk_overlap} summarize={summarize} index={index_type} "
+                      f"k={top_k}: recall={row['recall']} mrr={row['mrr']} p95={row['query_ms_p95']}ms")
+    return rows
+
+
+def mark_pareto(rows: list, metric: str):
+    """A row is on the front when no other row has metric at least as high and p95 latency at least as low, one strictly"""
+    for row in rows:
+        row["pareto"] = not any(
+            other[metric] >= row[metric] and other["query_ms_p95"] <= row["query_ms_p95"]
+            and (other[metric] > row[metric] or other["query_ms_p95"] < row["query_ms_p95"])
+            for other in rows)
+
+
+def _int_list(value: str) -> list:
+    return [int(v) for v in value.split(",") if v.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--corpus", help="directory of .md files; synthetic when omitted")
+    parser.add_argument("--qa", help="question set JSON, required with --corpus")
+    parser.add_argument("--docs", type=int, default=8, help="synthetic documents")
+    parser.add_argument("--words", type=int, default=3000, help="words per synthetic document")
+    parser.add_argument("--facts", type=int, default=5, help="planted facts, and so questions, per synthetic document")
+    parser.add_argument("--chunk-sizes", type=_int_list, default=[400, 800, 1200])
+    parser.add_argument("--overlaps", type=_int_list, default=[0, 100, 200])
+    parser.add_argument("--top-ks", type=_int_list, default=[1, 3, 5])
+    parser.add_argument("--summaries", default="off,on", help="off, on or off,on")
+    parser.add_argument("--index-types", default="flat,hnsw,ivf")
+    parser.add_argument("--pareto-metric", choices=("recall", "mrr"), default="recall")
+    parser.add_argument("--ollama-url", help="real Ollama for summaries; a fake one is started otherwise")
+    parser.add_argument("--embedding-backend", default="hash", help="hash, or nomic for production embeddings")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="retrieval_eval_results.json")
+    args = parser.parse_args()
+    if args.corpus and not args.qa:
+        parser.error("--qa is required with --corpus")
+
+    # The ollama client and chunks read these at import
+    ollama = None
+    ollama_url = args.ollama_url
+    if not ollama_url:
+        ollama = start_fake_ollama(0, FakeOllamaConfig(token_rate=0.0, first_token_latency=0.0, tokens=24))
+        ollama_url = f"http://127.0.0.1:{ollama.server_address[1]}"
+        print("Summaries come from the fake Ollama, so summarize=on only shows the cost of a canned prefix")
+    os.environ.update({"OLLAMA_HOST": ollama_url, "OLLAMA_BASE_URL": ollama_url,
+                       "EMBEDDING_BACKEND": args.embedding_backend,
+                       "LOG_LEVEL": os.environ.get("LOG_LEVEL", "warning")})
+    sys.path.insert(0, app_dir)
+
+    workdir = tempfile.mkdtemp(prefix="ragchatbot-retrieval-")
+    try:
+        if args.corpus:
+            md_files = sorted(os.path.join(args.corpus, f) for f in os.listdir(args.corpus) if f.endswith(".md"))
+            with open(args.qa) as f:
+                qa = json.load(f)
+        else:
+            md_files, qa = write_qa_corpus(os.path.join(workdir, "corpus"), args.docs, args.words, args.facts, args.seed)
+        summaries = [s.strip() == "on" for s in args.summaries.split(",") if s.strip()]
+        index_types = [t.strip() for t in args.index_types.split(",") if t.strip()]
+        print(f"{len(md_files)} documents, {len(qa)} questions")
+        rows = sweep(md_files, qa, args.chunk_sizes, args.overlaps, summaries, index_types, args.top_ks)
+    finally:
+        if ollama is not None:
+            ollama.shutdown()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    mark_pareto(rows, args.pareto_metric)
+    with open(args.output, "w") as f:
+        json.dump({"config": vars(args), "questions": len(qa), "results": rows}, f, indent=2)
+
+    front = sorted((r for r in rows if r["pareto"]), key=lambda r: r["query_ms_p95"])
+    print(f"\nPareto front, {args.pareto_metric} against p95 query latency:")
+    print(f"{'size':>6}{'overlap':>9}{'summ':>6}{'index':>7}{'k':>4}{'recall':>8}{'mrr':>8}"
+          f"{'p50_ms':>9}{'p95_ms':>9}{'build_s':>9}{'index_kb':>10}")
+    for r in front:
+        print(f"{r['chunk_size']:>6}{r['chunk_overlap']:>9}{('on' if r['summarize'] else 'off'):>6}{r['index_type']:>7}"
+              f"{r['top_k']:>4}{r['recall']:>8}{r['mrr']:>8}{r['query_ms_p50']:>9}{r['query_ms_p95']:>9}"
+              f"{r['index_build_seconds']:>9}{r['index_kb']:>10}")
+    print(f"All {len(rows)} configurations written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""Synthetic PDFs and markdown corpora of configurable size and image density."""
+import os
+import random
+
+vocabulary = ("revenue pump assembly maintenance onboarding safety retention policy quarterly risk "
+              "schedule budget vendor contract inspection valve pressure training audit report "
+              "procedure compliance incident review forecast inventory shipment warranty sensor "
+              "calibration storage backup access approval deadline milestone").split()
+
+
+def paragraph(rng: random.Random, words: int = 80) -> str:
+    sentences = []
+    while words > 0:
+        length = min(words, rng.randint(8, 16))
+        sentence = " ".join(rng.choice(vocabulary) for _ in range(length))
+        sentences.append(sentence.capitalize() + ".")
+        words -= length
+    return " ".join(sentences)
+
+
+def write_pdf(path: str, pages: int = 4, seed: int = 0, paragraphs_per_page: int = 4,
+              images_per_page: int = 0, image_size: int = 64) -> str:
+    """PDF of random-vocabulary paragraphs, optionally with small generated images per page"""
+    import pymupdf as fitz
+
+    rng = random.Random(seed)
+    doc = fitz.open()
+    for page_number in range(pages):
+        page = doc.new_page()
+        y = 72
+        page.insert_text((72, y), f"Section {page_number + 1} of document {seed}", fontsize=14)
+        y += 24
+        for _ in range(paragraphs_per_page):
+            rect = fitz.Rect(72, y, page.rect.width - 72, y + 110)
+            page.insert_textbox(rect, paragraph(rng), fontsize=9)
+            y += 118
+        for i in range(images_per_page):
+            pixmap = fitz.Pixmap(fitz.csRGB, fitz.IRect(0, 0, image_size, image_size), False)
+            pixmap.set_rect(pixmap.irect, tuple(rng.randrange(256) for _ in range(3)))
+            x = 72 + (i % 6) * (image_size + 8)
+            top = page.rect.height - 72 - (i // 6 + 1) * (image_size + 8)
+            page.insert_image(fitz.Rect(x, top, x + image_size, top + image_size), pixmap=pixmap)
+    doc.save(path)
+    doc.close()
+    return path
+
+
+def write_markdown_corpus(directory: str, documents: int = 5, words_per_document: int = 2000, seed: int = 0) -> list:
+    """Markdown files like pdf_to_markdown produces, for benchmarking chunking and indexing alone"""
+    os.makedirs(directory, exist_ok=True)
+    rng = random.Random(seed)
+    paths = []
+    for d in range(documents):
+        parts = []
+        remaining = words_per_document
+        while remaining > 0:
+            words = min(remaining, 120)
+            parts.append(paragraph(rng, words))
+            remaining -= words
+        path = os.path.join(directory, f"doc{d}.md")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("\n\n".join(parts))
+        paths.append(path)
+    return paths
+
+
+def _pseudo_word(rng: random.Random, syllables: int = 3) -> str:
+    return "".join(rng.choice("bdfgklmnprstvz") + rng.choice("aeiou") for _ in range(syllables))
+
+
+def write_qa_corpus(directory: str, documents: int = 5, words_per_document: int = 2000,
+                    facts_per_document: int = 4, seed: int = 0) -> tuple:
+    """Markdown corpus with planted facts, and a question for each naming the file and sentence that answer it"""
+    os.makedirs(directory, exist_ok=True)
+    rng = random.Random(seed)
+    attributes = ("serial number", "storage room", "owner", "inspection date", "supplier", "access code")
+    paths, qa = [], []
+    for d in range(documents):
+        file_name = f"doc{d}.md"
+        parts = []
+        remaining = words_per_document
+        while remaining > 0:
+            words = min(remaining, 120)
+            parts.append(paragraph(rng, words))
+            remaining -= words
+        for _ in range(facts_per_document):
+            subject = f"{_pseudo_word(rng)} {rng.choice(vocabulary)}"
+            attribute = rng.choice(attributes)
+            fact = f"The {attribute} of the {subject} is {_pseudo_word(rng, 2)}-{rng.randint(100, 999)}."
+            where = rng.randrange(len(parts))
+            parts[where] = f"{parts[where]} {fact}"
+            qa.append({"question": f"What is the {attribute} of the {subject}?",
+                       "expected": [{"file": file_name, "text": fact}]})
+        path = os.path.join(directory, file_name)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("\n\n".join(parts))
+        paths.append(path)
+    return paths, qa
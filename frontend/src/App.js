@@ -9,11 +9,16 @@ function App() {
   const [input, setInput] = useState('');
   const [loading, setLoading] = useState(false);
   const [dbStatus, setDbStatus] = useState({ exists: false, file_count: 0 });
+  const [sessionId, setSessionId] = useState(null);
+  const [jobId, setJobId] = useState(null);
   const messagesEndRef = useRef(null);
+  // Aborting the running stream lets the server stop generating for it
+  const streamController = useRef(null);
 
   // Check database and data status on mount
   useEffect(() => {
     checkStatuses();
+    return () => streamController.current?.abort();
   }, []);
 
   // Scroll to bottom when messages change
@@ -30,6 +35,35 @@ function App() {
     }
   };
 
+  const describeJob = (job) => {
+    const stage = job.stage && job.stages[job.stage];
+    if (!stage) return `${job.status}...`;
+    const eta = job.eta_seconds != null ? `, ~${Math.ceil(job.eta_seconds)}s left` : '';
+    return `${job.stage}: ${stage.done}/${stage.total}${eta}`;
+  };
+
+  const waitForJob = async (jobId) => {
+    while (true) {
+      const { data: job } = await axios.get(`${API_BASE}/jobs/${jobId}`);
+      if (['succeeded', 'failed', 'cancelled'].includes(job.status)) {
+        setJobId(null);
+        return job;
+      }
+      setJobId(jobId);
+      setMessages([{ role: 'system', content: `building database - ${describeJob(job)}` }]);
+      await new Promise(resolve => setTimeout(resolve, 1000));
+    }
+  };
+
+  const cancelUpload = async () => {
+    if (!jobId) return;
+    try {
+      await axios.post(`${API_BASE}/jobs/${jobId}/cancel`);
+    } catch (error) {
+      console.error('failed to cancel job:', error);
+    }
+  };
+
   const handleFileUpload = async (event) => {
     const files = event.target.files;
     if (!files || files.length === 0) return;
@@ -40,10 +74,24 @@ function App() {
       Array.from(files).forEach(file => {
         formData.append('files', file);
       });
-      await axios.post(`${API_BASE}/documents/upload`, formData, {
+      const response = await axios.post(`${API_BASE}/documents/upload`, formData, {
         headers: { 'Content-Type': 'multipart/form-data' }
       });
-      setMessages([{ role: 'system', content: 'documents uploaded and database created' }]);
+      // Every file was already ingested, nothing to wait for
+      if (!response.data.job_id) {
+        setMessages([{ role: 'system', content: response.data.message }]);
+        checkStatuses();
+        setLoading(false);
+        event.target.value = '';
+        return;
+      }
+      // Ingestion runs as a background job, poll it until it finishes
+      const job = await waitForJob(response.data.job_id);
+      if (job.status === 'succeeded') {
+        setMessages([{ role: 'system', content: 'documents uploaded and database created' }]);
+      } else {
+        setMessages([{ role: 'system', content: `upload ${job.status}${job.error ? `: ${job.error}` : ''}` }]);
+      }
       checkStatuses();
     } catch (error) {
       setMessages(prev => [...prev, {
@@ -72,29 +120,40 @@ function App() {
     };
     setMessages(prev => [...prev, assistantMessage]);
 
+    streamController.current?.abort();
+    const controller = new AbortController();
+    streamController.current = controller;
+
     try {
-      const conversationHistory = messages
-        .filter(msg => msg.role !== 'system')
-        .slice(-6) // Last 3 Q&A pairs
-        .reduce((acc, msg, index, arr) => {
-          if (msg.role === 'user' && arr[index + 1]?.role === 'assistant') {
-            acc.push([msg.content, arr[index + 1].content]);
-          }
-          return acc;
-        }, []);
+      // The server only keeps history for sessions created explicitly
+      let activeSessionId = sessionId;
+      if (!activeSessionId) {
+        const created = await axios.post(`${API_BASE}/sessions`);
+        activeSessionId = created.data.session_id;
+        setSessionId(activeSessionId);
+      }
 
       // Use fetch for Server-Sent Events streaming
       const response = await fetch(`${API_BASE}/qa/chat/stream`, {
         method: 'POST',
+        signal: controller.signal,
         headers: {
           'Content-Type': 'application/json',
         },
         body: JSON.stringify({
           content: input,
-          conversation_history: conversationHistory
+          // History is kept on the server, only the session id is sent
+          session_id: activeSessionId
         })
       });
 
+      if (response.status === 404) {
+        setSessionId(null);
+        throw new Error('session expired, please ask again');
+      }
+      if (response.status === 429) {
+        throw new Error('server busy, try again shortly');
+      }
       if (!response.ok) {
         throw new Error(`HTTP error! status: ${response.status}`);
       }
@@ -118,7 +177,20 @@ function App() {
 
               const data = JSON.parse(jsonStr);
 
-              if (data.type === 'chunk' && data.content) {
+              if (data.type === 'queued') {
+                // Show queue position until the first chunk arrives
+                setMessages(prev => {
+                  const newMessages = [...prev];
+                  const lastMessage = newMessages[newMessages.length - 1];
+                  if (lastMessage.role === 'assistant' && lastMessage.streaming) {
+                    newMessages[newMessages.length - 1] = {
+                      ...lastMessage,
+                      content: `queued (position ${data.position})`
+                    };
+                  }
+                  return newMessages;
+                });
+              } else if (data.type === 'chunk' && data.content) {
                 accumulatedContent += data.content;
 
                 // Update the streaming message with accumulated content
@@ -134,6 +206,9 @@ function App() {
                   return newMessages;
                 });
               } else if (data.type === 'complete') {
+                if (data.session_id) {
+                  setSessionId(data.session_id);
+                }
                 // Mark streaming as complete and add response time
                 setMessages(prev => {
                   const newMessages = [...prev];
@@ -159,6 +234,10 @@ function App() {
         }
       }
     } catch (error) {
+      if (error.name === 'AbortError') {
+        setLoading(false);
+        return;
+      }
       // Remove the streaming message and add error message
       setMessages(prev => {
         const newMessages = prev.slice(0, -1);
@@ -174,6 +253,12 @@ function App() {
   };
 
   const clearChat = () => {
+    streamController.current?.abort();
+    streamController.current = null;
+    if (sessionId) {
+      axios.delete(`${API_BASE}/sessions/${sessionId}`).catch(() => {});
+    }
+    setSessionId(null);
     setMessages([]);
   };
 
@@ -235,6 +320,11 @@ function App() {
                   onChange={handleFileUpload}
                   className="file-input"
                 />
+                {jobId && (
+                  <button type="button" onClick={cancelUpload} className="text-button">
+                    cancel
+                  </button>
+                )}
               </div>
             </div>
           )}
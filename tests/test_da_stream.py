@@ -0,0 +1,25 @@
+import asyncio
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend"))
+main = pytest.importorskip("main", exc_type=ImportError)
+
+from llm_scheduler import LLMScheduler
+
+
+def test_full_queue_is_a_429_before_the_stream_starts(tmp_path, monkeypatch):
+    scheduler = LLMScheduler(max_inflight=1, max_queue=1)
+    tickets = [scheduler.enqueue(), scheduler.enqueue()]
+    monkeypatch.setattr(main, "llm_scheduler", scheduler)
+    monkeypatch.setattr(main, "get_da_data_file", lambda: str(tmp_path / "clean_data.parquet"))
+
+    response = asyncio.run(main.da_chat_stream(main.ChatMessage(content="average price?")))
+
+    assert response.status_code == 429
+    assert response.headers["retry-after"] == "5"
+    assert scheduler.metrics()["rejected_total"] == 1
+    for ticket in tickets:
+        ticket.release()
@@ -0,0 +1,44 @@
+import pandas as pd
+import pytest
+
+import data_processing
+from data_processing import process_data
+
+
+def write_csv(path, text: str) -> str:
+    path.write_text(text)
+    return str(path)
+
+
+@pytest.mark.parametrize("output_name", ["clean.parquet", "clean.csv"])
+def test_header_without_rows_writes_an_empty_table(tmp_path, output_name):
+    input_path = write_csv(tmp_path / "data.csv", "price,city,Address\n")
+    output_path = process_data(input_path, str(tmp_path / output_name), encoding="codes")
+    read = pd.read_parquet if output_path.endswith(".parquet") else pd.read_csv
+    table = read(output_path)
+    assert len(table) == 0
+    assert list(table.columns) == ["price", "city"]
+
+
+def test_no_chunks_at_all_still_writes_the_columns(tmp_path, monkeypatch):
+    input_path = write_csv(tmp_path / "data.csv", "price,city\n")
+    read_csv = pd.read_csv
+
+    # Some pandas versions yield no chunk for a header-only file
+    def no_chunks(*args, **kwargs):
+        if kwargs.get("chunksize"):
+            return iter([])
+        return read_csv(*args, **kwargs)
+
+    monkeypatch.setattr(data_processing.pd, "read_csv", no_chunks)
+    output_path = process_data(input_path, str(tmp_path / "clean.parquet"), encoding="categorical")
+    assert list(pd.read_parquet(output_path).columns) == ["price", "city"]
+
+
+def test_chunks_share_one_schema(tmp_path):
+    input_path = write_csv(tmp_path / "data.csv", "price,city\n1,Oslo\n2.5,Rome\n3,\n")
+    output_path = process_data(input_path, str(tmp_path / "clean.parquet"), encoding="onehot", chunksize=1)
+    table = pd.read_parquet(output_path)
+    assert list(table.columns) == ["price", "city_Oslo", "city_Rome"]
+    assert table["price"].tolist() == [1.0, 2.5, 3.0]
+    assert table["city_Rome"].tolist() == [0, 1, 0]
@@ -0,0 +1,55 @@
+import os
+import threading
+
+from ingest_checkpoint import BuildCheckpoint, load_index, publish_index
+
+
+def write_index(path: str, version: str):
+    os.makedirs(path)
+    with open(os.path.join(path, "version"), "w") as f:
+        f.write(version)
+
+
+def read_version(path: str) -> str:
+    with open(os.path.join(path, "version")) as f:
+        return f.read()
+
+
+def test_reader_waits_for_a_publish_in_progress(tmp_path, monkeypatch):
+    faiss_db_path = str(tmp_path / "faiss_db")
+    staged_path = f"{faiss_db_path}.staging"
+    write_index(faiss_db_path, "old")
+    write_index(staged_path, "new")
+    seen = []
+    reader = threading.Thread(target=lambda: seen.append(load_index(faiss_db_path, read_version)))
+    rename = os.rename
+
+    # Start a reader in the gap after the live index moved aside and before the new one is in place
+    def slow_rename(src, dst):
+        rename(src, dst)
+        if dst.endswith(".old"):
+            reader.start()
+            reader.join(0.2)
+
+    monkeypatch.setattr(os, "rename", slow_rename)
+    publish_index(staged_path, faiss_db_path)
+    reader.join()
+
+    assert seen == ["new"]
+    assert read_version(faiss_db_path) == "new"
+    assert not os.path.exists(f"{faiss_db_path}.old")
+
+
+def test_interrupted_publish_is_restored(tmp_path):
+    faiss_db_path = str(tmp_path / "faiss_db")
+    write_index(f"{faiss_db_path}.old", "1")
+    assert load_index(faiss_db_path, read_version) == "1"
+    assert load_index(str(tmp_path / "none"), read_version) is None
+
+
+def test_checkpoint_resumes_only_the_same_inputs(tmp_path):
+    faiss_db_path = str(tmp_path / "faiss_db")
+    checkpoint = BuildCheckpoint(faiss_db_path, "a")
+    checkpoint.save_vectors(0, [[1.0, 2.0]])
+    assert BuildCheckpoint(faiss_db_path, "a").load_vectors(0).tolist() == [[1.0, 2.0]]
+    assert BuildCheckpoint(faiss_db_path, "b").load_vectors(0) is None
@@ -0,0 +1,48 @@
+import threading
+
+from ingest_registry import IngestRegistry
+
+
+def test_concurrent_uploads_of_one_file_reserve_once(tmp_path):
+    registry = IngestRegistry(str(tmp_path))
+    barrier = threading.Barrier(8)
+    winners = []
+
+    def upload(i):
+        barrier.wait()
+        if registry.reserve("same-content", f"copy{i}.pdf"):
+            winners.append(i)
+
+    threads = [threading.Thread(target=upload, args=(i,)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(winners) == 1
+    assert registry.lookup("same-content") == f"copy{winners[0]}.pdf"
+
+
+def test_committed_documents_survive_a_restart(tmp_path):
+    registry = IngestRegistry(str(tmp_path))
+    assert registry.reserve("abc", "report.pdf")
+    registry.commit({"abc": "report.pdf"})
+
+    reopened = IngestRegistry(str(tmp_path))
+    assert reopened.lookup("abc") == "report.pdf"
+    assert not reopened.reserve("abc", "again.pdf")
+
+
+def test_released_reservation_can_be_taken_again(tmp_path):
+    registry = IngestRegistry(str(tmp_path))
+    assert registry.reserve("abc", "report.pdf")
+    registry.release("abc")
+    assert registry.lookup("abc") is None
+    assert registry.reserve("abc", "retry.pdf")
+
+
+def test_unreadable_registry_is_treated_as_empty(tmp_path):
+    (tmp_path / ".ingested.json").write_text("{not json")
+    registry = IngestRegistry(str(tmp_path))
+    assert registry.lookup("abc") is None
+    assert registry.reserve("abc", "report.pdf")
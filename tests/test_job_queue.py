@@ -0,0 +1,115 @@
+import threading
+import time
+
+import pytest
+
+from ingest_registry import IngestRegistry
+from job_queue import JobQueue, JobQueueFull
+
+
+def wait_for(condition, timeout: float = 2.0):
+    deadline = time.time() + timeout
+    while not condition():
+        if time.time() > deadline:
+            raise AssertionError("condition not reached")
+        time.sleep(0.001)
+
+
+def blocking_job(release: threading.Event):
+    def run(job):
+        while not release.wait(0.01):
+            job.check_cancelled()
+        return "done"
+    return run
+
+
+def test_job_runs_and_reports_progress():
+    jobs = JobQueue(workers=1, max_queued=4)
+
+    def build(job, pages):
+        for page in range(1, pages + 1):
+            job.progress("convert", page, pages)
+        return {"pages": pages}
+
+    job = jobs.submit("ingest", build, 3)
+    wait_for(lambda: job.status == "succeeded")
+    snapshot = job.snapshot()
+    assert snapshot["result"] == {"pages": 3}
+    assert snapshot["stages"]["convert"]["done"] == 3
+    assert snapshot["eta_seconds"] is None
+
+
+def test_failed_job_keeps_its_error():
+    jobs = JobQueue(workers=1, max_queued=4)
+
+    def fail(job):
+        raise ValueError("bad pdf")
+
+    job = jobs.submit("ingest", fail)
+    wait_for(lambda: job.finished is not None)
+    assert job.status == "failed"
+    assert job.error == "bad pdf"
+
+
+def test_full_queue_rejects_submissions():
+    release = threading.Event()
+    jobs = JobQueue(workers=1, max_queued=1)
+    running = jobs.submit("ingest", blocking_job(release))
+    wait_for(lambda: running.status == "running")
+    jobs.submit("ingest", blocking_job(release))
+    with pytest.raises(JobQueueFull):
+        jobs.submit("ingest", blocking_job(release))
+    release.set()
+
+
+def test_running_job_stops_at_its_next_check():
+    release = threading.Event()
+    jobs = JobQueue(workers=1, max_queued=4)
+    job = jobs.submit("ingest", blocking_job(release))
+    wait_for(lambda: job.status == "running")
+
+    assert jobs.cancel(job.id)
+    wait_for(lambda: job.finished is not None)
+    assert job.status == "cancelled"
+    assert not jobs.cancel(job.id)
+
+
+def test_cancelled_queued_job_releases_its_reservations(tmp_path):
+    registry = IngestRegistry(str(tmp_path))
+    release = threading.Event()
+    jobs = JobQueue(workers=1, max_queued=4)
+    running = jobs.submit("ingest", blocking_job(release))
+    wait_for(lambda: running.status == "running")
+
+    assert registry.reserve("abc", "report.pdf")
+    ran = []
+
+    def discard(hashes):
+        for sha256 in hashes:
+            registry.release(sha256)
+
+    queued = jobs.submit("ingest", lambda job, hashes: ran.append(hashes), ["abc"], on_cancel=discard)
+    assert jobs.cancel(queued.id)
+    assert queued.status == "cancelled"
+    assert registry.lookup("abc") is None
+    assert registry.reserve("abc", "report.pdf")
+
+    # The worker skips the cancelled job instead of running it
+    release.set()
+    wait_for(lambda: running.status == "succeeded")
+    time.sleep(0.05)
+    assert ran == []
+
+
+def test_cancel_cleanup_errors_do_not_escape():
+    release = threading.Event()
+    jobs = JobQueue(workers=1, max_queued=4)
+    jobs.submit("ingest", blocking_job(release))
+
+    def broken_cleanup():
+        raise OSError("file already gone")
+
+    queued = jobs.submit("ingest", lambda job: None, on_cancel=broken_cleanup)
+    assert jobs.cancel(queued.id)
+    assert queued.status == "cancelled"
+    release.set()
@@ -0,0 +1,118 @@
+import time
+
+import pytest
+
+import llm_scheduler
+from llm_scheduler import LLMScheduler, SchedulerSaturated, PRIORITY_INGESTION, PRIORITY_INTERACTIVE
+
+
+def test_interactive_is_admitted_before_earlier_ingestion():
+    scheduler = LLMScheduler(max_inflight=1, max_queue=10)
+    running = scheduler.enqueue(PRIORITY_INTERACTIVE)
+    ingestion = scheduler.enqueue(PRIORITY_INGESTION)
+    interactive = scheduler.enqueue(PRIORITY_INTERACTIVE)
+    assert running.wait(timeout=0)
+    assert interactive.position() == 1
+    assert ingestion.position() == 2
+
+    running.release()
+    assert interactive.wait(timeout=0)
+    assert not ingestion.wait(timeout=0)
+    interactive.release()
+    assert ingestion.wait(timeout=0)
+
+
+def test_aged_ingestion_is_served_in_arrival_order():
+    scheduler = LLMScheduler(max_inflight=1, max_queue=10)
+    running = scheduler.enqueue(PRIORITY_INTERACTIVE)
+    ingestion = scheduler.enqueue(PRIORITY_INGESTION)
+    interactive = scheduler.enqueue(PRIORITY_INTERACTIVE)
+    ingestion.enqueued_at -= llm_scheduler.aging_seconds + 1
+
+    running.release()
+    assert ingestion.wait(timeout=0)
+    assert not interactive.wait(timeout=0)
+
+
+def test_full_queue_rejects_new_calls():
+    scheduler = LLMScheduler(max_inflight=1, max_queue=2)
+    tickets = [scheduler.enqueue() for _ in range(3)]
+    assert scheduler.is_saturated()
+    with pytest.raises(SchedulerSaturated) as raised:
+        scheduler.enqueue()
+    assert raised.value.queued == 2
+    assert scheduler.metrics()["rejected_total"] == 1
+
+    # A queued call giving up frees its place
+    tickets[2].release()
+    scheduler.enqueue()
+    assert scheduler.metrics()["abandoned_total"] == 1
+
+
+def test_capacity_check_rejects_like_enqueue():
+    scheduler = LLMScheduler(max_inflight=1, max_queue=1)
+    scheduler.check_capacity()
+    scheduler.enqueue()
+    scheduler.enqueue()
+    with pytest.raises(SchedulerSaturated):
+        scheduler.check_capacity()
+    assert scheduler.metrics()["rejected_total"] == 1
+
+
+def test_slot_releases_on_error():
+    scheduler = LLMScheduler(max_inflight=1, max_queue=1)
+    with pytest.raises(ValueError):
+        with scheduler.slot():
+            raise ValueError("call failed")
+    assert scheduler.metrics()["inflight"] == 0
+
+
+def test_other_model_waits_until_running_model_drains(monkeypatch):
+    monkeypatch.setattr(llm_scheduler, "max_loaded_models", 1)
+    scheduler = LLMScheduler(max_inflight=2, max_queue=10)
+    llama = scheduler.enqueue(model="llama")
+    gemma = scheduler.enqueue(model="gemma")
+    assert llama.wait(timeout=0)
+    assert not gemma.wait(timeout=0)
+    assert scheduler.metrics()["resident_models"] == ["llama"]
+
+    llama.release()
+    assert gemma.wait(timeout=0)
+    assert scheduler.metrics()["resident_models"] == ["gemma"]
+
+
+def test_resident_model_skips_ahead_until_the_limit(monkeypatch):
+    monkeypatch.setattr(llm_scheduler, "max_loaded_models", 1)
+    monkeypatch.setattr(llm_scheduler, "max_affinity_skips", 2)
+    scheduler = LLMScheduler(max_inflight=1, max_queue=10)
+    running = scheduler.enqueue(model="llama")
+    gemma = scheduler.enqueue(model="gemma")
+    later = [scheduler.enqueue(model="llama") for _ in range(3)]
+
+    running.release()
+    for ticket in later[:2]:
+        assert ticket.wait(timeout=0)
+        ticket.release()
+    # Bypassed twice, nothing else goes ahead of it
+    assert gemma.skips == 2
+    assert gemma.wait(timeout=0)
+    assert not later[2].wait(timeout=0)
+
+
+def test_record_load_counts_only_real_loads():
+    scheduler = LLMScheduler(max_inflight=1, max_queue=1)
+    with scheduler.slot(model="llama") as ticket:
+        ticket.record_load(0.01)
+        ticket.record_load(None)
+        ticket.record_load(llm_scheduler.model_load_threshold + 1)
+    assert scheduler.metrics()["model_loads"] == {"llama": 1}
+
+
+def test_queue_wait_is_recorded():
+    scheduler = LLMScheduler(max_inflight=1, max_queue=1)
+    running = scheduler.enqueue()
+    waiting = scheduler.enqueue()
+    time.sleep(0.05)
+    running.release()
+    assert waiting.wait(timeout=1)
+    assert scheduler.metrics()["queue_wait_seconds_max"] >= 0.05
@@ -0,0 +1,22 @@
+from langchain_core.documents import Document
+
+from prompt_layout import documents_text, format_history, layout_inputs, shared_context_prefix, shared_instructions
+
+
+def test_documents_keep_retriever_order():
+    docs = [Document(page_content="best match", metadata={"file_name": "z.md"}),
+            Document(page_content="second", metadata={"file_name": "a.md"})]
+    assert documents_text(docs) == "best match\n\nsecond"
+
+
+def test_fixed_instructions_come_before_per_request_text():
+    rendered = shared_context_prefix.format(conversation_history="User: hi", document="chunk")
+    assert rendered.startswith(shared_instructions)
+    assert rendered.index("User: hi") < rendered.index("chunk")
+
+
+def test_history_renders_summary_and_turns():
+    history = [("", "talked about pumps"), ("what pressure?", "40 bar")]
+    assert format_history(history) == ("Summary of the earlier conversation: talked about pumps\n\n"
+                                       "User: what pressure?\nAssistant: 40 bar")
+    assert layout_inputs({"conversation_history": []})["conversation_history"] == "None"
@@ -0,0 +1,95 @@
+import asyncio
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend"))
+main = pytest.importorskip("main", exc_type=ImportError)
+
+from llm_scheduler import LLMScheduler
+
+
+class FakeRetriever:
+    def get_relevant_documents(self, question):
+        return []
+
+
+class FakeRequest:
+    def __init__(self, disconnected: bool = False):
+        self.disconnected = disconnected
+
+    async def is_disconnected(self):
+        return self.disconnected
+
+
+@pytest.fixture
+def scheduler(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    os.makedirs(main.faiss_db_path)
+    scheduler = LLMScheduler(max_inflight=1, max_queue=4)
+    monkeypatch.setattr(main, "llm_scheduler", scheduler)
+    monkeypatch.setattr(main, "create_retriever", lambda *args: FakeRetriever())
+    monkeypatch.setattr(main, "sse_heartbeat_seconds", 0.05)
+    monkeypatch.setitem(main.stream_metrics, "client_disconnects_total", 0)
+    monkeypatch.setitem(main.stream_metrics, "cancelled_generations_total", 0)
+    # Holds the only slot, so the question under test stays queued
+    blocker = scheduler.enqueue()
+    yield scheduler
+    blocker.release()
+
+
+def wait_for(condition, timeout: float = 5.0):
+    deadline = time.time() + timeout
+    while not condition():
+        if time.time() > deadline:
+            raise AssertionError("condition not reached")
+        time.sleep(0.01)
+
+
+async def open_stream(question: str, request: FakeRequest):
+    response = await main.qa_chat_stream(main.ChatMessage(content=question), request)
+    return response.body_iterator
+
+
+def test_closed_stream_counts_disconnect_and_cancels_queued_generation(scheduler):
+    async def run():
+        body = await open_stream("closed while queued", FakeRequest())
+        assert "heartbeat" in await body.__anext__()
+        await body.aclose()
+
+    asyncio.run(run())
+    assert main.stream_metrics["client_disconnects_total"] == 1
+    # The producer notices the cancelled flight at its next queue check
+    wait_for(lambda: main.stream_metrics["cancelled_generations_total"] == 1)
+    assert scheduler.metrics()["abandoned_total"] == 1
+
+
+def test_cancelled_response_task_counts_disconnect(scheduler):
+    async def run():
+        body = await open_stream("cancelled while waiting", FakeRequest())
+
+        async def consume():
+            async for _ in body:
+                pass
+
+        task = asyncio.ensure_future(consume())
+        await asyncio.sleep(0.2)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(run())
+    assert main.stream_metrics["client_disconnects_total"] == 1
+    wait_for(lambda: main.stream_metrics["cancelled_generations_total"] == 1)
+
+
+def test_polled_disconnect_is_counted_once(scheduler):
+    async def run():
+        body = await open_stream("gone before the first event", FakeRequest(disconnected=True))
+        assert [event async for event in body] == []
+
+    asyncio.run(run())
+    assert main.stream_metrics["client_disconnects_total"] == 1
+    wait_for(lambda: main.stream_metrics["cancelled_generations_total"] == 1)
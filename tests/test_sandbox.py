@@ -0,0 +1,34 @@
+from collections import Counter
+from multiprocessing import resource_tracker
+
+import pandas as pd
+import pytest
+
+pytest.importorskip("pyarrow")
+
+import sandbox
+
+
+def test_shared_memory_result_is_tracked_once(monkeypatch):
+    registered = Counter()
+
+    def register(name, rtype):
+        if rtype == "shared_memory":
+            registered[name] += 1
+
+    def unregister(name, rtype):
+        if rtype == "shared_memory":
+            registered[name] -= 1
+
+    monkeypatch.setattr(resource_tracker, "register", register)
+    monkeypatch.setattr(resource_tracker, "unregister", unregister)
+    monkeypatch.setattr(sandbox, "shared_memory_threshold", 0)
+
+    frame = pd.DataFrame({"a": range(1000), "b": [str(i) for i in range(1000)]})
+    encoded = sandbox._encode_result(frame)
+    assert encoded["kind"] == "shm"
+
+    # Worker and parent share one tracker; after the handoff and the parent's unlink nothing is left for it
+    decoded = sandbox._decode_result(encoded)
+    pd.testing.assert_frame_equal(decoded, frame)
+    assert all(count == 0 for count in registered.values())
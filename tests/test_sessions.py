@@ -0,0 +1,78 @@
+import time
+
+import sessions
+from sessions import Session, SessionStore, estimate_tokens
+
+
+def test_compacted_history_keeps_newest_turns_within_budget():
+    session = Session("s")
+    session.turns = [(f"question {i}", "a" * 400) for i in range(5)]
+    history = session.compacted_history(token_budget=250)
+    assert history == session.turns[-2:]
+
+
+def test_compacted_history_always_keeps_the_last_turn():
+    session = Session("s")
+    session.turns = [("q", "a" * 4000)]
+    assert session.compacted_history(token_budget=10) == session.turns
+
+
+def test_summary_replaces_summarized_turns():
+    session = Session("s")
+    session.turns = [(f"q{i}", f"a{i}") for i in range(5)]
+    session.summary = "earlier talk about pumps"
+    session.summarized_upto = 3
+    history = session.compacted_history(token_budget=1000)
+    assert history == [("", "earlier talk about pumps"), ("q3", "a3"), ("q4", "a4")]
+
+
+def test_ollama_context_is_reused_only_for_the_stored_turns():
+    session = Session("s")
+    session.turns = [("q", "a")]
+    session.store_context(1, [1, 2, 3])
+    assert session.reusable_context(max_tokens=10) == [1, 2, 3]
+    assert session.reusable_context(max_tokens=2) is None
+    session.turns.append(("q2", "a2"))
+    assert session.reusable_context(max_tokens=10) is None
+
+
+def test_record_turn_below_the_window_does_not_compact(monkeypatch):
+    monkeypatch.setattr(sessions, "recent_turns", 3)
+    store = SessionStore()
+    session = store.create()
+    for i in range(3):
+        store.record_turn(session, f"q{i}", f"a{i}")
+    assert not session.compacting
+    assert session.stats()["turns"] == 3
+
+
+def test_store_expires_idle_sessions(monkeypatch):
+    monkeypatch.setattr(sessions, "session_ttl_seconds", 60)
+    store = SessionStore()
+    idle = store.create()
+    idle.updated_at = time.time() - 120
+    active = store.create()
+    assert store.get(idle.id) is None
+    assert store.get(active.id) is active
+
+
+def test_store_caps_the_number_of_sessions(monkeypatch):
+    monkeypatch.setattr(sessions, "max_sessions", 2)
+    store = SessionStore()
+    oldest = store.create()
+    oldest.updated_at -= 10
+    store.create()
+    store.create()
+    assert store.get(oldest.id) is None
+
+
+def test_delete_reports_unknown_sessions():
+    store = SessionStore()
+    session = store.create()
+    assert store.delete(session.id)
+    assert not store.delete(session.id)
+
+
+def test_estimate_tokens_is_about_four_characters_per_token():
+    assert estimate_tokens("") == 1
+    assert estimate_tokens("a" * 400) == 101
@@ -0,0 +1,125 @@
+import threading
+import time
+
+import pytest
+
+from single_flight import SingleFlight, flight_key
+
+
+def wait_for(condition, timeout: float = 2.0):
+    deadline = time.time() + timeout
+    while not condition():
+        if time.time() > deadline:
+            raise AssertionError("condition not reached")
+        time.sleep(0.001)
+
+
+def test_key_ignores_case_whitespace_and_punctuation():
+    assert flight_key("What is  RAG?", [], "v1") == flight_key("what is rag", [], "v1")
+    assert flight_key("what is rag", [], "v1") != flight_key("what is rag", [], "v2")
+    assert flight_key("what is rag", [("q", "a")], "v1") != flight_key("what is rag", [], "v1")
+
+
+def test_duplicates_share_one_computation():
+    group = SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        release.wait(2)
+        return "answer"
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(group.run("k", compute))) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    wait_for(lambda: group.metrics["coalesced_total"] == 2)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert sorted(shared for _, shared in results) == [False, True, True]
+    assert all(result == "answer" for result, _ in results)
+    assert group.inflight() == 0
+
+
+def test_leader_failure_reaches_followers():
+    group = SingleFlight()
+    release = threading.Event()
+
+    def compute():
+        release.wait(2)
+        raise RuntimeError("retriever down")
+
+    errors = []
+
+    def call():
+        try:
+            group.run("k", compute)
+        except RuntimeError as e:
+            errors.append(str(e))
+
+    threads = [threading.Thread(target=call) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    wait_for(lambda: group.metrics["coalesced_total"] == 2)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert errors == ["retriever down"] * 3
+    # The failed flight is forgotten, the next call computes again
+    assert group.run("k", lambda: "recovered") == ("recovered", False)
+
+
+def test_stream_failure_reaches_subscribers():
+    group = SingleFlight()
+    flight, is_leader = group.join("k", attach=True)
+    assert is_leader
+
+    def produce(flight):
+        flight.publish({"type": "token", "content": "partial"})
+        raise RuntimeError("model crashed")
+
+    flight.start(produce)
+    events = list(flight.subscribe())
+    assert events == [{"type": "token", "content": "partial"}]
+    with pytest.raises(RuntimeError, match="model crashed"):
+        flight.wait_result()
+    flight.detach()
+
+
+def test_follower_leaving_does_not_cancel_the_flight():
+    group = SingleFlight()
+    flight, _ = group.join("k", attach=True)
+    follower, is_leader = group.join("k", attach=True)
+    assert follower is flight and not is_leader
+
+    follower.detach()
+    assert not flight.cancelled
+    assert group.inflight() == 1
+
+
+def test_last_subscriber_leaving_cancels_the_flight():
+    group = SingleFlight()
+    flight, _ = group.join("k", attach=True)
+    group.join("k", attach=True)
+    flight.detach()
+    flight.detach()
+
+    assert flight.cancelled
+    assert group.metrics["cancelled_total"] == 1
+    # A later request starts fresh instead of joining the cancelled flight
+    fresh, is_leader = group.join("k")
+    assert is_leader and fresh is not flight
+
+
+def test_finished_flight_is_not_cancelled():
+    group = SingleFlight()
+    flight, _ = group.join("k", attach=True)
+    flight.finish(result="done")
+    flight.detach()
+    assert not flight.cancelled
+    assert group.metrics["cancelled_total"] == 0
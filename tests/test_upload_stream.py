@@ -0,0 +1,106 @@
+import asyncio
+import hashlib
+import os
+
+import pytest
+
+from upload_stream import MultipartUploadReceiver, UploadRejected
+
+boundary = "----ragchatbotboundary"
+content_type = f"multipart/form-data; boundary={boundary}"
+
+
+def multipart_body(parts: list) -> bytes:
+    body = b""
+    for name, file_name, data in parts:
+        disposition = f'form-data; name="{name}"'
+        if file_name is not None:
+            disposition += f'; filename="{file_name}"'
+        body += (f"--{boundary}\r\nContent-Disposition: {disposition}\r\n"
+                 f"Content-Type: application/pdf\r\n\r\n").encode() + data + b"\r\n"
+    return body + f"--{boundary}--\r\n".encode()
+
+
+async def chunked(body: bytes, size: int):
+    for start in range(0, len(body), size):
+        yield body[start:start + size]
+
+
+def receive(tmp_path, body: bytes, chunk_size: int, **kwargs) -> tuple:
+    receiver = MultipartUploadReceiver(content_type, str(tmp_path), **kwargs)
+    return receiver, asyncio.run(receiver.receive(chunked(body, chunk_size)))
+
+
+# 1 and 7 split the boundary and headers; 64 KiB hands the parser the whole body at once
+@pytest.mark.parametrize("chunk_size", [1, 7, 13, 4096, 65536])
+def test_files_survive_any_chunk_boundary(tmp_path, chunk_size):
+    first = os.urandom(5000) + f"\r\n--{boundary[:-3]}".encode() + os.urandom(100)
+    second = b"%PDF-1.4 small"
+    body = multipart_body([("files", "a.pdf", first), ("note", None, b"ignored"), ("files", "b.pdf", second)])
+
+    _, files = receive(tmp_path, body, chunk_size)
+
+    assert [f.file_name for f in files] == ["a.pdf", "b.pdf"]
+    for streamed, data in zip(files, (first, second)):
+        with open(streamed.tmp_path, "rb") as f:
+            assert f.read() == data
+        assert streamed.size == len(data)
+        assert streamed.sha256 == hashlib.sha256(data).hexdigest()
+
+
+def test_non_pdf_is_rejected_and_partial_files_removed(tmp_path):
+    body = multipart_body([("files", "a.pdf", b"%PDF ok"), ("files", "evil.exe", b"MZ")])
+    receiver = MultipartUploadReceiver(content_type, str(tmp_path))
+    with pytest.raises(UploadRejected) as raised:
+        asyncio.run(receiver.receive(chunked(body, 16)))
+    assert raised.value.status_code == 400
+    assert os.listdir(tmp_path) == []
+
+
+def test_oversized_file_is_rejected_while_streaming(tmp_path):
+    body = multipart_body([("files", "big.pdf", b"x" * 10000)])
+    receiver = MultipartUploadReceiver(content_type, str(tmp_path), max_bytes=1024)
+    with pytest.raises(UploadRejected) as raised:
+        asyncio.run(receiver.receive(chunked(body, 512)))
+    assert raised.value.status_code == 413
+    assert os.listdir(tmp_path) == []
+
+
+def test_non_multipart_request_is_rejected(tmp_path):
+    with pytest.raises(UploadRejected) as raised:
+        MultipartUploadReceiver("application/json", str(tmp_path))
+    assert raised.value.status_code == 400
+
+
+def test_file_names_cannot_escape_the_upload_dir(tmp_path):
+    body = multipart_body([("files", "../../etc/report.pdf", b"%PDF")])
+    _, files = receive(tmp_path, body, 32)
+    assert files[0].file_name == "report.pdf"
+    assert os.path.dirname(files[0].tmp_path) == str(tmp_path)
+
+
+def test_request_over_the_total_limit_is_rejected(tmp_path):
+    # Each file is under the per-file limit, together they are not
+    body = multipart_body([("files", f"{i}.pdf", b"x" * 800) for i in range(4)])
+    receiver = MultipartUploadReceiver(content_type, str(tmp_path), max_bytes=1024, max_total_bytes=2048)
+    with pytest.raises(UploadRejected) as raised:
+        asyncio.run(receiver.receive(chunked(body, 256)))
+    assert raised.value.status_code == 413
+    assert os.listdir(tmp_path) == []
+
+
+def test_form_fields_count_toward_the_total_limit(tmp_path):
+    body = multipart_body([("note", None, b"y" * 5000), ("files", "a.pdf", b"%PDF")])
+    receiver = MultipartUploadReceiver(content_type, str(tmp_path), max_total_bytes=2048)
+    with pytest.raises(UploadRejected) as raised:
+        asyncio.run(receiver.receive(chunked(body, 256)))
+    assert raised.value.status_code == 413
+
+
+def test_too_many_files_are_rejected(tmp_path):
+    body = multipart_body([("files", f"{i}.pdf", b"%PDF") for i in range(3)])
+    receiver = MultipartUploadReceiver(content_type, str(tmp_path), max_files=2)
+    with pytest.raises(UploadRejected) as raised:
+        asyncio.run(receiver.receive(chunked(body, 64)))
+    assert raised.value.status_code == 413
+    assert os.listdir(tmp_path) == []